@@ -0,0 +1,222 @@
+"""
+Admission control in front of both ingest paths (HTTP and MQTT).
+
+- Token bucket per device (INGEST_DEVICE_RATE / INGEST_DEVICE_BURST) and,
+  for HTTP, per API key (INGEST_KEY_RATE / INGEST_KEY_BURST).
+- Over-limit readings follow INGEST_OVERFLOW_POLICY:
+    drop        discard
+    coalesce    keep only the newest over-limit reading per device and
+                store it as soon as the device has a token again
+    downsample  store 1 of every INGEST_DOWNSAMPLE_KEEP_EVERY
+- Load shedding: while the writer queue is INGEST_SHED_QUEUE_RATIO full,
+  normal readings are shed; alert / WARN / HIGH readings still pass.
+
+Every decision is counted (`admission.stats()`).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Optional
+
+from .config import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("drop", "coalesce", "downsample")
+
+ACCEPT = "accepted"
+RATE_DROPPED = "rate_dropped"
+KEY_LIMITED = "key_limited"
+COALESCED = "coalesced"
+DOWNSAMPLED_KEPT = "downsampled_kept"
+DOWNSAMPLED_DROPPED = "downsampled_dropped"
+SHED = "shed"
+
+ADMITTED = (ACCEPT, DOWNSAMPLED_KEPT)
+
+_IDLE_PRUNE_SECONDS = 600
+_PRUNE_EVERY_SECONDS = 60
+_DROPPED_KEEP = 1000   # devices kept in dropped_by_device (the ones that lost most)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "over")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.over = 0      # over-limit readings seen (downsample counter)
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        device_rate: float,
+        device_burst: int,
+        key_rate: float,
+        key_burst: int,
+        policy: str,
+        keep_every: int,
+        shed_ratio: float,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"INGEST_OVERFLOW_POLICY must be one of {POLICIES}, got {policy!r}")
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.policy = policy
+        self.keep_every = max(1, keep_every)
+        self.shed_ratio = shed_ratio
+
+        self._devices: dict[str, TokenBucket] = {}
+        self._keys: dict[str, TokenBucket] = {}
+        # coalesce: device -> (newest item, async emit)
+        self._pending: dict[str, tuple[Any, Callable[[Any], Awaitable[None]]]] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.counters: Counter = Counter()          # (path, decision) -> n
+        self.dropped_by_device: Counter = Counter() # device -> readings not stored
+
+    # ---------- decisions ----------
+
+    def _bucket(self, table: dict, key: str, rate: float, burst: int, now: float) -> TokenBucket:
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = TokenBucket(rate, burst, now)
+        return bucket
+
+    def admit(
+        self,
+        path: str,
+        device_id: str,
+        item: Any = None,
+        emit: Optional[Callable[[Any], Awaitable[None]]] = None,
+        api_key: Optional[str] = None,
+    ) -> str:
+        """
+        Decide for one reading. `item`/`emit` are only needed for the
+        coalesce policy: the held item is later passed to `await emit(item)`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if api_key is not None and self.key_rate > 0:
+                if not self._bucket(self._keys, api_key, self.key_rate, self.key_burst, now).take(now):
+                    return self._count(path, device_id, KEY_LIMITED)
+            if self.device_rate <= 0:
+                return self._count(path, device_id, ACCEPT)
+
+            bucket = self._bucket(self._devices, device_id, self.device_rate, self.device_burst, now)
+            if device_id not in self._pending and bucket.take(now):
+                return self._count(path, device_id, ACCEPT)
+
+            if self.policy == "coalesce" and emit is not None:
+                if device_id in self._pending:
+                    self.dropped_by_device[device_id] += 1  # the older held reading is replaced
+                self._pending[device_id] = (item, emit)
+                return self._count(path, device_id, COALESCED)
+            if self.policy == "downsample":
+                bucket.over += 1
+                if bucket.over % self.keep_every == 0:
+                    return self._count(path, device_id, DOWNSAMPLED_KEPT)
+                return self._count(path, device_id, DOWNSAMPLED_DROPPED)
+            return self._count(path, device_id, RATE_DROPPED)
+
+    def should_shed(self, depth: int, capacity: int, priority: bool = False) -> bool:
+        """Writer protection: shed normal readings while the queue is nearly full"""
+        return not priority and capacity > 0 and depth >= capacity * self.shed_ratio
+
+    def shed(self, path: str, device_id: str) -> None:
+        with self._lock:
+            self._count(path, device_id, SHED)
+
+    def _count(self, path: str, device_id: str, decision: str) -> str:
+        self.counters[(path, decision)] += 1
+        if decision not in ADMITTED and decision != COALESCED:
+            self.dropped_by_device[device_id] += 1
+        return decision
+
+    # ---------- coalesce flusher / pruning ----------
+
+    def start_flusher(self, interval_seconds: float = 0.1) -> asyncio.Task:
+        """Idempotent; every policy needs it to prune idle buckets, coalesce also to store held readings"""
+        if self._flusher is None or self._flusher.done():
+            if self.policy != "coalesce":
+                interval_seconds = _PRUNE_EVERY_SECONDS
+            self._flusher = asyncio.create_task(self._run_flusher(interval_seconds))
+        return self._flusher
+
+    async def _run_flusher(self, interval_seconds: float) -> None:
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(interval_seconds)
+            now = time.monotonic()
+            ready = []
+            with self._lock:
+                for device_id in list(self._pending):
+                    if self._devices[device_id].take(now):
+                        ready.append(self._pending.pop(device_id))
+                if now - last_prune >= _PRUNE_EVERY_SECONDS:
+                    self._prune(now)
+                    last_prune = now
+            for item, emit in ready:
+                try:
+                    await emit(item)
+                except Exception as e:
+                    logger.error(f"❌ Coalesced reading not stored: {e}")
+
+    def _prune(self, now: float) -> None:
+        for table in (self._devices, self._keys):
+            idle = [k for k, b in table.items() if now - b.updated > _IDLE_PRUNE_SECONDS and k not in self._pending]
+            for k in idle:
+                del table[k]
+        if len(self.dropped_by_device) > _DROPPED_KEEP:
+            self.dropped_by_device = Counter(dict(self.dropped_by_device.most_common(_DROPPED_KEEP)))
+
+    # ---------- reporting ----------
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_path: dict[str, dict[str, int]] = {}
+            for (path, decision), n in self.counters.items():
+                by_path.setdefault(path, {})[decision] = n
+            return {
+                "policy": self.policy,
+                "device_rate": self.device_rate,
+                "device_burst": self.device_burst,
+                "key_rate": self.key_rate,
+                "decisions": by_path,
+                "pending_coalesced": len(self._pending),
+                "tracked_devices": len(self._devices),
+                "top_dropped_devices": dict(self.dropped_by_device.most_common(10)),
+            }
+
+
+admission = AdmissionController(
+    device_rate=settings.INGEST_DEVICE_RATE,
+    device_burst=settings.INGEST_DEVICE_BURST,
+    key_rate=settings.INGEST_KEY_RATE,
+    key_burst=settings.INGEST_KEY_BURST,
+    policy=settings.INGEST_OVERFLOW_POLICY,
+    keep_every=settings.INGEST_DOWNSAMPLE_KEEP_EVERY,
+    shed_ratio=settings.INGEST_SHED_QUEUE_RATIO,
+)
+
+registry.counter("aq_admission_decisions_total", "Ingest admission decisions", ("path", "decision"),
+                 fn=lambda: list(admission.counters.items()))
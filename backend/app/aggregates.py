@@ -0,0 +1,344 @@
+"""
+Time-bucketed aggregation queries.
+
+Everything is pushed down to SQLite as a single GROUP BY (or a window
+query for p95), so only one row per (group, bucket) leaves the database.
+Hour-aligned queries with 1h or coarser buckets for avg/max of eco2/tvoc
+and alert_count read `hourly_rollups` instead of the raw readings when the
+rollup job has folded every reading in the range.
+Results are cached per query and heavy queries run on a dedicated worker
+pool so they never compete with the ingest path.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import Integer, cast, func, literal_column, null, select, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .crud import _sqlite_ts
+from .database import SessionLocal
+from .models import Device, HourlyRollup, JobCursor, Measurement
+
+
+# =========================================================
+# QUERY VOCABULARY
+# =========================================================
+
+METRICS = {
+    "eco2_ppm": Measurement.eco2_ppm,
+    "tvoc_ppb": Measurement.tvoc_ppb,
+    "temp_c": Measurement.temp_c,
+    "hum_rh": Measurement.hum_rh,
+    "pressure_hpa": Measurement.pressure_hpa,
+    "aq_score": Measurement.aq_score,
+}
+
+BUCKETS = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "6h": 21600,
+    "1d": 86400,
+}
+
+GROUP_BY = ("device", "district", "city")
+AGGREGATES = ("avg", "min", "max", "p95", "alert_count")
+
+# (agg, metric) -> value over hourly_rollups; alert_count works for any metric
+ROLLUP_VALUES = {
+    ("avg", "eco2_ppm"): lambda: func.sum(HourlyRollup.eco2_sum) / func.sum(HourlyRollup.eco2_n),
+    ("avg", "tvoc_ppb"): lambda: func.sum(HourlyRollup.tvoc_sum) / func.sum(HourlyRollup.tvoc_n),
+    ("max", "eco2_ppm"): lambda: func.max(HourlyRollup.eco2_max),
+    ("max", "tvoc_ppb"): lambda: func.max(HourlyRollup.tvoc_max),
+}
+
+
+@dataclass(frozen=True)
+class AggregateQuery:
+    metric: str
+    bucket: str
+    group_by: str
+    agg: str
+    start: datetime
+    end: datetime
+    city: Optional[str] = None
+    district: Optional[str] = None
+    device_id: Optional[str] = None
+
+
+@dataclass
+class AggregateRow:
+    group: str
+    city: Optional[str]
+    bucket_start: datetime
+    value: Optional[float]
+    samples: int
+
+
+# =========================================================
+# SQL BUILDING
+# =========================================================
+
+def _bucket_expr(bucket_seconds: int, ts=Measurement.ts):
+    """Unix-epoch bucket start, computed inside SQLite"""
+    epoch = cast(func.strftime("%s", ts), Integer)
+    step = literal_column(str(int(bucket_seconds)))
+    return (epoch // step) * step
+
+
+def _group_columns(group_by: str, device_col=Measurement.device_id):
+    """(group label column, city column or None)"""
+    if group_by == "device":
+        return device_col, None
+    if group_by == "district":
+        return Device.district, Device.city
+    return Device.city, Device.city
+
+
+def _filtered(stmt, q: AggregateQuery, source=Measurement):
+    if q.group_by != "device" or q.city or q.district:
+        stmt = stmt.join(Device, Device.device_id == source.device_id)
+    if source is HourlyRollup:
+        # Hour h holds readings in [h, h + 1h); rollups_cover() rules out one at exactly `end`
+        stmt = stmt.where(HourlyRollup.hour >= q.start).where(HourlyRollup.hour < q.end)
+    else:
+        stmt = stmt.where(Measurement.ts >= q.start).where(Measurement.ts <= q.end)
+    if q.device_id:
+        stmt = stmt.where(source.device_id == q.device_id)
+    if q.city:
+        stmt = stmt.where(Device.city == q.city)
+    if q.district:
+        stmt = stmt.where(Device.district == q.district)
+    return stmt
+
+
+def build_statement(q: AggregateQuery):
+    """Build the GROUP BY statement; columns are (group, city, bucket, value, samples)"""
+    bucket = _bucket_expr(BUCKETS[q.bucket]).label("bucket")
+    group_col, city_col = _group_columns(q.group_by)
+    group_label = group_col.label("grp")
+    city_label = (city_col if city_col is not None else null()).label("city")
+    metric = METRICS[q.metric]
+
+    if q.agg == "p95":
+        # Nearest-rank p95 via window functions: rank = n - floor(n / 20)
+        partition = [group_col, bucket] if city_col is None else [group_col, city_col, bucket]
+        ranked = _filtered(
+            select(
+                group_label,
+                city_label,
+                bucket,
+                metric.label("value"),
+                func.row_number().over(partition_by=partition, order_by=metric).label("rn"),
+                func.count().over(partition_by=partition).label("n"),
+            ),
+            q,
+        ).where(metric.is_not(None)).subquery()
+        return (
+            select(ranked.c.grp, ranked.c.city, ranked.c.bucket, ranked.c.value, ranked.c.n)
+            .where(ranked.c.rn == ranked.c.n - ranked.c.n // 20)
+            .order_by(ranked.c.grp, ranked.c.bucket)
+        )
+
+    if q.agg == "alert_count":
+        value = func.sum(cast(Measurement.alert, Integer))
+    else:
+        value = {"avg": func.avg, "min": func.min, "max": func.max}[q.agg](metric)
+
+    group_cols = [group_col, bucket] if city_col is None else [group_col, city_col, bucket]
+    return (
+        _filtered(
+            select(group_label, city_label, bucket, value.label("value"), func.count().label("samples")),
+            q,
+        )
+        .group_by(*group_cols)
+        .order_by(group_col, bucket)
+    )
+
+
+def _hour_aligned(ts: datetime) -> bool:
+    return ts.minute == 0 and ts.second == 0 and ts.microsecond == 0
+
+
+def rollups_cover(db: Session, q: AggregateQuery) -> bool:
+    """True when hourly_rollups give the same answer as the raw readings for `q`"""
+    if not settings.AGG_USE_ROLLUPS:
+        return False
+    if q.agg != "alert_count" and (q.agg, q.metric) not in ROLLUP_VALUES:
+        return False
+    if BUCKETS[q.bucket] % 3600 or not (_hour_aligned(q.start) and _hour_aligned(q.end)):
+        return False
+    folded = db.execute(select(JobCursor.position).where(JobCursor.name == "rollup")).scalar() or 0
+    params = {"folded": folded, "start": _sqlite_ts(q.start), "end": _sqlite_ts(q.end)}
+    # Unary + keeps SQLite on the rowid range above the cursor (new rows only) instead of the ts index
+    pending = db.execute(
+        text("SELECT 1 FROM measurements WHERE id > :folded AND +ts >= :start AND +ts <= :end LIMIT 1"), params
+    ).first()
+    if pending is not None:
+        return False
+    return db.execute(text("SELECT 1 FROM measurements WHERE ts = :end LIMIT 1"), params).first() is None
+
+
+def build_rollup_statement(q: AggregateQuery):
+    """build_statement over hourly_rollups; only for queries rollups_cover() accepts"""
+    bucket = _bucket_expr(BUCKETS[q.bucket], HourlyRollup.hour).label("bucket")
+    group_col, city_col = _group_columns(q.group_by, HourlyRollup.device_id)
+    city_label = (city_col if city_col is not None else null()).label("city")
+    if q.agg == "alert_count":
+        value = func.sum(HourlyRollup.alerts)
+    else:
+        value = ROLLUP_VALUES[(q.agg, q.metric)]()
+
+    group_cols = [group_col, bucket] if city_col is None else [group_col, city_col, bucket]
+    return (
+        _filtered(
+            select(group_col.label("grp"), city_label, bucket, value.label("value"),
+                   func.sum(HourlyRollup.samples).label("samples")),
+            q,
+            HourlyRollup,
+        )
+        .group_by(*group_cols)
+        .order_by(group_col, bucket)
+    )
+
+
+def run_aggregate(db: Session, q: AggregateQuery) -> list[AggregateRow]:
+    stmt = build_rollup_statement(q) if rollups_cover(db, q) else build_statement(q)
+    rows = db.execute(stmt).all()
+    return [
+        AggregateRow(
+            group=grp,
+            city=city,
+            bucket_start=datetime.fromtimestamp(bucket, tz=timezone.utc),
+            value=float(value) if value is not None else None,
+            samples=int(samples),
+        )
+        for grp, city, bucket, value, samples in rows
+    ]
+
+
+# =========================================================
+# RESULT CACHE
+# =========================================================
+
+class _ResultCache:
+    """Small LRU + TTL cache keyed on the normalized query"""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._items: OrderedDict[tuple, tuple[float, list[AggregateRow]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[list[AggregateRow]]:
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None:
+                return None
+            stored_at, rows = hit
+            if time.monotonic() - stored_at > self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return rows
+
+    def put(self, key: tuple, rows: list[AggregateRow]) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic(), rows)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+result_cache = _ResultCache(settings.AGG_CACHE_SIZE, settings.AGG_CACHE_TTL_SECONDS)
+
+# Dedicated pool: aggregate scans never take threads from the request pool
+_executor = ThreadPoolExecutor(max_workers=settings.AGG_WORKERS, thread_name_prefix="aggregate")
+
+
+def normalize_query(
+    metric: str,
+    bucket: str,
+    group_by: str,
+    agg: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    city: Optional[str] = None,
+    district: Optional[str] = None,
+    device_id: Optional[str] = None,
+) -> AggregateQuery:
+    """
+    Validate parameters and pin the time range.
+    An open-ended range is aligned to the bucket so consecutive calls share a cache key.
+    Raises ValueError on bad input.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+    if group_by not in GROUP_BY:
+        raise ValueError(f"Unknown group_by: {group_by}")
+    if agg not in AGGREGATES:
+        raise ValueError(f"Unknown agg: {agg}")
+
+    if end is None:
+        step = BUCKETS[bucket]
+        now = int(time.time())
+        end = datetime.fromtimestamp((now // step + 1) * step, tz=timezone.utc)
+    if start is None:
+        start = end - timedelta(days=1)
+    # Stored timestamps are naive UTC
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    if start >= end:
+        raise ValueError("start must be before end")
+    if end - start > timedelta(days=settings.AGG_MAX_RANGE_DAYS):
+        raise ValueError(f"Range is limited to {settings.AGG_MAX_RANGE_DAYS} days")
+
+    return AggregateQuery(
+        metric=metric,
+        bucket=bucket,
+        group_by=group_by,
+        agg=agg,
+        start=start,
+        end=end,
+        city=city,
+        district=district,
+        device_id=device_id,
+    )
+
+
+def _execute(q: AggregateQuery) -> list[AggregateRow]:
+    db = SessionLocal()
+    try:
+        return run_aggregate(db, q)
+    finally:
+        db.close()
+
+
+async def aggregate(q: AggregateQuery) -> tuple[list[AggregateRow], bool]:
+    """Run a query on the aggregate pool; returns (rows, cache_hit)"""
+    key = tuple(vars(q).values())
+    rows = result_cache.get(key)
+    if rows is not None:
+        return rows, True
+    loop = asyncio.get_running_loop()
+    rows = await loop.run_in_executor(_executor, _execute, q)
+    result_cache.put(key, rows)
+    return rows, False
@@ -5,10 +5,11 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import func, select
 
 from .models import Measurement
 from .config import settings
+from .rules import rule_engine
 
 
 # =========================================================
@@ -130,20 +131,13 @@ def compute_baseline(
     start = now_ts - timedelta(seconds=window_seconds)
 
     stmt = (
-        select(Measurement)
+        select(func.avg(Measurement.tvoc_ppb), func.avg(Measurement.eco2_ppm))
         .where(Measurement.device_id == device_id)
         .where(Measurement.ts >= start)
         .where(Measurement.ts <= now_ts)
     )
 
-    rows = db.execute(stmt).scalars().all()
-
-    tvocs = [r.tvoc_ppb for r in rows if r.tvoc_ppb is not None]
-    eco2s = [r.eco2_ppm for r in rows if r.eco2_ppm is not None]
-
-    tvoc_base = (sum(tvocs) / len(tvocs)) if tvocs else None
-    eco2_base = (sum(eco2s) / len(eco2s)) if eco2s else None
-
+    tvoc_base, eco2_base = db.execute(stmt).one()
     return tvoc_base, eco2_base
 
 
@@ -154,17 +148,9 @@ def decide_status(
     """
     Decide OK / WARN / HIGH based on percentage increase.
     We trigger based on whichever increases more.
+    Thresholds are the defaults (Settings); see rules.py for per-device ones.
     """
-    vals = [v for v in (tvoc_pct, eco2_pct) if v is not None]
-    if not vals:
-        return "OK"
-
-    peak = max(vals)
-    if peak >= settings.HIGH_INCREASE_PCT:
-        return "HIGH"
-    if peak >= settings.WARN_INCREASE_PCT:
-        return "WARN"
-    return "OK"
+    return rule_engine.current.default.classify(tvoc_pct, eco2_pct)[0]
 
 
 def compute_score(
@@ -174,16 +160,7 @@ def compute_score(
     """
     Map increase percent to a demo-friendly 0..100 score.
     """
-    vals = [v for v in (tvoc_pct, eco2_pct) if v is not None]
-    if not vals:
-        return 0.0
-
-    peak = max(vals)
-    if settings.HIGH_INCREASE_PCT <= 0:
-        return 0.0
-
-    scaled = (peak / settings.HIGH_INCREASE_PCT) * 80.0
-    return float(min(max(scaled, 0.0), 100.0))
+    return rule_engine.current.default.classify(tvoc_pct, eco2_pct)[1]
 
 
 def evaluate_alert(
@@ -195,20 +172,21 @@ def evaluate_alert(
 ) -> AlertResult:
     """
     PRODUCTION MODE:
-    Baseline + percentage increase based alerting.
+    Baseline + percentage increase based alerting,
+    with the device's compiled rules (window + thresholds).
     """
     if ts.tzinfo is None:
         ts = ts.replace(tzinfo=timezone.utc)
 
+    rules = rule_engine.for_device(device_id)
     tvoc_base, eco2_base = compute_baseline(
-        db, device_id, ts, settings.BASELINE_SECONDS
+        db, device_id, ts, rules.baseline_seconds
     )
 
     tvoc_pct = _pct_increase(tvoc_ppb, tvoc_base)
     eco2_pct = _pct_increase(eco2_ppm, eco2_base)
 
-    status = decide_status(tvoc_pct, eco2_pct)
-    score = compute_score(tvoc_pct, eco2_pct)
+    status, score = rules.classify(tvoc_pct, eco2_pct)
 
     return AlertResult(
         score=score,
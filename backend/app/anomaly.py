@@ -0,0 +1,401 @@
+"""
+Server-side streaming anomaly detection for every stored reading.
+
+The node's TinyML model sets `anom_eco2` / `anom_tvoc` only when it runs;
+HTTP devices never had them. The engine scores each reading right before
+it is written (BatchWriter._write for MQTT, the spool and pool workers;
+crud for HTTP) and ORs its verdict into those two flags. A flag the node
+set stays set; rows it scores and finds normal get False instead of None.
+
+Detectors are pluggable (`register_detector`, ANOMALY_DETECTORS) and keep
+a fixed number of float64 columns per device and metric, so state is O(1)
+per device:
+
+    ewma      exponentially weighted mean / variance z-score (3 columns)
+    mad       streaming median / MAD, robust z-score (3)
+    seasonal  mean / variance per UTC hour of day over ANOMALY_SEASONAL_DAYS (72)
+
+State lives in one (devices, columns) array per metric. A write batch is
+scored with one set of NumPy operations per round, where round k holds
+each device's k-th reading of the batch, so a device's readings are still
+applied in order. A reading is anomalous when any detector that finished
+its warm-up scores |z| >= ANOMALY_Z_THRESHOLD; baselines move by at most
+that many deviations per reading, so a spike doesn't drag them along.
+
+Every process that writes keeps its own state and saves it to
+`<ANOMALY_SNAPSHOT_DIR>/<tag>.npz` every ANOMALY_SNAPSHOT_SECONDS and on
+shutdown. At startup all snapshots in the directory are merged (newest
+reading per device wins), so a restart, or a change of --procs, keeps
+the learned baselines.
+"""
+from __future__ import annotations
+
+import asyncio
+import calendar
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+from .metrics import ANOMALY_EVAL_SECONDS, registry
+
+logger = logging.getLogger(__name__)
+
+# (Measurement attribute, flag attribute, settings floor)
+METRICS = (
+    ("eco2_ppm", "anom_eco2", "ANOMALY_ECO2_FLOOR"),
+    ("tvoc_ppb", "anom_tvoc", "ANOMALY_TVOC_FLOOR"),
+)
+_MAX_GAP_SECONDS = 3600.0
+
+
+# =========================================================
+# DETECTORS
+# =========================================================
+
+class Detector:
+    """
+    Streaming detector for one metric. `step` gets the state rows of k
+    devices (a copy, updated in place), one value each, and returns
+    (z, ready).
+    """
+    name = ""
+    width = 0
+
+    def __init__(self, floor: float):
+        self.floor = floor          # smallest spread, in the metric's unit
+        self.clip = settings.ANOMALY_Z_THRESHOLD
+
+    def step(self, state: np.ndarray, x: np.ndarray, hour: np.ndarray, dt: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+
+DETECTORS: dict[str, type[Detector]] = {}
+
+
+def register_detector(cls: type[Detector]) -> type[Detector]:
+    DETECTORS[cls.name] = cls
+    return cls
+
+
+def _ewma(mean, var, first, x, alpha, floor, clip):
+    """z of x against (mean, var), then the updated (mean, var)"""
+    std = np.sqrt(np.maximum(var, floor * floor))
+    z = np.where(first, 0.0, (x - mean) / std)
+    d = np.clip(x - mean, -clip * std, clip * std)
+    new_mean = np.where(first, x, mean + alpha * d)
+    new_var = np.where(first, 0.0, (1.0 - alpha) * (var + alpha * d * d))
+    return z, new_mean, new_var
+
+
+@register_detector
+class EwmaDetector(Detector):
+    """Recent level: mean / variance over roughly the last 1/alpha readings"""
+    name = "ewma"
+    width = 3   # mean, var, n
+
+    def __init__(self, floor: float):
+        super().__init__(floor)
+        self.alpha = settings.ANOMALY_EWMA_ALPHA
+        self.warmup = settings.ANOMALY_WARMUP
+
+    def step(self, state, x, hour, dt):
+        n = state[:, 2]
+        alpha = np.maximum(self.alpha, 1.0 / (n + 1.0))   # plain average while warming up
+        z, state[:, 0], state[:, 1] = _ewma(state[:, 0], state[:, 1], n == 0, x, alpha, self.floor, self.clip)
+        ready = n >= self.warmup
+        state[:, 2] = n + 1.0
+        return z, ready
+
+
+@register_detector
+class MadDetector(Detector):
+    """Median / MAD tracked with sign steps; outliers can't pull them far"""
+    name = "mad"
+    width = 3   # median, mad, n
+
+    def __init__(self, floor: float):
+        super().__init__(floor)
+        self.rate = settings.ANOMALY_MAD_RATE
+        self.warmup = settings.ANOMALY_WARMUP
+
+    def step(self, state, x, hour, dt):
+        med, mad, n = state[:, 0], state[:, 1], state[:, 2]
+        first = n == 0
+        scale = np.maximum(mad, self.floor)
+        dev = x - med
+        z = np.where(first, 0.0, 0.6745 * dev / scale)
+        eta = np.maximum(self.rate, 1.0 / (n + 1.0)) * scale
+        new_med = np.where(first, x, med + eta * np.sign(dev))
+        new_mad = np.where(first, 0.0, np.maximum(0.0, mad + eta * np.sign(np.abs(dev) - mad)))
+        ready = n >= self.warmup
+        state[:, 0], state[:, 1], state[:, 2] = new_med, new_mad, n + 1.0
+        return z, ready
+
+
+@register_detector
+class SeasonalDetector(Detector):
+    """
+    Level usual for this hour of day. Each reading weighs as much as the
+    time since the device's previous one, so the baseline covers about
+    ANOMALY_SEASONAL_DAYS whatever the reporting interval.
+    """
+    name = "seasonal"
+    width = 72  # mean[24], var[24], observed seconds[24]
+
+    def __init__(self, floor: float):
+        super().__init__(floor)
+        self.horizon = settings.ANOMALY_SEASONAL_DAYS * 3600.0   # observed seconds per bucket
+        self.warmup = settings.ANOMALY_SEASONAL_WARMUP_DAYS * 3600.0
+
+    def step(self, state, x, hour, dt):
+        rows = np.arange(len(x))
+        mean, var, seen = state[rows, hour], state[rows, 24 + hour], state[rows, 48 + hour]
+        alpha = dt / np.minimum(seen + dt, self.horizon)
+        z, state[rows, hour], state[rows, 24 + hour] = _ewma(mean, var, seen == 0, x, alpha, self.floor, self.clip)
+        state[rows, 48 + hour] = seen + dt
+        return z, seen >= self.warmup
+
+
+# =========================================================
+# ENGINE
+# =========================================================
+
+class AnomalyEngine:
+    def __init__(self, detectors: list[str], threshold: float, capacity: int = 1024):
+        unknown = [d for d in detectors if d not in DETECTORS]
+        if unknown:
+            raise ValueError(f"Unknown anomaly detector(s): {', '.join(unknown)}")
+        self.threshold = threshold
+        self.names = detectors
+        self._detectors = [
+            [DETECTORS[d](getattr(settings, floor)) for d in detectors] for _, _, floor in METRICS
+        ]
+        self.width = sum(DETECTORS[d].width for d in detectors)
+        self.layout = ",".join(f"{d}:{DETECTORS[d].width}" for d in detectors)
+        self._slots: dict[str, int] = {}
+        self._ids: list[str] = []
+        self._state = [np.zeros((capacity, self.width)) for _ in METRICS]
+        self._last_ts = np.zeros(capacity)     # epoch s of each device's last reading
+        self._lock = threading.Lock()
+        self.tag = ""
+        self.dirty = False
+
+        # Counters (read by metrics / stats)
+        self.evaluated = 0
+        self.flagged = [0] * len(METRICS)
+        self.snapshots = 0
+        self.last_snapshot_ms: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _slot(self, device_id: str) -> int:
+        slot = self._slots.get(device_id)
+        if slot is None:
+            slot = len(self._ids)
+            if slot == len(self._last_ts):
+                grow = len(self._last_ts)
+                self._state = [np.vstack([s, np.zeros((grow, self.width))]) for s in self._state]
+                self._last_ts = np.concatenate([self._last_ts, np.zeros(grow)])
+            self._slots[device_id] = slot
+            self._ids.append(device_id)
+        return slot
+
+    def observe(self, rows: list) -> int:
+        """Score rows (Measurement-like, in arrival order) and set their anomaly flags; returns rows flagged"""
+        rows = [m for m in rows if not getattr(m, "_anomaly_scored", False)]   # write retries
+        n = len(rows)
+        if n == 0:
+            return 0
+        t0 = time.perf_counter()
+        values = np.array(
+            [[getattr(m, attr) for m in rows] for attr, _, _ in METRICS], dtype=np.float64
+        )  # None -> nan
+        ts = [m.ts.utctimetuple() for m in rows]   # naive ts are UTC already
+        hours = np.fromiter((t.tm_hour for t in ts), dtype=np.intp, count=n)
+        epoch = np.fromiter((calendar.timegm(t) for t in ts), dtype=np.float64, count=n)
+        flags = np.zeros((len(METRICS), n), dtype=bool)
+        scored = ~np.isnan(values)
+
+        with self._lock:
+            occurrence: dict[int, int] = {}
+            slots = np.empty(n, dtype=np.intp)
+            rounds = np.empty(n, dtype=np.intp)
+            for i, m in enumerate(rows):
+                slot = self._slot(m.device_id)
+                slots[i] = slot
+                rounds[i] = occurrence.get(slot, 0)
+                occurrence[slot] = rounds[i] + 1
+            last_round = int(rounds.max())
+            for r in range(last_round + 1):
+                sel = np.arange(n) if last_round == 0 else np.flatnonzero(rounds == r)
+                s = slots[sel]
+                last = self._last_ts[s]
+                dt = np.where(last > 0, np.clip(epoch[sel] - last, 1.0, _MAX_GAP_SECONDS), 1.0)
+                for k, detectors in enumerate(self._detectors):
+                    ok = scored[k, sel]
+                    if not ok.any():
+                        continue
+                    rows_k = s[ok]
+                    block = self._state[k][rows_k]
+                    x, h, d = values[k, sel][ok], hours[sel][ok], dt[ok]
+                    hit = np.zeros(len(rows_k), dtype=bool)
+                    offset = 0
+                    for det in detectors:
+                        z, ready = det.step(block[:, offset:offset + det.width], x, h, d)
+                        hit |= ready & (np.abs(z) >= self.threshold)
+                        offset += det.width
+                    self._state[k][rows_k] = block
+                    flags[k, sel[ok]] = hit
+                self._last_ts[s] = np.maximum(last, epoch[sel])
+            self.dirty = True
+
+        flagged = flags.any(axis=0)
+        for k, (_, flag, _) in enumerate(METRICS):
+            for i in np.flatnonzero(flags[k]).tolist():
+                setattr(rows[i], flag, True)
+            self.flagged[k] += int(flags[k].sum())
+            for i in np.flatnonzero(scored[k] & ~flags[k]).tolist():
+                if getattr(rows[i], flag) is None:
+                    setattr(rows[i], flag, False)
+        for m in rows:
+            m._anomaly_scored = True
+        self.evaluated += n
+        ANOMALY_EVAL_SECONDS.observe(time.perf_counter() - t0)
+        return int(flagged.sum())
+
+    # ---------- snapshots ----------
+
+    def save(self, directory: str) -> Optional[str]:
+        """Write this process's state to <directory>/<tag>.npz (atomic rename); None if unchanged"""
+        if not self.tag:
+            return None
+        t0 = time.perf_counter()
+        with self._lock:
+            if not self.dirty:
+                return None
+            n = len(self._ids)
+            arrays = {f"state_{attr}": self._state[k][:n].copy() for k, (attr, _, _) in enumerate(METRICS)}
+            arrays["device_ids"] = np.array(self._ids, dtype=str)
+            arrays["last_ts"] = self._last_ts[:n].copy()
+            self.dirty = False
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.tag}.npz")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, layout=np.array(self.layout), **arrays)
+        os.replace(tmp, path)
+        self.snapshots += 1
+        self.last_snapshot_ms = (time.perf_counter() - t0) * 1000.0
+        return path
+
+    def load(self, directory: str, stale_hours: float = 0.0) -> int:
+        """
+        Merge every snapshot in `directory` (newest reading per device
+        wins); returns devices restored. Other processes' snapshots not
+        rewritten for `stale_hours` are removed once merged.
+        """
+        now = time.time()
+        restored = set()
+        for path in sorted(glob.glob(os.path.join(directory, "*.npz"))):
+            try:
+                with np.load(path, allow_pickle=False) as snap:
+                    if str(snap["layout"]) != self.layout:
+                        logger.warning(f"⚠️ Anomaly snapshot {path} has detectors {snap['layout']}, not {self.layout}; skipped")
+                        continue
+                    ids = snap["device_ids"].tolist()
+                    last_ts = snap["last_ts"]
+                    states = [snap[f"state_{attr}"] for attr, _, _ in METRICS]
+            except Exception as e:
+                logger.error(f"❌ Anomaly snapshot {path} unreadable: {e}")
+                continue
+            with self._lock:
+                for j, device_id in enumerate(ids):
+                    slot = self._slot(device_id)
+                    if last_ts[j] >= self._last_ts[slot]:
+                        self._last_ts[slot] = last_ts[j]
+                        for k, state in enumerate(states):
+                            self._state[k][slot] = state[j]
+                        restored.add(device_id)
+                self.dirty = True
+            own = os.path.basename(path) == f"{self.tag}.npz"
+            if stale_hours > 0 and not own and now - os.path.getmtime(path) > stale_hours * 3600:
+                os.remove(path)
+                logger.info(f"🧹 Merged and removed stale anomaly snapshot {path}")
+        return len(restored)
+
+    def stats(self) -> dict:
+        return {
+            "detectors": self.names,
+            "devices": len(self),
+            "evaluated": self.evaluated,
+            "flagged": {attr: self.flagged[k] for k, (attr, _, _) in enumerate(METRICS)},
+            "snapshots": self.snapshots,
+            "last_snapshot_ms": round(self.last_snapshot_ms, 2) if self.last_snapshot_ms is not None else None,
+        }
+
+
+def snapshot_dir() -> str:
+    return settings.ANOMALY_SNAPSHOT_DIR or os.path.join(os.path.dirname(os.path.abspath(settings.DB_PATH)), "anomaly")
+
+
+def make_engine() -> Optional[AnomalyEngine]:
+    if not settings.ANOMALY_ENABLED:
+        return None
+    names = [d.strip() for d in settings.ANOMALY_DETECTORS.split(",") if d.strip()]
+    return AnomalyEngine(names, settings.ANOMALY_Z_THRESHOLD)
+
+
+anomaly_engine = make_engine()
+
+
+def observe(rows: list) -> None:
+    """Ingest hook: score rows before they are written (no-op when disabled)"""
+    if anomaly_engine is None or not rows:
+        return
+    try:
+        anomaly_engine.observe(rows)
+    except Exception as e:
+        logger.error(f"❌ Anomaly scoring failed ({len(rows)} rows stored unscored): {e}", exc_info=True)
+
+
+def start(tag: str) -> int:
+    """Name this process's snapshot and restore saved state; returns devices restored"""
+    if anomaly_engine is None:
+        return 0
+    anomaly_engine.tag = tag
+    t0 = time.perf_counter()
+    restored = anomaly_engine.load(snapshot_dir(), settings.ANOMALY_SNAPSHOT_STALE_HOURS)
+    if restored:
+        logger.info(f"✅ Anomaly state restored for {restored} devices in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return restored
+
+
+def save() -> None:
+    if anomaly_engine is None:
+        return
+    try:
+        anomaly_engine.save(snapshot_dir())
+    except Exception as e:
+        logger.error(f"❌ Anomaly snapshot failed: {e}")
+
+
+async def run_snapshots(interval_seconds: float) -> None:
+    """Background task: save state every interval (call save() once more after the writer drained)"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await asyncio.to_thread(save)
+
+
+registry.counter("aq_anomaly_readings_total", "Readings scored by the anomaly engine", ("outcome",),
+                 fn=lambda: [] if anomaly_engine is None else
+                 [(("evaluated",), anomaly_engine.evaluated)]
+                 + [((f"flagged_{attr}",), anomaly_engine.flagged[k]) for k, (attr, _, _) in enumerate(METRICS)])
+registry.gauge("aq_anomaly_devices", "Devices with anomaly detector state",
+               fn=lambda: [] if anomaly_engine is None else [((), len(anomaly_engine))])
@@ -0,0 +1,240 @@
+"""
+Batched measurement writer for the ingest paths.
+
+Decoded measurements are queued and written in batches: one session and
+one commit per INGEST_BATCH_SIZE rows or INGEST_FLUSH_MS, whichever comes
+first. The SQLite write runs in a thread so the MQTT loop keeps reading
+while a batch commits. A full queue blocks the producer (backpressure)
+instead of growing without bound.
+
+Rows go in as one bulk INSERT (executemany of the objects' column values)
+in queue order, not through the ORM unit of work, which costs more than
+twice as much per row; the objects stay transient (no ids). The anomaly
+engine (app/anomaly.py) scores each batch just before it is written.
+
+A locked or busy database (OperationalError) is retried
+INGEST_WRITE_RETRIES times. A batch the database rejects for its data (a
+value that can't be bound, a constraint) is written again row by row, so
+only the bad rows are dropped.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, StatementError
+
+from . import anomaly
+from .config import settings
+from .database import SessionLocal
+from .latest_state import latest_state
+from .metrics import BATCH_SIZE, DB_COMMIT_SECONDS, RECEIVE_TO_COMMIT_SECONDS, registry
+from .models import Measurement
+from .rules import rule_engine
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+_COLUMNS = tuple(c.key for c in Measurement.__table__.columns if not c.primary_key)
+
+
+def column_values(m: Measurement) -> dict:
+    """Values set on a (transient) Measurement; unset columns keep their defaults"""
+    state = m.__dict__
+    return {key: state[key] for key in _COLUMNS if key in state}
+
+
+def _insert(rows: list[Measurement]) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(insert(Measurement), [column_values(m) for m in rows])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _insert_each(rows: list[Measurement]) -> list[Measurement]:
+    """One statement per row in one transaction; rows the database rejects are dropped. Returns the rows written"""
+    written = []
+    db = SessionLocal()
+    try:
+        for m in rows:
+            try:
+                db.execute(insert(Measurement), column_values(m))
+            except OperationalError:
+                raise
+            except StatementError as e:   # a failed statement leaves nothing behind in SQLite
+                logger.error(f"❌ Reading of {m.device_id} rejected by the database, dropped: {e.orig or e}")
+                continue
+            written.append(m)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return written
+
+
+class BatchWriter:
+    def __init__(self, batch_size: int, flush_ms: int, queue_size: int):
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_ms / 1000.0
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.yield_to: Optional[Callable[[], Awaitable[None]]] = None  # awaited before each commit (alert fast path)
+
+        # Counters (read by health / metrics)
+        self.received = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_at: Optional[float] = None   # time.time()
+        self.last_batch_ms: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def capacity(self) -> int:
+        return self.queue_size
+
+    def start(self) -> asyncio.Task:
+        """Start the flush loop on the running event loop"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def put(self, m: Measurement) -> None:
+        self.received += 1
+        await self._queue.put(m)
+
+    async def put_many(self, rows: list[Measurement]) -> None:
+        """Queue rows back to back (one message's readings end up in the same commits, in order)"""
+        self.received += len(rows)
+        for i, m in enumerate(rows):
+            try:
+                self._queue.put_nowait(m)
+            except asyncio.QueueFull:
+                for rest in rows[i:]:
+                    await self._queue.put(rest)
+                return
+
+    async def close(self) -> None:
+        """Flush everything queued so far, then stop"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        logger.info(f"✅ Batch writer drained ({self.written} written, {self.failed} failed)")
+
+    # ---------- flush loop ----------
+
+    async def _run(self) -> None:
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()  # already queued: no timer per row
+                except asyncio.QueueEmpty:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: list[Measurement]) -> None:
+        if self.yield_to is not None:
+            await self.yield_to()
+        t0 = time.perf_counter()
+        try:
+            dropped = await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"❌ Batch write failed ({len(batch)} rows dropped): {e}", exc_info=True)
+            return
+        self.failed += dropped
+        self.written += len(batch) - dropped
+        self.batches += 1
+        self.last_flush_at = time.time()
+        self.last_batch_ms = (time.perf_counter() - t0) * 1000.0
+        logger.debug(f"💾 Wrote batch of {len(batch)} in {self.last_batch_ms:.1f} ms")
+
+    @staticmethod
+    def _write(batch: list[Measurement]) -> int:
+        """Write a batch; returns how many rows the database rejected (dropped). Raises once retries are used up"""
+        rule_engine.apply(batch)   # per-device rules replace the gateway's status / delta alert
+        anomaly.observe(batch)   # sets anom_eco2 / anom_tvoc before the rows are written
+        t0 = time.perf_counter()
+        whole, attempt = True, 0
+        while True:
+            try:
+                if whole:
+                    _insert(batch)
+                    written = batch
+                else:
+                    written = _insert_each(batch)
+                break
+            except OperationalError as e:   # locked / busy: the rows are fine, try again
+                attempt += 1
+                if attempt > settings.INGEST_WRITE_RETRIES:
+                    raise
+                logger.warning(f"⚠️ Batch write of {len(batch)} failed, retry {attempt}: {e.orig}")
+                time.sleep(settings.INGEST_WRITE_RETRY_MS / 1000.0 * attempt)
+            except StatementError as e:
+                if not whole:
+                    raise
+                logger.warning(f"⚠️ Batch of {len(batch)} rejected ({e.orig or e}), writing row by row")
+                whole = False
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - t0, "batch")
+        BATCH_SIZE.observe(len(written))
+        now = time.monotonic()
+        for m in written:
+            received_at = getattr(m, "_received_at", None)  # set by the MQTT subscriber
+            if received_at is not None:
+                RECEIVE_TO_COMMIT_SECONDS.observe(now - received_at)
+            latest_state.update(m)
+        return len(batch) - len(written)
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "queue_depth": self.depth(),
+            "last_flush_at": self.last_flush_at,
+            "last_batch_ms": round(self.last_batch_ms, 2) if self.last_batch_ms is not None else None,
+        }
+
+
+batch_writer = BatchWriter(settings.INGEST_BATCH_SIZE, settings.INGEST_FLUSH_MS, settings.INGEST_QUEUE_SIZE)
+
+registry.gauge("aq_ingest_queue_depth", "Readings waiting for the batch writer",
+               fn=lambda: [((), batch_writer.depth())])
+registry.counter("aq_ingest_writer_rows_total", "Batch writer rows by outcome", ("outcome",),
+                 fn=lambda: [(("written",), batch_writer.written), (("failed",), batch_writer.failed)])
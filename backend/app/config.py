@@ -15,8 +15,18 @@ class Settings(BaseSettings):
     MQTT_BROKER: str = "broker.emqx.io"
     MQTT_PORT: int = 1883
     MQTT_TOPIC_PREFIX: str = "kayseri/air_quality/"
+    MQTT_BINARY_SUFFIX: str = "bin"         # <prefix><device_id>/bin carries binary frames (app/frames.py)
+    MQTT_BATCH_SUFFIX: str = "batch"        # <prefix><gateway_id>/batch carries JSON arrays of readings
+    MQTT_BATCH_MAX_READINGS: int = 5000     # larger batch envelopes are dropped whole
+
+    # ================== MQTT CONSUMER COORDINATION ==================
+    MQTT_CONSUMER_MODE: str = "leader"      # leader | shard | all (one consumer per uvicorn worker)
+    MQTT_SHARDS: int = 4                    # shard mode: device hash slots
+    MQTT_LOCK_DIR: str = ""                 # default: the database directory
+    MQTT_LEADER_RETRY_SECONDS: float = 5.0  # standby poll / takeover delay
 
     # ================== BASELINE / TREND ==================
+    # This and the next three sections are the alert rule defaults (see ALERT RULES)
     BASELINE_SECONDS: int = 60
     WARN_INCREASE_PCT: float = 35.0
     HIGH_INCREASE_PCT: float = 80.0
@@ -39,6 +49,130 @@ class Settings(BaseSettings):
     HUM_DELTA_RH: float = 2.0
     PRESS_DELTA_HPA: float = 1.0
 
+    # ================== ALERT RULES ==================
+    RULES_PATH: str = ""                    # JSON per city / district / device overrides of the thresholds above
+    RULES_RELOAD_SECONDS: float = 5.0       # RULES_PATH mtime poll; edits apply without a restart
+
+    # ================== INGEST WORKER ==================
+    API_READ_ONLY: bool = False             # API skips MQTT and rejects writes; run `python -m app.ingest`
+    INGEST_BATCH_SIZE: int = 200            # rows per commit
+    INGEST_FLUSH_MS: int = 250              # max wait before a partial batch is written
+    INGEST_WRITE_RETRIES: int = 3           # locked / busy database: retries of a batch before it is dropped
+    INGEST_WRITE_RETRY_MS: int = 200        # wait before retry n is n x this
+    INGEST_QUEUE_SIZE: int = 10_000         # decoded readings waiting for the writer
+    INGEST_PROCS: int = 1                   # >1: dispatcher + N processes, routed by crc32(device_id)
+    INGEST_HEALTH_HOST: str = "127.0.0.1"
+    INGEST_HEALTH_PORT: int = 8081          # ingest worker /health, /metrics, /stats
+    INGEST_DRAIN_SECONDS: float = 10.0      # SIGTERM: max time to flush the queue
+    LATEST_FOLLOW_SECONDS: float = 2.0      # poll for rows written by other processes (read-only API, leader / shard)
+
+    # ================== ADMISSION CONTROL ==================
+    INGEST_DEVICE_RATE: float = 0.0         # readings/s per device (0 = unlimited, the default)
+    INGEST_DEVICE_BURST: int = 10
+    INGEST_KEY_RATE: float = 0.0            # HTTP readings/s per API key (0 = unlimited, the default)
+    INGEST_KEY_BURST: int = 400
+    INGEST_OVERFLOW_POLICY: str = "drop"    # drop | coalesce | downsample
+    INGEST_DOWNSAMPLE_KEEP_EVERY: int = 5   # downsample: store 1 of N over-limit readings
+    INGEST_SHED_QUEUE_RATIO: float = 0.8    # shed normal readings above this writer queue fill
+    INGEST_HTTP_BATCH_MAX: int = 1000       # readings per POST /api/ingest/batch
+
+    # ================== INGEST SPOOL ==================
+    SPOOL_ENABLED: bool = False             # MQTT -> segment files -> DB; QoS1, persistent session, ack after spool
+    SPOOL_DIR: str = ""                     # default: <database dir>/spool
+    SPOOL_SEGMENT_BYTES: int = 8 * 1024 * 1024
+    SPOOL_FSYNC_MS: int = 200               # fsync at most this often (0 = every message)
+    MQTT_CLIENT_ID: str = ""                # spool mode session id; default know-the-air-<hostname>
+
+    # ================== ALERT FAST PATH ==================
+    ALERT_STREAM_ENABLED: bool = True       # API listens on +/alert, +/anomaly for GET /api/alerts/stream
+    ALERT_ACTIVE_SECONDS: int = 900         # a device's last alert stays in /api/alerts/active this long
+    ALERT_RECENT_KEEP: int = 500            # events kept in memory for SSE Last-Event-ID resume
+    ALERT_CLIENT_QUEUE: int = 256           # per SSE client; a slow client loses its oldest events
+    ALERT_HEARTBEAT_SECONDS: float = 15.0   # SSE keep-alive comment
+
+    # ================== ANOMALY ENGINE ==================
+    ANOMALY_ENABLED: bool = True            # score every stored reading, OR the verdict into anom_eco2 / anom_tvoc
+    ANOMALY_DETECTORS: str = "ewma,mad,seasonal"  # app/anomaly.py DETECTORS, comma separated
+    ANOMALY_Z_THRESHOLD: float = 4.0        # |z| from any warmed-up detector at or above this = anomaly
+    ANOMALY_WARMUP: int = 30                # readings per device before ewma / mad can flag
+    ANOMALY_EWMA_ALPHA: float = 0.05        # ewma: weight of the newest reading
+    ANOMALY_MAD_RATE: float = 0.05          # mad: median / MAD step, as a fraction of the MAD
+    ANOMALY_SEASONAL_DAYS: float = 7.0      # seasonal: each hour-of-day baseline covers about this many days
+    ANOMALY_SEASONAL_WARMUP_DAYS: float = 2.0  # seasonal: an hour bucket flags after this much observed time
+    ANOMALY_ECO2_FLOOR: float = 10.0        # smallest spread (ppm), so a flat sensor doesn't flag on noise
+    ANOMALY_TVOC_FLOOR: float = 5.0         # smallest spread (ppb)
+    ANOMALY_SNAPSHOT_DIR: str = ""          # default: <database dir>/anomaly
+    ANOMALY_SNAPSHOT_SECONDS: float = 60.0  # save detector state this often and at shutdown (0 = only at shutdown)
+    ANOMALY_SNAPSHOT_STALE_HOURS: float = 24.0  # other processes' snapshots this old are merged, then removed
+
+    # ================== AREA CORRELATION ==================
+    CORRELATOR_WINDOW_SECONDS: float = 300.0  # a reading counts toward its district / city this long
+    CORRELATOR_MIN_DEVICES: int = 3         # elevated devices needed for an area event
+    CORRELATOR_MIN_FRACTION: float = 0.5    # ... and at least this share of the area's reporting devices
+    CORRELATOR_EVENTS_KEEP: int = 500       # area events kept in memory (open + recent)
+    CORRELATOR_TICK_SECONDS: float = 5.0    # closes events of areas that stopped reporting
+
+    # ================== FORECASTING ==================
+    FORECAST_ENABLED: bool = True           # rollups, TinyML scoring and server forecasts (app/forecasting.py)
+    FORECAST_JOB_SECONDS: float = 300.0     # batch job interval in writing processes (one at a time, file lock)
+    FORECAST_HORIZON_HOURS: int = 3         # hourly means forecast this far ahead
+    FORECAST_HISTORY_HOURS: int = 168       # rollup hours the model is fitted on
+    FORECAST_MIN_HOURS: int = 24            # observed hours a device needs before it gets forecasts
+    FORECAST_ALPHA: float = 0.3             # Holt-Winters level smoothing
+    FORECAST_BETA: float = 0.05             # trend smoothing
+    FORECAST_GAMMA: float = 0.15            # hour-of-day season smoothing
+    FORECAST_PHI: float = 0.9               # trend damping per hour
+    FORECAST_MATCH_MINUTES: float = 5.0     # TinyML actual = mean of the readings 60 +/- this many minutes later
+    FORECAST_LATE_SECONDS: float = 300.0    # wait this long for late readings before scoring
+    FORECAST_CHUNK_ROWS: int = 200_000      # measurement ids per job transaction (keeps the write lock short)
+    FORECAST_KEEP_DAYS: int = 7             # forecasts kept after their hour
+
+    # ================== DATABASE ==================
+    DB_WAL: bool = True  # readers don't block the ingest writer
+
+    # ================== HEALTH ==================
+    HEALTH_CHECK_SECONDS: float = 5.0           # background checks; probes read the cached result
+    HEALTH_DB_WRITE_MAX_MS: float = 1000.0      # write-lock probe slower than this = not ready
+    HEALTH_QUEUE_MAX_RATIO: float = 0.9         # writer queue fuller than this = not ready
+    HEALTH_INGEST_LAG_MAX_SECONDS: float = 0.0  # newest reading older than this = not ready (0 = off)
+    HEALTH_DEVICE_STALE_SECONDS: float = 900.0  # devices silent this long are listed as stale
+
+    # ================== PROFILING ==================
+    PROFILING_ENABLED: bool = False         # per-request SQL / timing profile at /api/debug/requests
+    PROFILING_SLOWEST_KEEP: int = 50        # slowest requests (and sampling captures) kept
+    PROFILING_N_PLUS_ONE_MIN: int = 5       # same statement shape this often in one request = N+1 suspect
+    PROFILING_SAMPLE_INTERVAL_MS: float = 2.0  # `X-Profile: sample` stack sampling interval
+
+    # ================== DEVICE REGISTRY ==================
+    REGISTRY_REFRESH_SECONDS: int = 30      # picks up devices registered by other workers
+    INGEST_REQUIRE_REGISTERED: bool = False # drop readings from unregistered device_ids
+
+    # ================== HISTORY DOWNSAMPLING ==================
+    HISTORY_DOWNSAMPLE_SOURCE_ROWS: int = 1_000_000  # raw rows scanned when max_points is set
+
+    # ================== BULK READS ==================
+    EXPORT_MAX_ROWS: int = 1_000_000
+    GZIP_MIN_BYTES: int = 8192  # JSON bodies above this are gzip/brotli compressed
+
+    # ================== AGGREGATION ==================
+    AGG_WORKERS: int = 2
+    AGG_CACHE_SIZE: int = 256
+    AGG_CACHE_TTL_SECONDS: int = 30
+    AGG_MAX_RANGE_DAYS: int = 92
+    AGG_USE_ROLLUPS: bool = True   # hour-aligned 1h+ avg/max/alert_count from hourly_rollups when caught up
+
+    # ================== MAP / GEO INDEX ==================
+    MAP_CLUSTER_MAX_ZOOM: int = 16      # above this zoom only single points are returned
+    MAP_CLUSTER_CELLS_PER_TILE: int = 4 # cluster cell = 1/4 of a 256px map tile
+    MAP_CLUSTER_SAMPLE_IDS: int = 10    # member ids listed per cluster; `count` has the total
+
+    # ================== HEATMAP ==================
+    HEATMAP_TILE_SIZE: int = 64         # grid cells per tile edge
+    HEATMAP_RADIUS_KM: float = 5.0      # sensors further away don't contribute
+    HEATMAP_IDW_POWER: float = 2.0
+    HEATMAP_CACHE_TILES: int = 2048
+    NEAREST_MAX_K: int = 20
+
     # ================== HELPERS ==================
     def cors_list(self) -> List[str]:
         return [x.strip() for x in self.CORS_ORIGINS.split(",") if x.strip()]
@@ -0,0 +1,226 @@
+"""
+MQTT consumer coordination across processes.
+
+Every uvicorn worker runs the app lifespan, so without coordination each
+worker subscribes and every reading is stored once per worker. Workers on
+the same host coordinate through exclusive OS file locks next to the
+database (the SQLite file is local anyway):
+
+- leader: one lock file; whoever holds it consumes, the others retry
+          every MQTT_LEADER_RETRY_SECONDS. The OS drops the lock when the
+          holder dies, so a standby takes over automatically.
+- shard:  MQTT_SHARDS slot locks; a worker consumes the devices whose
+          crc32(device_id) % MQTT_SHARDS is a slot it holds. Each worker
+          first claims one slot, then adopts slots left orphaned for a full
+          retry interval, so dead workers' devices are picked up. Until a
+          slot is adopted, the worker holding the lowest held slot (the
+          keeper) also stores the readings of free slots, so nothing is
+          discarded at startup or after a worker dies.
+- all:    no coordination (single-process deployments, old behaviour).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import time
+import zlib
+from typing import IO, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+MODES = ("leader", "shard", "all")
+
+
+# =========================================================
+# FILE LOCKS (fcntl on POSIX, msvcrt on Windows)
+# =========================================================
+
+def _try_lock(path: str, write_pid: bool = True) -> Optional[IO]:
+    """Non-blocking exclusive lock; returns the open handle or None"""
+    fh = open(path, "a+")
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    if write_pid:  # for humans: who holds it
+        fh.seek(0)
+        fh.truncate()
+        fh.write(f"{os.getpid()}\n")
+        fh.flush()
+    return fh
+
+
+def _unlock(fh: IO) -> None:
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    finally:
+        fh.close()
+
+
+def shard_of(device_id: str, shards: int) -> int:
+    return zlib.crc32(device_id.encode()) % shards
+
+
+# =========================================================
+# COORDINATOR
+# =========================================================
+
+class ConsumerCoordinator:
+    def __init__(self, mode: str, shards: int, lock_dir: str, retry_seconds: float):
+        if mode not in MODES:
+            raise ValueError(f"MQTT_CONSUMER_MODE must be one of {MODES}, got {mode!r}")
+        self.mode = mode
+        self.shards = max(1, shards)
+        self.lock_dir = lock_dir
+        self.retry_seconds = retry_seconds
+        self._held: dict[int, IO] = {}       # slot -> lock handle
+        self._orphan_seen: set[int] = set()  # slots found free on the previous tick
+        self._keeper = False                 # holds the lowest held slot: covers free slots
+        self._free_checked: dict[int, tuple[float, bool]] = {}   # slot -> (monotonic, free)
+
+    # ---------- state ----------
+
+    @property
+    def active(self) -> bool:
+        return self.mode == "all" or bool(self._held)
+
+    def owned_slots(self) -> list[int]:
+        return sorted(self._held)
+
+    def owns(self, device_id: str) -> bool:
+        """Should this process store readings from device_id?"""
+        if self.mode == "all":
+            return True
+        if self.mode == "leader":
+            return bool(self._held)
+        slot = shard_of(device_id, self.shards)
+        if slot in self._held:
+            return True
+        return self._keeper and self._slot_free(slot)
+
+    def _slot_free(self, slot: int) -> bool:
+        """Lock probe, cached for a second: a slot claimed meanwhile is left to its new owner"""
+        now = time.monotonic()
+        checked = self._free_checked.get(slot)
+        if checked is None or now - checked[0] >= 1.0:
+            checked = self._free_checked[slot] = (now, self._is_free(slot))
+        return checked[1]
+
+    def describe(self) -> dict:
+        role = "consumer" if self.active else "standby"
+        out = {"mode": self.mode, "role": role, "pid": os.getpid()}
+        if self.mode == "shard":
+            out["shards"] = self.shards
+            out["slots"] = self.owned_slots()
+            out["keeper"] = self._keeper
+        return out
+
+    # ---------- locking ----------
+
+    def _path(self, slot: int) -> str:
+        name = "mqtt-consumer.lock" if self.mode == "leader" else f"mqtt-shard-{slot}.lock"
+        return os.path.join(self.lock_dir, name)
+
+    def _claim(self, slot: int) -> bool:
+        if slot in self._held:
+            return True
+        fh = _try_lock(self._path(slot))
+        if fh is None:
+            return False
+        self._held[slot] = fh
+        return True
+
+    def try_acquire(self) -> bool:
+        """One election round; returns True when this process should consume"""
+        if self.mode == "all":
+            return True
+        os.makedirs(self.lock_dir, exist_ok=True)
+        if self.mode == "leader":
+            return self._claim(0)
+
+        if not self._held:
+            # First slot: stop at the first free one so workers spread out
+            for slot in range(self.shards):
+                if self._claim(slot):
+                    logger.info(f"✅ MQTT shard {slot}/{self.shards} claimed (pid {os.getpid()})")
+                    break
+            # Slots below ours were all taken when we tried them
+            self._keeper = bool(self._held) and all(self._is_free(s) for s in range(min(self._held, default=0)))
+            return self.active
+
+        # Adopt at most one slot per tick that was already free last tick
+        free = {s for s in range(self.shards) if s not in self._held and self._is_free(s)}
+        for slot in sorted(free & self._orphan_seen):
+            if self._claim(slot):
+                logger.warning(f"⚠️ MQTT shard {slot} orphaned, adopted by pid {os.getpid()}")
+                free.discard(slot)
+                break
+        self._orphan_seen = free
+        self._keeper = all(s in free for s in range(min(self._held)))
+        return True
+
+    def _is_free(self, slot: int) -> bool:
+        fh = _try_lock(self._path(slot), write_pid=False)
+        if fh is None:
+            return False
+        _unlock(fh)
+        return True
+
+    def release(self) -> None:
+        for fh in self._held.values():
+            _unlock(fh)
+        self._held.clear()
+        self._orphan_seen.clear()
+        self._keeper = False
+        self._free_checked.clear()
+
+    async def wait_until_active(self) -> None:
+        """Block (as a standby) until this process wins an election round"""
+        announced = False
+        while not await asyncio.to_thread(self.try_acquire):
+            if not announced:
+                logger.info(f"⏸️ MQTT consumer standby ({self.mode}); retrying every {self.retry_seconds}s")
+                announced = True
+            await asyncio.sleep(self.retry_seconds)
+        if self.mode == "leader":
+            logger.info(f"👑 MQTT consumer leader: pid {os.getpid()}")
+
+    async def maintain(self) -> None:
+        """Background task in shard mode: keep adopting orphaned slots"""
+        if self.mode != "shard":
+            return
+        while True:
+            await asyncio.sleep(self.retry_seconds)
+            try:
+                await asyncio.to_thread(self.try_acquire)
+            except Exception as e:
+                logger.error(f"❌ MQTT shard maintenance failed: {e}")
+
+
+def _default_lock_dir() -> str:
+    return settings.MQTT_LOCK_DIR or os.path.dirname(os.path.abspath(settings.DB_PATH))
+
+
+consumer_coordinator = ConsumerCoordinator(
+    mode=settings.MQTT_CONSUMER_MODE,
+    shards=settings.MQTT_SHARDS,
+    lock_dir=_default_lock_dir(),
+    retry_seconds=settings.MQTT_LEADER_RETRY_SECONDS,
+)
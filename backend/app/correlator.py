@@ -0,0 +1,284 @@
+"""
+Area-level (district / city) pollution events from several devices.
+
+One sensor spiking is often noise; several sensors of the same district
+rising together is an event. Every reading this process commits (or
+tails, in a read-only API) reaches the correlator through latest_state.
+For each district and city it keeps, over the last
+CORRELATOR_WINDOW_SECONDS of reading time:
+
+- reporting: devices with a reading in the window, with the mean of their
+  latest aq_score / eCO2 / TVOC
+- elevated:  devices with an elevated reading in the window (alert,
+  anomaly flag or WARN / HIGH status)
+
+A window is a last-seen map plus a FIFO of updates: a reading is O(1) and
+expiry pops from the FIFO head, so nothing is rescanned and
+`measurements` is never queried. An area event opens when at least
+CORRELATOR_MIN_DEVICES devices, and CORRELATOR_MIN_FRACTION of those
+reporting, are elevated, and closes when that stops holding (checked on
+each reading of the area and every CORRELATOR_TICK_SECONDS). Events are
+kept in memory, per process.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from .config import settings
+from .latest_state import latest_state
+from .metrics import registry
+from .registry import device_registry
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("district", "city")
+_VALUES = ("aq_score", "eco2_ppm", "tvoc_ppb")
+
+
+def is_elevated(r) -> bool:
+    return bool(r.alert or r.anom_eco2 or r.anom_tvoc) or r.status in ("WARN", "HIGH")
+
+
+def _epoch(ts: datetime) -> float:
+    return (ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class _Window:
+    """Distinct devices seen in the last `seconds`, with sums of their latest values"""
+    __slots__ = ("last", "values", "fifo", "sums", "counts")
+
+    def __init__(self):
+        self.last: dict[str, float] = {}
+        self.values: dict[str, tuple] = {}
+        self.fifo: deque[tuple[float, str]] = deque()
+        self.sums = [0.0] * len(_VALUES)
+        self.counts = [0] * len(_VALUES)
+
+    def __len__(self) -> int:
+        return len(self.last)
+
+    def _apply(self, values: tuple, sign: int) -> None:
+        for k, v in enumerate(values):
+            if v is not None:
+                self.sums[k] += sign * v
+                self.counts[k] += sign
+
+    def touch(self, device_id: str, t: float, values: tuple = ()) -> None:
+        if t < self.last.get(device_id, 0.0):
+            return
+        old = self.values.get(device_id)
+        if old is not None:
+            self._apply(old, -1)
+        self.last[device_id] = t
+        self.values[device_id] = values
+        self._apply(values, 1)
+        self.fifo.append((t, device_id))
+
+    def expire(self, cutoff: float) -> None:
+        """Drop devices last seen before cutoff (FIFO order, so late out-of-order entries linger a little)"""
+        fifo = self.fifo
+        while fifo and fifo[0][0] < cutoff:
+            t, device_id = fifo.popleft()
+            if self.last.get(device_id) == t:
+                del self.last[device_id]
+                self._apply(self.values.pop(device_id), -1)
+
+    def means(self) -> dict[str, Optional[float]]:
+        return {
+            name: round(self.sums[k] / self.counts[k], 1) if self.counts[k] else None
+            for k, name in enumerate(_VALUES)
+        }
+
+
+class _Area:
+    __slots__ = ("level", "city", "district", "reporting", "elevated", "event")
+
+    def __init__(self, level: str, city: str, district: Optional[str]):
+        self.level = level
+        self.city = city
+        self.district = district
+        self.reporting = _Window()
+        self.elevated = _Window()
+        self.event: Optional[dict] = None
+
+    def summary(self) -> dict:
+        return {
+            "level": self.level,
+            "city": self.city,
+            "district": self.district,
+            "reporting": len(self.reporting),
+            "elevated": len(self.elevated),
+            **{f"mean_{k}": v for k, v in self.reporting.means().items()},
+            "event_id": self.event["id"] if self.event else None,
+        }
+
+
+def _registry_area(device_id: str) -> Optional[tuple[str, str]]:
+    d = device_registry.get(device_id)
+    return (d.city, d.district) if d is not None and d.city else None
+
+
+class AreaCorrelator:
+    def __init__(
+        self,
+        window_seconds: float,
+        min_devices: int,
+        min_fraction: float,
+        events_keep: int,
+        area_of: Callable[[str], Optional[tuple[str, str]]] = _registry_area,
+    ):
+        self.window_seconds = window_seconds
+        self.min_devices = max(1, min_devices)
+        self.min_fraction = min_fraction
+        self.area_of = area_of
+        self.events: deque[dict] = deque(maxlen=max(1, events_keep))   # newest last, open ones included
+        self._areas: dict[tuple, _Area] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.observed = 0
+        self.opened = {level: 0 for level in LEVELS}
+
+    def _area(self, level: str, city: str, district: Optional[str]) -> _Area:
+        key = (level, city, district)
+        area = self._areas.get(key)
+        if area is None:
+            area = self._areas[key] = _Area(level, city, district)
+        return area
+
+    def observe(self, r, now: Optional[float] = None) -> None:
+        """Account one reading (Measurement / LatestReading) to its district and city"""
+        where = self.area_of(r.device_id)
+        if where is None or r.ts is None:
+            return
+        now = time.time() if now is None else now
+        t = min(_epoch(r.ts), now)
+        cutoff = now - self.window_seconds
+        if t < cutoff:
+            return   # backfill: too old to say anything about the present
+        city, district = where
+        values = (r.aq_score, r.eco2_ppm, r.tvoc_ppb)
+        elevated = is_elevated(r)
+        with self._lock:
+            self.observed += 1
+            areas = [self._area("city", city, None)]
+            if district:
+                areas.append(self._area("district", city, district))
+            for area in areas:
+                area.reporting.touch(r.device_id, t, values)
+                if elevated:
+                    area.elevated.touch(r.device_id, t)
+                    if area.event is not None:
+                        area.event["devices"].add(r.device_id)
+                self._evaluate(area, cutoff, now)
+
+    def _evaluate(self, area: _Area, cutoff: float, now: float) -> None:
+        area.reporting.expire(cutoff)
+        area.elevated.expire(cutoff)
+        elevated, reporting = len(area.elevated), len(area.reporting)
+        agree = elevated >= self.min_devices and elevated >= self.min_fraction * reporting
+        event = area.event
+        if agree and event is None:
+            event = area.event = {
+                "id": next(self._ids), "level": area.level, "city": area.city, "district": area.district,
+                "started_at": now, "ended_at": None, "peak_elevated": 0, "devices": set(area.elevated.last),
+            }
+            self.events.append(event)
+            self.opened[area.level] += 1
+            where = f"{area.city}/{area.district}" if area.district else area.city
+            logger.warning(f"🚨 Area event #{event['id']} in {where}: {elevated}/{reporting} devices elevated")
+        if event is None:
+            return
+        event["elevated"] = elevated
+        event["reporting"] = reporting
+        event["peak_elevated"] = max(event["peak_elevated"], elevated)
+        event.update({f"mean_{k}": v for k, v in area.reporting.means().items()})
+        if not agree:
+            event["ended_at"] = now
+            area.event = None
+            logger.info(f"✅ Area event #{event['id']} ended ({event['peak_elevated']} devices at peak)")
+
+    def tick(self, now: Optional[float] = None) -> None:
+        """Expire windows of areas that stopped reporting; closes their events"""
+        now = time.time() if now is None else now
+        cutoff = now - self.window_seconds
+        with self._lock:
+            for key, area in list(self._areas.items()):
+                self._evaluate(area, cutoff, now)
+                if not area.reporting and area.event is None:
+                    del self._areas[key]
+
+    # ---------- reads ----------
+
+    def summaries(self, level: str = "district", city: Optional[str] = None) -> list[dict]:
+        now = time.time()
+        with self._lock:
+            items = []
+            for area in self._areas.values():
+                if area.level != level or (city and area.city != city):
+                    continue
+                self._evaluate(area, now - self.window_seconds, now)
+                items.append(area.summary())
+        return sorted(items, key=lambda a: (-a["elevated"], a["city"], a["district"] or ""))
+
+    def list_events(
+        self,
+        level: Optional[str] = None,
+        city: Optional[str] = None,
+        district: Optional[str] = None,
+        active_only: bool = False,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Area events, newest first"""
+        with self._lock:
+            out = []
+            for e in reversed(self.events):
+                if (level and e["level"] != level) or (city and e["city"] != city) \
+                        or (district and e["district"] != district) or (active_only and e["ended_at"] is not None):
+                    continue
+                out.append({**e, "devices": sorted(e["devices"])})
+                if len(out) >= limit:
+                    break
+        return out
+
+    def active(self) -> int:
+        return sum(1 for a in self._areas.values() if a.event is not None)
+
+
+area_correlator = AreaCorrelator(
+    settings.CORRELATOR_WINDOW_SECONDS,
+    settings.CORRELATOR_MIN_DEVICES,
+    settings.CORRELATOR_MIN_FRACTION,
+    settings.CORRELATOR_EVENTS_KEEP,
+)
+
+
+def _on_latest(device_id: str) -> None:
+    reading = latest_state.get(device_id)
+    if reading is not None:
+        area_correlator.observe(reading)
+
+
+latest_state.subscribe(_on_latest)
+
+
+async def run_ticker(interval_seconds: float) -> None:
+    """Background task: close events of areas whose devices went quiet"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            area_correlator.tick()
+        except Exception as e:
+            logger.error(f"❌ Area correlator tick failed: {e}", exc_info=True)
+
+
+registry.counter("aq_area_events_total", "Area events opened by the correlator", ("level",),
+                 fn=lambda: [((level,), n) for level, n in area_correlator.opened.items()])
+registry.gauge("aq_area_events_active", "Area events currently open",
+               fn=lambda: [((), area_correlator.active())])
@@ -1,12 +1,17 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import select, desc
 from datetime import datetime, timezone
-from .models import Measurement, Device
+from .models import AlertEvent, Device, Forecast, ForecastAccuracy, Measurement
 from .schemas import IngestPayload, DeviceCreate
 from .alerts import evaluate_alert
+from .latest_state import latest_state
+from .rules import rule_engine
+from . import anomaly
+from .metrics import ALERT_EVAL_SECONDS, DB_COMMIT_SECONDS, since
+import time
 
 
-def create_measurement(db: Session, payload: IngestPayload) -> Measurement:
+def _new_measurement(db: Session, payload: IngestPayload) -> Measurement:
     ts = payload.ts or datetime.now(timezone.utc)
     m = Measurement(
         device_id=payload.device_id,
@@ -20,20 +25,79 @@ def create_measurement(db: Session, payload: IngestPayload) -> Measurement:
         snr=payload.snr,
         
     )
+    t0 = time.perf_counter()
     alert = evaluate_alert(db, payload.device_id, ts, payload.tvoc_ppb, payload.eco2_ppm)
+    ALERT_EVAL_SECONDS.observe(since(t0))
     m.score = alert.score
     m.status = alert.status
+    return m
+
+def create_measurement(db: Session, payload: IngestPayload) -> Measurement:
+    m = _new_measurement(db, payload)
+    anomaly.observe([m])
 
+    t0 = time.perf_counter()
     db.add(m)
     db.commit()
+    DB_COMMIT_SECONDS.observe(since(t0), "http")
     db.refresh(m)
+    latest_state.update(m)
     return m
 
+def create_measurements(db: Session, payloads: list[IngestPayload]) -> list[Measurement]:
+    """
+    Many readings in one transaction. Alerts are evaluated first (reads
+    only) so the write lock is held just for the insert + commit; deltas
+    compare against what was committed before the batch.
+    """
+    rows = [_new_measurement(db, payload) for payload in payloads]
+    return store_measurements(db, rows, "http_batch")
+
+def store_measurements(db: Session, rows: list[Measurement], path: str, gateway: bool = False) -> list[Measurement]:
+    """Insert ready rows (status already set) in one transaction; `gateway`: per-device rules may replace it"""
+    if gateway:
+        rule_engine.apply(rows)
+    anomaly.observe(rows)
+    t0 = time.perf_counter()
+    db.add_all(rows)
+    expire, db.expire_on_commit = db.expire_on_commit, False  # no per-row reload after commit
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire
+    DB_COMMIT_SECONDS.observe(since(t0), path)
+    for m in rows:
+        latest_state.update(m)
+    return rows
+
 def get_latest(db: Session, device_id: str) -> Measurement | None:
     stmt = select(Measurement).where(Measurement.device_id == device_id).order_by(desc(Measurement.ts)).limit(1)
     return db.execute(stmt).scalars().first()
 
+def get_latest_many(db: Session, device_ids: list[str]) -> dict[str, Measurement]:
+    """Latest measurement for many devices in one statement (one index seek per device)"""
+    if not device_ids:
+        return {}
+    latest_id = (
+        select(Measurement.id)
+        .where(Measurement.device_id == Device.device_id)
+        .order_by(desc(Measurement.ts))
+        .limit(1)
+        .scalar_subquery()
+    )
+    ids = select(latest_id).where(Device.device_id.in_(device_ids))
+    stmt = select(Measurement).where(Measurement.id.in_(ids))
+    return {m.device_id: m for m in db.execute(stmt).scalars().all()}
+
+def to_naive_utc(ts: datetime | None) -> datetime | None:
+    """Stored timestamps are naive UTC; aware bounds must be converted before they are compared"""
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
 def get_history(db: Session, device_id: str, start, end, limit: int) -> list[Measurement]:
+    start, end = to_naive_utc(start), to_naive_utc(end)
     stmt = select(Measurement).where(Measurement.device_id == device_id)
     if start:
         stmt = stmt.where(Measurement.ts >= start)
@@ -43,6 +107,149 @@ def get_history(db: Session, device_id: str, start, end, limit: int) -> list[Mea
     return list(db.execute(stmt).scalars().all())
 
 
+def get_alert_events(db: Session, device_id: str | None, start: datetime, limit: int) -> list[AlertEvent]:
+    """Stored fast-path alert events, newest first"""
+    stmt = select(AlertEvent).where(AlertEvent.ts >= start)
+    if device_id:
+        stmt = stmt.where(AlertEvent.device_id == device_id)
+    stmt = stmt.order_by(desc(AlertEvent.ts)).limit(limit)
+    return list(db.execute(stmt).scalars().all())
+
+
+def get_forecasts(db: Session, device_id: str, after: datetime) -> list[Forecast]:
+    """Server forecasts of hours from `after` on, soonest first"""
+    stmt = (
+        select(Forecast)
+        .where(Forecast.device_id == device_id, Forecast.target_hour >= after)
+        .order_by(Forecast.target_hour)
+    )
+    return list(db.execute(stmt).scalars().all())
+
+
+def get_forecast_accuracy(
+    db: Session, device_id: str | None, source: str | None, metric: str | None, limit: int
+) -> list[ForecastAccuracy]:
+    """Running forecast error sums, worst mean absolute error first"""
+    stmt = select(ForecastAccuracy).where(ForecastAccuracy.n > 0)
+    if device_id:
+        stmt = stmt.where(ForecastAccuracy.device_id == device_id)
+    if source:
+        stmt = stmt.where(ForecastAccuracy.source == source)
+    if metric:
+        stmt = stmt.where(ForecastAccuracy.metric == metric)
+    stmt = stmt.order_by(desc(ForecastAccuracy.sum_abs_err / ForecastAccuracy.n)).limit(limit)
+    return list(db.execute(stmt).scalars().all())
+
+
+def _sqlite_ts(ts: datetime) -> str:
+    """Same text format SQLAlchemy stores DateTime columns in (naive UTC)"""
+    return to_naive_utc(ts).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def get_history_columns(db: Session, device_id: str, start, end, limit: int, metric: str) -> list[tuple]:
+    """
+    Lightweight columnar fetch for downsampling: rows of (id, epoch_s, metric, alert).
+    Goes straight to the DBAPI cursor - no ORM objects or Row wrappers - and
+    converts timestamps inside SQLite. `metric` must be a whitelisted column name.
+    """
+    sql = (
+        f"SELECT id, (julianday(ts) - 2440587.5) * 86400.0, {metric}, alert "
+        "FROM measurements WHERE device_id = ?"
+    )
+    params: list = [device_id]
+    if start:
+        sql += " AND ts >= ?"
+        params.append(_sqlite_ts(start))
+    if end:
+        sql += " AND ts <= ?"
+        params.append(_sqlite_ts(end))
+    sql += " ORDER BY ts ASC LIMIT ?"
+    params.append(limit)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+# Column order of raw exports; ts is epoch microseconds (exact, from the stored text)
+EXPORT_COLUMNS = [
+    "device_id", "ts", "temp_c", "hum_rh", "pressure_hpa", "tvoc_ppb", "eco2_ppm",
+    "rssi", "snr", "aq_score", "pred_eco2_60m", "pred_tvoc_60m",
+    "anom_eco2", "anom_tvoc", "alert", "status", "sample_ms", "frame_counter",
+]
+_EXPORT_SELECT = ", ".join(
+    "CAST(strftime('%s', ts) AS INTEGER) * 1000000 + CAST(substr(ts, 21, 6) AS INTEGER)" if c == "ts" else c
+    for c in EXPORT_COLUMNS
+)
+
+
+def _fetch_batches(db: Session, sql: str, params: list, batch_size: int) -> list[list[tuple]]:
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        batches = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return batches
+            batches.append(rows)
+    finally:
+        cursor.close()
+
+
+def export_measurement_batches(
+    db: Session,
+    device_ids: list[str] | None,
+    start,
+    end,
+    limit: int,
+    batch_size: int = 65536,
+) -> list[list[tuple]]:
+    """Raw EXPORT_COLUMNS rows in time order, as DBAPI tuple batches"""
+    sql = f"SELECT {_EXPORT_SELECT} FROM measurements WHERE 1 = 1"
+    params: list = []
+    if device_ids is not None:
+        if not device_ids:
+            return []
+        sql += f" AND device_id IN ({', '.join('?' * len(device_ids))})"
+        params.extend(device_ids)
+    if start:
+        sql += " AND ts >= ?"
+        params.append(_sqlite_ts(start))
+    if end:
+        sql += " AND ts <= ?"
+        params.append(_sqlite_ts(end))
+    sql += " ORDER BY ts ASC LIMIT ?"
+    params.append(limit)
+    return _fetch_batches(db, sql, params, batch_size)
+
+
+def export_measurement_batches_by_ids(db: Session, ids: list[int], chunk: int = 10000) -> list[list[tuple]]:
+    """Raw EXPORT_COLUMNS rows for selected ids; ids are expected in time order"""
+    batches = []
+    for i in range(0, len(ids), chunk):
+        part = ids[i:i + chunk]
+        sql = (
+            f"SELECT {_EXPORT_SELECT} FROM measurements "
+            f"WHERE id IN ({', '.join('?' * len(part))}) ORDER BY ts ASC"
+        )
+        batches.extend(_fetch_batches(db, sql, part, chunk))
+    return batches
+
+
+def get_measurements_by_ids(db: Session, ids: list[int], chunk: int = 10000) -> list[Measurement]:
+    """Full rows for selected ids, in time order"""
+    out: list[Measurement] = []
+    for i in range(0, len(ids), chunk):
+        stmt = select(Measurement).where(Measurement.id.in_(ids[i:i + chunk]))
+        out.extend(db.execute(stmt).scalars().all())
+    out.sort(key=lambda m: m.ts)
+    return out
+
+
 # Device CRUD fonksiyonları
 
 def create_device(db: Session, device: DeviceCreate) -> Device:
@@ -61,39 +268,7 @@ def create_device(db: Session, device: DeviceCreate) -> Device:
     return db_device
 
 
-def get_device(db: Session, device_id: str) -> Device | None:
-    """Cihaz bilgilerini getir"""
-    stmt = select(Device).where(Device.device_id == device_id)
-    return db.execute(stmt).scalars().first()
-
-
 def get_all_devices(db: Session) -> list[Device]:
     """Tüm cihazları getir"""
     stmt = select(Device)
     return list(db.execute(stmt).scalars().all())
-
-
-def get_devices_by_city(db: Session, city: str) -> list[Device]:
-    """Belirli bir ildeki cihazları getir"""
-    stmt = select(Device).where(Device.city == city)
-    return list(db.execute(stmt).scalars().all())
-
-
-def get_devices_by_district(db: Session, city: str, district: str) -> list[Device]:
-    """Belirli bir ilçedeki cihazları getir"""
-    stmt = select(Device).where(Device.city == city).where(Device.district == district)
-    return list(db.execute(stmt).scalars().all())
-
-
-def get_all_cities(db: Session) -> list[str]:
-    """Tüm illeri getir"""
-    stmt = select(Device.city).distinct()
-    cities = db.execute(stmt).scalars().all()
-    return sorted([c for c in cities if c])
-
-
-def get_districts_by_city(db: Session, city: str) -> list[str]:
-    """Belirli bir ilin ilçelerini getir"""
-    stmt = select(Device.district).where(Device.city == city).distinct()
-    districts = db.execute(stmt).scalars().all()
-    return sorted([d for d in districts if d])
\ No newline at end of file
@@ -1,26 +1,53 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
+from .metrics import count_sql
+from . import profiling
+
 # ✅ Config import'unu DÜZELTTİK
 try:
     from .config import settings
     db_path = settings.DB_PATH
+    db_wal = settings.DB_WAL
+    db_profiling = settings.PROFILING_ENABLED
 except AttributeError:
     # Fallback if settings not loaded properly
     db_path = "./data/air_quality.db"
+    db_wal = True
+    db_profiling = False
 
 # ✅ Directory oluşturma
 db_dir = os.path.dirname(db_path)
 if db_dir:
     os.makedirs(db_dir, exist_ok=True)
 
+connect_args = {"check_same_thread": False}
+if db_profiling:
+    connect_args["factory"] = profiling.CountingConnection  # rows fetched per request
+
 engine = create_engine(
     f"sqlite:///{db_path}",
-    connect_args={"check_same_thread": False},
+    connect_args=connect_args,
     future=True,
 )
 
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    """WAL mode: long read queries must not block the ingest writer"""
+    if not db_wal:
+        return
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.close()
+
+# SQL statement counts for /metrics (per request via a ContextVar)
+event.listen(engine, "before_cursor_execute", count_sql)
+if db_profiling:
+    profiling.install(engine)
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
 class Base(DeclarativeBase):
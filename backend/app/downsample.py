@@ -0,0 +1,100 @@
+"""
+Shape-preserving downsampling for chart series.
+
+Both algorithms work on NumPy columns and return the *indices* of the
+points to keep, so the caller can fetch full rows only for those.
+
+- lttb:   Largest-Triangle-Three-Buckets. One Python step per output
+          bucket; all per-bucket work (next-bucket means, triangle areas)
+          is vectorized.
+- minmax: min and max of every bucket, fully vectorized (O(n)).
+
+Points that triggered an alert are always kept (see `keep_alerts`).
+"""
+from __future__ import annotations
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the LTTB selection; always keeps the first and last point"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    y = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+    # Bucket boundaries for the n-2 inner points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Mean point of every bucket in one pass; bucket i uses mean of bucket i+1
+    counts = np.maximum(ends - starts, 1)
+    mean_x = np.add.reduceat(x[:-1], starts) / counts
+    mean_y = np.add.reduceat(y[:-1], starts) / counts
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = starts[i], max(ends[i], starts[i] + 1)
+        ax, ay = x[a], y[a]
+        # Twice the triangle area (a, candidate, next-bucket mean)
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    out[-1] = n - 1
+    return out
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of each bucket's min and max (n_out // 2 buckets), in time order"""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    buckets = max(n_out // 2, 1)
+    width = -(-n // buckets)  # ceil
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, width)
+
+    lo = np.where(np.isnan(grid), np.inf, grid).argmin(axis=1)
+    hi = np.where(np.isnan(grid), -np.inf, grid).argmax(axis=1)
+    offsets = np.arange(buckets) * width
+    idx = np.concatenate([offsets + lo, offsets + hi, [0, n - 1]])
+    return np.unique(idx[idx < n])
+
+
+def keep_alerts(selected: np.ndarray, y: np.ndarray, alert: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Merge alert points into a selection.
+    All alert points are kept when they fit in max_points; otherwise the
+    alert points themselves are reduced with min/max so the spikes survive.
+    """
+    alert_idx = np.flatnonzero(alert)
+    if len(alert_idx) == 0:
+        return selected
+    if len(alert_idx) > max_points:
+        alert_idx = alert_idx[minmax(alert_idx.astype(np.float64), y[alert_idx], max_points)]
+    return np.union1d(selected, alert_idx)
+
+
+def downsample(x: np.ndarray, y: np.ndarray, alert: np.ndarray, max_points: int, method: str = "lttb") -> np.ndarray:
+    """
+    Pick at most ~max_points indices with the given method.
+    The budget left after alert points is what the method gets.
+    """
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+    n_alerts = int(np.count_nonzero(alert))
+    budget = max(max_points - n_alerts, 3)
+    if method == "minmax":
+        selected = minmax(x, y, budget)
+    else:
+        selected = lttb(x, y, budget)
+    return keep_alerts(selected, y, alert, max_points)
@@ -0,0 +1,206 @@
+"""
+Content negotiation for bulk read endpoints.
+
+Clients can ask for a compact binary body with the Accept header:
+
+- application/vnd.apache.arrow.stream  Arrow IPC stream (needs pyarrow)
+- application/x-msgpack                MessagePack {meta, columns, rows} (needs msgpack)
+- anything else                        JSON, gzip/brotli-compressed above GZIP_MIN_BYTES
+
+Binary bodies are built from raw column batches (DBAPI tuples), never from
+ORM or pydantic objects. Timestamps in binary bodies are epoch microseconds
+(Arrow: timestamp[us, UTC]).
+"""
+from __future__ import annotations
+
+import gzip
+import json
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from .config import settings
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # optional dependency
+    msgpack = None
+
+try:
+    import pyarrow as pa  # type: ignore
+except ImportError:  # optional dependency
+    pa = None
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional dependency
+    brotli = None
+
+
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+_ALIASES = {
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/vnd.apache.arrow.stream": ARROW,
+    "application/x-arrow": ARROW,
+}
+
+
+def available() -> list[str]:
+    out = [JSON]
+    if msgpack is not None:
+        out.append(MSGPACK)
+    if pa is not None:
+        out.append(ARROW)
+    return out
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Best supported media type for an Accept header (q-values honoured)"""
+    if not accept:
+        return JSON
+    supported = available()
+    best, best_q = JSON, 0.0
+    for part in accept.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        media = _ALIASES.get(fields[0].lower(), fields[0].lower())
+        q = 1.0
+        for f in fields[1:]:
+            if f.startswith("q="):
+                try:
+                    q = float(f[2:])
+                except ValueError:
+                    q = 0.0
+        if media in supported and media != JSON and q > best_q:
+            best, best_q = media, q
+        elif media in (JSON, "*/*", "application/*") and q > best_q:
+            best, best_q = JSON, q
+    return best
+
+
+# =========================================================
+# JSON (compressed above a threshold)
+# =========================================================
+
+def json_response(request: Request, model: BaseModel) -> Response:
+    body = model.model_dump_json().encode()
+    return compressed_json(request, body)
+
+
+def compressed_json(request: Request, body: bytes) -> Response:
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if len(body) >= settings.GZIP_MIN_BYTES:
+        accept_enc = request.headers.get("accept-encoding", "")
+        if brotli is not None and "br" in accept_enc:
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accept_enc:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type=JSON, headers=headers)
+
+
+# =========================================================
+# BINARY
+# =========================================================
+
+# Arrow types for the columns we export; unknown names are strings
+COLUMN_TYPES = {
+    "device_id": "string",
+    "ts": "timestamp",
+    "bucket_start": "timestamp",
+    "temp_c": "float64",
+    "hum_rh": "float64",
+    "pressure_hpa": "float64",
+    "tvoc_ppb": "int32",
+    "eco2_ppm": "int32",
+    "rssi": "int32",
+    "snr": "float64",
+    "aq_score": "int32",
+    "pred_eco2_60m": "int32",
+    "pred_tvoc_60m": "int32",
+    "anom_eco2": "bool",
+    "anom_tvoc": "bool",
+    "alert": "bool",
+    "status": "string",
+    "sample_ms": "int32",
+    "frame_counter": "int64",
+    "group": "string",
+    "city": "string",
+    "value": "float64",
+    "samples": "int64",
+}
+
+
+def _arrow_type(kind: str):
+    return {
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "float64": pa.float64(),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "bool": pa.bool_(),
+    }[kind]
+
+
+def _arrow_cast(array, name: str):
+    """Cast to the column's Arrow type; values that don't fit (a REAL in an Integer column) stay float64"""
+    try:
+        return array.cast(_arrow_type(COLUMN_TYPES.get(name, "string")))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return array
+
+
+def _arrow_batch(columns: list[str], rows: list[tuple], schema=None):
+    """
+    One record batch from DBAPI rows. pyarrow converts the tuples column by
+    column in C++: numbers are read as float64 (exact for anything SQLite
+    stores) and narrowed by _arrow_cast. Later batches follow `schema`.
+    """
+    read_as = {"string": pa.string(), "timestamp": pa.int64()}
+    struct = pa.struct([(name, read_as.get(COLUMN_TYPES.get(name, "string"), pa.float64())) for name in columns])
+    arrays = pa.array(rows, type=struct).flatten()
+    if schema is None:
+        return pa.record_batch([_arrow_cast(a, name) for a, name in zip(arrays, columns)], names=columns)
+    # The stream's types are fixed by the first batch; a later misfit is truncated
+    return pa.record_batch(
+        [a.cast(field.type, safe=False) for a, field in zip(arrays, schema)], schema=schema
+    )
+
+
+def arrow_ipc(columns: list[str], batches: list[list[tuple]], meta: dict) -> bytes:
+    """Arrow IPC stream; one record batch per fetched row batch, each written as soon as it is built"""
+    metadata = {k: json.dumps(v, default=str) for k, v in meta.items()}
+    sink = pa.BufferOutputStream()
+    writer = schema = None
+    for rows in batches:
+        if not rows:
+            continue
+        batch = _arrow_batch(columns, rows, schema)
+        if writer is None:
+            schema = batch.schema.with_metadata(metadata)
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(batch.replace_schema_metadata(metadata))
+    if writer is None:
+        fields = [pa.field(name, _arrow_type(COLUMN_TYPES.get(name, "string"))) for name in columns]
+        writer = pa.ipc.new_stream(sink, pa.schema(fields, metadata=metadata))
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+def msgpack_rows(columns: list[str], batches: Iterable[list[tuple]], meta: dict) -> bytes:
+    rows = [r for batch in batches for r in batch]
+    return msgpack.packb({"meta": meta, "columns": columns, "rows": rows}, default=str)
+
+
+def columnar_response(media_type: str, columns: list[str], batches: Iterable[list[tuple]], meta: dict) -> Response:
+    if media_type == ARROW:
+        body = arrow_ipc(columns, batches, meta)
+    else:
+        body = msgpack_rows(columns, batches, meta)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept, Accept-Encoding"})
@@ -0,0 +1,399 @@
+"""
+Hourly rollups, TinyML prediction scoring and server-side forecasts.
+
+Nodes running the TinyML model send pred_eco2_60m / pred_tvoc_60m with
+every reading, but nothing checked them, and devices without the model had
+no forecast at all. One batch job, run every FORECAST_JOB_SECONDS by a
+writing process (a lock file next to the database keeps it to one process
+at a time) or once with `python -m app.forecasting`, does in order:
+
+1. rollup:   measurements above the cursor are summed into `hourly_rollups`
+             per device and UTC hour, one INSERT ... SELECT ... ON CONFLICT
+             per FORECAST_CHUNK_ROWS ids
+2. tinyml:   predictions whose target has matured (ts + 60 min +
+             FORECAST_MATCH_MINUTES + FORECAST_LATE_SECONDS in the past)
+             are joined with the mean of the device's readings 60 +/-
+             FORECAST_MATCH_MINUTES later, one ix_device_ts range seek per
+             prediction. The cursor stops below the first prediction that
+             has not matured, so each one is scored exactly once
+3. server:   forecasts of hours that are now complete are joined with the
+             hour's rollup
+4. forecast: once per completed hour, damped additive Holt-Winters with a
+             24-hour season over the last FORECAST_HISTORY_HOURS rollup
+             hours of every device at once, as a (devices, hours) NumPy
+             matrix; the next FORECAST_HORIZON_HOURS hourly means go to
+             `forecasts`
+
+Errors are added to `forecast_accuracy` (count and sums of |e|, e^2, e and
+the actuals per device, source and metric) in the transaction that moves
+the step's cursor in `job_cursors`. Cursor moves are compare-and-set: a
+process that lost a race rolls back instead of counting twice.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+from .coordination import _default_lock_dir, _try_lock, _unlock
+from .crud import _sqlite_ts
+from .database import Base, engine
+from .metrics import FORECAST_STEP_SECONDS, registry, since
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("tinyml", "server")
+METRICS = ("eco2_ppm", "tvoc_ppb")
+SEASON = 24   # hours
+
+_ROLLUP_SQL = """
+INSERT INTO hourly_rollups (device_id, hour, samples, eco2_sum, eco2_n, eco2_max, tvoc_sum, tvoc_n, tvoc_max, alerts)
+SELECT device_id, substr(ts, 1, 13) || ':00:00.000000', count(*),
+       total(eco2_ppm), count(eco2_ppm), max(eco2_ppm), total(tvoc_ppb), count(tvoc_ppb), max(tvoc_ppb), total(alert)
+FROM measurements WHERE id > ? AND id <= ?
+GROUP BY device_id, substr(ts, 1, 13)
+ON CONFLICT (hour, device_id) DO UPDATE SET
+    samples = samples + excluded.samples,
+    eco2_sum = eco2_sum + excluded.eco2_sum,
+    eco2_n = eco2_n + excluded.eco2_n,
+    eco2_max = max(coalesce(eco2_max, excluded.eco2_max), coalesce(excluded.eco2_max, eco2_max)),
+    tvoc_sum = tvoc_sum + excluded.tvoc_sum,
+    tvoc_n = tvoc_n + excluded.tvoc_n,
+    tvoc_max = max(coalesce(tvoc_max, excluded.tvoc_max), coalesce(excluded.tvoc_max, tvoc_max)),
+    alerts = alerts + excluded.alerts
+"""
+
+_TINYML_SQL = """
+SELECT p.device_id, p.pred_eco2_60m, p.pred_tvoc_60m, avg(a.eco2_ppm), avg(a.tvoc_ppb)
+FROM measurements p
+JOIN measurements a ON a.device_id = p.device_id AND a.ts >= datetime(p.ts, ?) AND a.ts <= datetime(p.ts, ?)
+WHERE p.id > ? AND p.id <= ? AND (p.pred_eco2_60m IS NOT NULL OR p.pred_tvoc_60m IS NOT NULL)
+GROUP BY p.id
+"""
+
+_SERVER_SQL = """
+SELECT f.device_id, f.eco2_ppm, f.tvoc_ppb, r.eco2_sum / r.eco2_n, r.tvoc_sum / r.tvoc_n
+FROM forecasts f JOIN hourly_rollups r ON r.device_id = f.device_id AND r.hour = f.target_hour
+WHERE f.target_hour > ? AND f.target_hour <= ?
+"""
+
+_ACCURACY_SQL = """
+INSERT INTO forecast_accuracy (device_id, source, metric, n, sum_abs_err, sum_sq_err, sum_err, sum_actual, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (device_id, source, metric) DO UPDATE SET
+    n = n + excluded.n,
+    sum_abs_err = sum_abs_err + excluded.sum_abs_err,
+    sum_sq_err = sum_sq_err + excluded.sum_sq_err,
+    sum_err = sum_err + excluded.sum_err,
+    sum_actual = sum_actual + excluded.sum_actual,
+    updated_at = excluded.updated_at
+"""
+
+_FORECAST_SQL = """
+INSERT INTO forecasts (device_id, target_hour, horizon, eco2_ppm, tvoc_ppb, made_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (device_id, target_hour) DO UPDATE SET
+    horizon = excluded.horizon, eco2_ppm = excluded.eco2_ppm, tvoc_ppb = excluded.tvoc_ppb, made_at = excluded.made_at
+"""
+
+
+def _hour_text(epoch_hour: int) -> str:
+    return time.strftime("%Y-%m-%d %H:00:00.000000", time.gmtime(epoch_hour))
+
+
+def _last_complete_hour(now: datetime) -> int:
+    """Epoch start of the newest hour that ended FORECAST_LATE_SECONDS ago"""
+    t = now.timestamp() - settings.FORECAST_LATE_SECONDS
+    return int(t // 3600) * 3600 - 3600
+
+
+def _codes(device_ids) -> dict[str, int]:
+    """device_id -> 0..n-1 in first-seen order"""
+    index = dict.fromkeys(device_ids, 0)
+    for i, device_id in enumerate(index):
+        index[device_id] = i
+    return index
+
+
+# =========================================================
+# CURSORS
+# =========================================================
+
+def _position(cur, name: str) -> int:
+    row = cur.execute("SELECT position FROM job_cursors WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _advance(cur, name: str, old: int, new: int, stamp: str) -> bool:
+    """Compare-and-set the cursor inside the caller's transaction"""
+    cur.execute("INSERT OR IGNORE INTO job_cursors (name, position, updated_at) VALUES (?, 0, ?)", (name, stamp))
+    cur.execute("UPDATE job_cursors SET position = ?, updated_at = ? WHERE name = ? AND position = ?",
+                (new, stamp, name, old))
+    return cur.rowcount == 1
+
+
+def _accumulate(cur, source: str, rows: list[tuple], stamp: str) -> int:
+    """Add (device_id, pred_eco2, pred_tvoc, actual_eco2, actual_tvoc) errors to forecast_accuracy"""
+    if not rows:
+        return 0
+    device_ids, *columns = zip(*rows)
+    index = _codes(device_ids)
+    codes = np.fromiter(map(index.__getitem__, device_ids), np.int64, len(rows))
+    names = list(index)
+    values = np.array(columns, dtype=float)   # None -> NaN
+    out = []
+    for k, metric in enumerate(METRICS):
+        pred, actual = values[k], values[k + 2]
+        ok = ~(np.isnan(pred) | np.isnan(actual))
+        if not ok.any():
+            continue
+        err, c = pred[ok] - actual[ok], codes[ok]
+        n = np.bincount(c, minlength=len(names))
+        sums = [np.bincount(c, w, minlength=len(names)) for w in (np.abs(err), err * err, err, actual[ok])]
+        for i in np.flatnonzero(n):
+            out.append((names[i], source, metric, int(n[i]), *(float(s[i]) for s in sums), stamp))
+    cur.executemany(_ACCURACY_SQL, out)
+    return len(rows)
+
+
+# =========================================================
+# STEPS
+# =========================================================
+
+def rollup(raw, now: datetime) -> int:
+    """Step 1: fold new measurement ids into hourly_rollups; returns ids covered"""
+    cur = raw.cursor()
+    top = cur.execute("SELECT max(id) FROM measurements").fetchone()[0] or 0
+    lo = start = _position(cur, "rollup")
+    stamp = _sqlite_ts(now)
+    while lo < top:
+        hi = min(top, lo + settings.FORECAST_CHUNK_ROWS)
+        cur.execute(_ROLLUP_SQL, (lo, hi))
+        if not _advance(cur, "rollup", lo, hi, stamp):
+            raw.rollback()
+            break
+        raw.commit()
+        lo = hi
+    return lo - start
+
+
+def score_tinyml(raw, now: datetime) -> int:
+    """Step 2: score matured TinyML predictions; returns predictions scored"""
+    cur = raw.cursor()
+    match = settings.FORECAST_MATCH_MINUTES
+    matured = _sqlite_ts(now - timedelta(minutes=60 + match, seconds=settings.FORECAST_LATE_SECONDS))
+    lo = _position(cur, "tinyml")
+    top = cur.execute("SELECT max(id) FROM measurements").fetchone()[0] or 0
+    # Future timestamps (devices without a clock fix) are not waited for; they find no actuals
+    first_open = cur.execute(
+        "SELECT min(id) FROM measurements WHERE id > ? AND ts > ? AND ts <= ? "
+        "AND (pred_eco2_60m IS NOT NULL OR pred_tvoc_60m IS NOT NULL)",
+        (lo, matured, _sqlite_ts(now)),
+    ).fetchone()[0]
+    if first_open is not None:
+        top = min(top, first_open - 1)
+    window = (f"+{60 - match} minutes", f"+{60 + match} minutes")
+    stamp = _sqlite_ts(now)
+    scored = 0
+    while lo < top:
+        hi = min(top, lo + settings.FORECAST_CHUNK_ROWS)
+        rows = cur.execute(_TINYML_SQL, (*window, lo, hi)).fetchall()
+        n = _accumulate(cur, "tinyml", rows, stamp)
+        if not _advance(cur, "tinyml", lo, hi, stamp):
+            raw.rollback()
+            break
+        raw.commit()
+        scored += n
+        lo = hi
+    return scored
+
+
+def score_server(raw, now: datetime) -> int:
+    """Step 3: score forecasts of hours completed since the last pass"""
+    cur = raw.cursor()
+    last = _last_complete_hour(now)
+    lo = _position(cur, "server")
+    if last <= lo:
+        return 0
+    stamp = _sqlite_ts(now)
+    rows = cur.execute(_SERVER_SQL, (_hour_text(lo), _hour_text(last))).fetchall()
+    n = _accumulate(cur, "server", rows, stamp)
+    if not _advance(cur, "server", lo, last, stamp):
+        raw.rollback()
+        return 0
+    raw.commit()
+    return n
+
+
+def holt_winters(y: np.ndarray, first_hour: int, horizon: int,
+                 alpha: float, beta: float, gamma: float, phi: float) -> np.ndarray:
+    """
+    Damped additive Holt-Winters with a 24-hour season for every row of
+    `y` (devices, hours, NaN = no data) at once. `first_hour` is the epoch
+    start of column 0. Hours without data only advance level and trend.
+    Returns (devices, horizon) forecasts of the hours after the last column.
+    """
+    d, t = y.shape
+    seen = ~np.isnan(y)
+    level = np.where(seen, y, 0.0).sum(1) / np.maximum(seen.sum(1), 1)
+    hod = (first_hour // 3600 + np.arange(t)) % SEASON
+    season = np.zeros((d, SEASON))
+    for h in range(SEASON):
+        cols = hod == h
+        dev = np.where(seen[:, cols], y[:, cols] - level[:, None], 0.0)
+        season[:, h] = dev.sum(1) / np.maximum(seen[:, cols].sum(1), 1)
+    trend = np.zeros(d)
+    for j in range(t):
+        h = hod[j]
+        obs, ok, s = y[:, j], seen[:, j], season[:, h]
+        expected = level + phi * trend
+        new_level = np.where(ok, alpha * (obs - s) + (1 - alpha) * expected, expected)
+        trend = np.where(ok, beta * (new_level - level) + (1 - beta) * phi * trend, phi * trend)
+        season[:, h] = np.where(ok, gamma * (obs - new_level) + (1 - gamma) * s, s)
+        level = new_level
+    damp = np.cumsum(phi ** np.arange(1, horizon + 1))
+    ahead = (hod[-1] + 1 + np.arange(horizon)) % SEASON if t else np.zeros(horizon, int)
+    return np.maximum(level[:, None] + damp[None, :] * trend[:, None] + season[:, ahead], 0.0)
+
+
+def _load_hours(cur, first: int, hours: int) -> tuple[list[str], np.ndarray]:
+    """Rollup means as a (metric, device, hour) matrix, NaN where there is no data"""
+    index: dict[str, int] = {}
+    add = index.setdefault
+    parts = []
+    # One query per hour: rows arrive in key order, and only one hour's tuples are alive at a time
+    for j in range(hours):
+        rows = cur.execute(
+            "SELECT device_id, eco2_sum / eco2_n, tvoc_sum / tvoc_n FROM hourly_rollups WHERE hour = ?",
+            (_hour_text(first + j * 3600),),
+        ).fetchall()
+        if rows:
+            device_ids, eco2, tvoc = zip(*rows)
+            codes = np.fromiter((add(d, len(index)) for d in device_ids), np.int64, len(rows))
+            parts.append((j, codes, np.array((eco2, tvoc), dtype=float)))   # None -> NaN
+    y = np.full((len(METRICS), len(index), hours), np.nan)
+    for j, codes, values in parts:
+        y[:, codes, j] = values
+    return list(index), y
+
+
+def forecast(raw, now: datetime) -> int:
+    """Step 4: once per completed hour, forecast every device with enough rollups; returns devices"""
+    cur = raw.cursor()
+    last = _last_complete_hour(now)
+    done = _position(cur, "forecast")
+    if last <= done:
+        return 0
+    hours = settings.FORECAST_HISTORY_HOURS
+    first = last - (hours - 1) * 3600
+    names, y = _load_hours(cur, first, hours)
+    seen = ~np.isnan(y)
+    # Enough history, and not silent for a whole season
+    keep = (seen.sum(2) >= settings.FORECAST_MIN_HOURS) & seen[:, :, -SEASON:].any(2)
+    horizon = settings.FORECAST_HORIZON_HOURS
+    out = np.full((len(METRICS), len(names), horizon), np.nan)
+    for k in range(len(METRICS)):
+        if keep[k].any():
+            out[k, keep[k]] = holt_winters(
+                y[k, keep[k]], first, horizon, settings.FORECAST_ALPHA, settings.FORECAST_BETA,
+                settings.FORECAST_GAMMA, settings.FORECAST_PHI,
+            )
+    devices = np.flatnonzero(keep.any(0))
+    values = np.round(out[:, devices], 1)
+    stamp = _sqlite_ts(now)
+    params = [
+        (names[i], _hour_text(last + (h + 1) * 3600), h + 1,
+         *(None if np.isnan(v) else float(v) for v in values[:, j, h]), stamp)
+        for j, i in enumerate(devices) for h in range(horizon)
+    ]
+    cur.executemany(_FORECAST_SQL, params)
+    cur.execute("DELETE FROM forecasts WHERE target_hour < ?",
+                (_sqlite_ts(now - timedelta(days=settings.FORECAST_KEEP_DAYS)),))
+    if not _advance(cur, "forecast", done, last, stamp):
+        raw.rollback()
+        return 0
+    raw.commit()
+    return len(devices)
+
+
+# =========================================================
+# JOB
+# =========================================================
+
+STEPS = (("rollup", rollup), ("tinyml", score_tinyml), ("server", score_server), ("forecast", forecast))
+
+totals = {"passes": 0, "tinyml": 0, "server": 0, "devices": 0}   # devices: last forecast step
+
+
+def run_pass(bind=None, now: Optional[datetime] = None) -> dict:
+    """One pass of all steps; `bind` defaults to the app engine"""
+    now = now or datetime.now(timezone.utc)
+    raw = (bind or engine).raw_connection()
+    result: dict = {"seconds": {}}
+    try:
+        for name, step in STEPS:
+            t0 = time.perf_counter()
+            result[name] = step(raw, now)
+            result["seconds"][name] = round(since(t0), 3)
+            FORECAST_STEP_SECONDS.observe(since(t0), name)
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    totals["passes"] += 1
+    totals["tinyml"] += result["tinyml"]
+    totals["server"] += result["server"]
+    if result["forecast"]:
+        totals["devices"] = result["forecast"]
+    return result
+
+
+def run_locked() -> Optional[dict]:
+    """run_pass() unless another process holds the job lock (then None)"""
+    lock_dir = _default_lock_dir()
+    os.makedirs(lock_dir, exist_ok=True)
+    fh = _try_lock(os.path.join(lock_dir, "forecast.lock"))
+    if fh is None:
+        return None
+    try:
+        return run_pass()
+    finally:
+        _unlock(fh)
+
+
+async def run_job(interval_seconds: float) -> None:
+    """Background task: one pass every interval"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            result = await asyncio.to_thread(run_locked)
+        except Exception as e:
+            logger.error(f"❌ Forecasting pass failed: {e}", exc_info=True)
+            continue
+        if result is not None and (result["tinyml"] or result["server"] or result["forecast"]):
+            logger.info(
+                f"📈 Forecasting pass: {result['tinyml']} TinyML / {result['server']} server predictions scored, "
+                f"{result['forecast']} devices forecast in {sum(result['seconds'].values()):.2f}s"
+            )
+
+
+registry.counter("aq_forecast_scored_total", "Predictions scored against actuals", ("source",),
+                 fn=lambda: [((source,), totals[source]) for source in SOURCES])
+registry.gauge("aq_forecast_devices", "Devices forecast by this process's last forecast step",
+               fn=lambda: [((), totals["devices"])] if totals["passes"] else [])
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="One forecasting job pass: rollups, TinyML / server scoring, forecasts").parse_args()
+    logging.basicConfig(level=logging.INFO)
+    Base.metadata.create_all(bind=engine)
+    print(json.dumps(run_locked() or {"skipped": "another process holds the forecasting lock"}, indent=2))
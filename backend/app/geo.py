@@ -0,0 +1,395 @@
+"""
+In-memory spatial indexes for the map.
+
+Devices are bucketed into a lat/lon grid at every zoom level up to
+MAP_CLUSTER_MAX_ZOOM. A cell at zoom z is 1/MAP_CLUSTER_CELLS_PER_TILE of a
+web-map tile, so the per-level buckets double as precomputed clusters:
+a viewport query only touches the cells that intersect the bbox. Each cell
+also counts its members' latest statuses and aq_scores, kept current by a
+latest_state listener, so cluster status and worst score need no lookups.
+
+Nearest-sensor lookups use a KD-tree over unit vectors, rebuilt
+copy-on-write whenever a device is added.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .config import settings
+from .latest_state import latest_state
+from .registry import device_registry
+
+
+@dataclass(frozen=True)
+class BBox:
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+
+    def contains(self, lat: float, lon: float) -> bool:
+        return self.min_lat <= lat <= self.max_lat and self.min_lon <= lon <= self.max_lon
+
+
+@dataclass
+class GridCell:
+    """One grid bucket; also the cluster returned to the map"""
+    key: tuple[int, int]
+    device_ids: list[str] = field(default_factory=list)
+    lat_sum: float = 0.0
+    lon_sum: float = 0.0
+    statuses: Counter = field(default_factory=Counter)   # latest status -> members
+    scores: Counter = field(default_factory=Counter)     # latest aq_score -> members
+
+    @property
+    def count(self) -> int:
+        return len(self.device_ids)
+
+    @property
+    def status(self) -> str:
+        return worst_status(self.statuses)
+
+    @property
+    def worst_score(self) -> Optional[int]:
+        return min(self.scores) if self.scores else None
+
+    @property
+    def lat(self) -> float:
+        return self.lat_sum / self.count
+
+    @property
+    def lon(self) -> float:
+        return self.lon_sum / self.count
+
+
+def cell_size(zoom: int) -> float:
+    """Cell edge in degrees at a zoom level"""
+    return 360.0 / (2 ** zoom) / settings.MAP_CLUSTER_CELLS_PER_TILE
+
+
+def cell_key(lat: float, lon: float, size: float) -> tuple[int, int]:
+    return math.floor((lon + 180.0) / size), math.floor((lat + 90.0) / size)
+
+
+def _reading_summary(device_id: str) -> tuple[str, Optional[int]]:
+    """(status, aq_score) a device contributes to its cells"""
+    reading = latest_state.get(device_id)
+    if reading is None:
+        return "NO_DATA", None
+    return reading.status or "NO_DATA", reading.aq_score
+
+
+def _count(counter: Counter, key, delta: int) -> None:
+    if key is None:
+        return
+    counter[key] += delta
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class GridIndex:
+    """Multi-level grid index over device coordinates"""
+
+    def __init__(self, max_zoom: int):
+        self.max_zoom = max_zoom
+        self._sizes = [cell_size(z) for z in range(max_zoom + 1)]
+        self._levels: list[dict[tuple[int, int], GridCell]] = [{} for _ in self._sizes]
+        self._coords: dict[str, tuple[float, float]] = {}
+        self._summaries: dict[str, tuple[str, Optional[int]]] = {}   # what each device is counted as
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._coords)
+
+    def rebuild(self, devices: Iterable) -> None:
+        """Replace the whole index (startup)"""
+        with self._lock:
+            self._levels = [{} for _ in self._sizes]
+            self._coords = {}
+            self._summaries = {}
+            for device in devices:
+                self._insert(device.device_id, device.lat, device.lon)
+
+    def add(self, device) -> None:
+        """Insert or move a single device"""
+        with self._lock:
+            if device.device_id in self._coords:
+                self._remove(device.device_id)
+            self._insert(device.device_id, device.lat, device.lon)
+
+    def remove(self, device_id: str) -> None:
+        with self._lock:
+            if device_id in self._coords:
+                self._remove(device_id)
+
+    def observe(self, device_id: str) -> None:
+        """Move a device's counts to its current latest reading (latest_state listener)"""
+        with self._lock:
+            old = self._summaries.get(device_id)
+            if old is None:
+                return
+            new = _reading_summary(device_id)
+            if new == old:
+                return
+            self._summaries[device_id] = new
+            lat, lon = self._coords[device_id]
+            for size, level in zip(self._sizes, self._levels):
+                cell = level[cell_key(lat, lon, size)]
+                _count(cell.statuses, old[0], -1)
+                _count(cell.scores, old[1], -1)
+                _count(cell.statuses, new[0], 1)
+                _count(cell.scores, new[1], 1)
+
+    def _insert(self, device_id: str, lat: float, lon: float) -> None:
+        if lat is None or lon is None:
+            return
+        self._coords[device_id] = (lat, lon)
+        status, score = self._summaries[device_id] = _reading_summary(device_id)
+        for size, level in zip(self._sizes, self._levels):
+            key = cell_key(lat, lon, size)
+            cell = level.get(key)
+            if cell is None:
+                cell = level[key] = GridCell(key=key)
+            cell.device_ids.append(device_id)
+            cell.lat_sum += lat
+            cell.lon_sum += lon
+            _count(cell.statuses, status, 1)
+            _count(cell.scores, score, 1)
+
+    def _remove(self, device_id: str) -> None:
+        lat, lon = self._coords.pop(device_id)
+        status, score = self._summaries.pop(device_id)
+        for size, level in zip(self._sizes, self._levels):
+            key = cell_key(lat, lon, size)
+            cell = level[key]
+            cell.device_ids.remove(device_id)
+            cell.lat_sum -= lat
+            cell.lon_sum -= lon
+            _count(cell.statuses, status, -1)
+            _count(cell.scores, score, -1)
+            if not cell.device_ids:
+                del level[key]
+
+    def _cells_in(self, bbox: BBox, zoom: int) -> list[GridCell]:
+        size = self._sizes[zoom]
+        level = self._levels[zoom]
+        x0, y0 = cell_key(bbox.min_lat, bbox.min_lon, size)
+        x1, y1 = cell_key(bbox.max_lat, bbox.max_lon, size)
+        span = (x1 - x0 + 1) * (y1 - y0 + 1)
+        # Walk whichever is smaller: the bbox cell range or the occupied cells
+        if span <= len(level):
+            cells = (level.get((x, y)) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+            return [c for c in cells if c is not None]
+        return [c for (x, y), c in level.items() if x0 <= x <= x1 and y0 <= y <= y1]
+
+    def query_points(self, bbox: BBox) -> list[str]:
+        """device_ids inside the bbox"""
+        with self._lock:
+            out = []
+            for cell in self._cells_in(bbox, self.max_zoom):
+                for device_id in cell.device_ids:
+                    lat, lon = self._coords[device_id]
+                    if bbox.contains(lat, lon):
+                        out.append(device_id)
+            return out
+
+    def query_clusters(self, bbox: BBox, zoom: int) -> list[GridCell]:
+        """
+        Precomputed cells intersecting the bbox at `zoom`.
+        Returned cells are snapshots, safe to use after the lock is released.
+        """
+        zoom = max(0, min(zoom, self.max_zoom))
+        with self._lock:
+            return [
+                GridCell(key=c.key, device_ids=list(c.device_ids), lat_sum=c.lat_sum, lon_sum=c.lon_sum,
+                         statuses=Counter(c.statuses), scores=Counter(c.scores))
+                for c in self._cells_in(bbox, zoom)
+            ]
+
+
+geo_index = GridIndex(settings.MAP_CLUSTER_MAX_ZOOM)
+
+
+# =========================================================
+# CLUSTER SUMMARY
+# =========================================================
+
+STATUS_SEVERITY = {"NO_DATA": 0, "OK": 1, "NORMAL": 1, "WARN": 2, "HIGH": 3}
+
+
+def worst_status(statuses: Iterable[Optional[str]]) -> str:
+    worst = "NO_DATA"
+    for status in statuses:
+        status = status or "NO_DATA"
+        if STATUS_SEVERITY.get(status, 0) > STATUS_SEVERITY.get(worst, 0):
+            worst = status
+    return worst
+
+
+def worst_score(scores: Iterable[Optional[int]]) -> Optional[int]:
+    """aq_score is 100 = clean air, so the worst is the lowest"""
+    vals = [s for s in scores if s is not None]
+    return min(vals) if vals else None
+
+
+# =========================================================
+# NEAREST-NEIGHBOUR INDEX
+# =========================================================
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def unit_vectors(lats, lons) -> np.ndarray:
+    """Lat/lon (degrees) -> unit vectors; chord distance is monotonic in great-circle distance"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+def km_to_chord(km: float) -> float:
+    return 2.0 * math.sin(min(km / (2.0 * EARTH_RADIUS_KM), math.pi / 2))
+
+
+class KDTree:
+    """
+    Immutable 3-d KD-tree over device unit vectors.
+    Implicit layout: the node of segment [lo, hi) is perm[(lo + hi) // 2].
+    """
+    LEAF_SIZE = 16
+
+    def __init__(self, device_ids: list[str], lats, lons):
+        self.device_ids = list(device_ids)
+        self.xyz = unit_vectors(lats, lons).reshape(-1, 3)
+        n = len(self.device_ids)
+        self._perm = np.arange(n)
+        self._axis = np.zeros(n, dtype=np.int8)
+        stack = [(0, n)]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= self.LEAF_SIZE:
+                continue
+            seg = self._perm[lo:hi]
+            pts = self.xyz[seg]
+            axis = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+            mid = (lo + hi) // 2
+            order = np.argpartition(pts[:, axis], mid - lo)
+            self._perm[lo:hi] = seg[order]
+            self._axis[mid] = axis
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+    def __len__(self) -> int:
+        return len(self.device_ids)
+
+    def _visit(self, q: np.ndarray, lo: int, hi: int, accept, bound):
+        """Depth-first walk; `bound()` is the current squared-chord pruning radius"""
+        if lo >= hi:
+            return
+        if hi - lo <= self.LEAF_SIZE:
+            seg = self._perm[lo:hi]
+            d2 = ((self.xyz[seg] - q) ** 2).sum(axis=1)
+            for i, d in zip(seg.tolist(), d2.tolist()):
+                accept(i, d)
+            return
+        mid = (lo + hi) // 2
+        p = self._perm[mid]
+        diff = q[self._axis[mid]] - self.xyz[p, self._axis[mid]]
+        accept(int(p), float(((self.xyz[p] - q) ** 2).sum()))
+        near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+        self._visit(q, *near, accept, bound)
+        if diff * diff <= bound():
+            self._visit(q, *far, accept, bound)
+
+    def knn(self, lat: float, lon: float, k: int) -> list[tuple[str, float]]:
+        """k nearest devices as (device_id, distance_km), closest first"""
+        if not self.device_ids or k <= 0:
+            return []
+        q = unit_vectors(lat, lon)
+        heap: list[tuple[float, int]] = []  # max-heap by negated distance
+
+        def accept(i: int, d2: float):
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, i))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, i))
+
+        def bound() -> float:
+            return -heap[0][0] if len(heap) >= k else math.inf
+
+        self._visit(q, 0, len(self.device_ids), accept, bound)
+        found = sorted((-d2, i) for d2, i in heap)
+        km = chord_to_km(np.sqrt([d2 for d2, _ in found]))
+        return [(self.device_ids[i], float(d)) for (_, i), d in zip(found, km)]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list[tuple[str, float]]:
+        """All devices within radius_km as (device_id, distance_km)"""
+        if not self.device_ids:
+            return []
+        q = unit_vectors(lat, lon)
+        limit = km_to_chord(radius_km) ** 2
+        hits: list[tuple[float, int]] = []
+
+        def accept(i: int, d2: float):
+            if d2 <= limit:
+                hits.append((d2, i))
+
+        self._visit(q, 0, len(self.device_ids), accept, lambda: limit)
+        hits.sort()
+        km = chord_to_km(np.sqrt([d2 for d2, _ in hits]))
+        return [(self.device_ids[i], float(d)) for (_, i), d in zip(hits, km)]
+
+
+class NearestIndex:
+    """Holds the current KDTree; updates swap in a freshly built tree"""
+
+    def __init__(self):
+        self._coords: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.tree = KDTree([], [], [])
+
+    def rebuild(self, devices: Iterable) -> None:
+        with self._lock:
+            self._coords = {d.device_id: (d.lat, d.lon) for d in devices if d.lat is not None and d.lon is not None}
+            self._swap()
+
+    def add(self, device) -> None:
+        with self._lock:
+            coords = dict(self._coords)
+            coords[device.device_id] = (device.lat, device.lon)
+            self._coords = coords
+            self._swap()
+
+    def _swap(self) -> None:
+        ids = list(self._coords)
+        lats = [self._coords[i][0] for i in ids]
+        lons = [self._coords[i][1] for i in ids]
+        self.tree = KDTree(ids, lats, lons)
+
+
+nearest_index = NearestIndex()
+
+
+def _on_registry_change(event: str, device) -> None:
+    if event == "add":
+        geo_index.add(device)
+        nearest_index.add(device)
+    else:
+        devices = device_registry.all()
+        geo_index.rebuild(devices)
+        nearest_index.rebuild(devices)
+
+
+device_registry.subscribe(_on_registry_change)
+latest_state.subscribe(geo_index.observe)
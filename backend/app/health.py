@@ -0,0 +1,181 @@
+"""
+Background health checks for /health/live and /health/ready.
+
+Every HEALTH_CHECK_SECONDS the monitor measures:
+
+- db_write:   time to take and release SQLite's write lock
+              (BEGIN IMMEDIATE; ROLLBACK), i.e. what a commit would wait
+- mqtt:       broker connection, required only while this process consumes
+- alerts:     alert fast path listener connection (when the stream is on)
+- queue:      writer queue fill ratio
+- ingest_lag: now - newest committed ts (over all devices, from the latest
+              state); per-device lags are reported for the stalest devices
+
+Probes only read the cached result, so a load balancer polling every
+second costs a dict copy. Liveness fails when the monitor itself stops
+running (blocked event loop) or the writer task died.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from .config import settings
+from .database import engine
+from .latest_state import latest_state
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def probe_db_write() -> float:
+    """Seconds to acquire and release the database write lock (no rows written)"""
+    t0 = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        raw.rollback()
+        cur.close()
+    finally:
+        raw.close()
+    return time.perf_counter() - t0
+
+
+def ingest_lag(now: datetime) -> tuple[Optional[float], list[tuple[str, float]]]:
+    """(seconds since the newest reading, [(device_id, lag)] stalest first)"""
+    lags = []
+    for device_id, r in latest_state.snapshot().items():
+        ts = r.ts if r.ts.tzinfo is not None else r.ts.replace(tzinfo=timezone.utc)
+        lags.append((device_id, (now - ts).total_seconds()))
+    if not lags:
+        return None, []
+    lags.sort(key=lambda x: x[1], reverse=True)
+    return lags[-1][1], lags
+
+
+class HealthMonitor:
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self.writer = None            # BatchWriter / IngestPool: depth(), capacity(), running
+        self.subscriber = None        # MQTTSubscriber: connected
+        self.coordinator = None       # ConsumerCoordinator: active
+        self.alert_listener = None    # AlertListener: connected
+        self.last_run: Optional[float] = None   # time.monotonic()
+        self.probe_started: Optional[float] = None  # set while a DB write probe is in flight
+        self.result: dict = {"ready": False, "checks": {}, "checked_at": None}
+
+    def configure(self, writer=None, subscriber=None, coordinator=None, alert_listener=None) -> None:
+        self.writer = writer
+        self.subscriber = subscriber
+        self.coordinator = coordinator
+        self.alert_listener = alert_listener
+
+    # ---------- checks ----------
+
+    async def check(self) -> dict:
+        checks: dict[str, dict] = {}
+
+        self.probe_started = time.monotonic()
+        try:
+            seconds = await asyncio.to_thread(probe_db_write)
+            ms = round(seconds * 1000.0, 1)
+            checks["db_write"] = {"ok": ms <= settings.HEALTH_DB_WRITE_MAX_MS, "ms": ms,
+                                  "max_ms": settings.HEALTH_DB_WRITE_MAX_MS}
+        except Exception as e:
+            checks["db_write"] = {"ok": False, "error": str(e)}
+        finally:
+            self.probe_started = None
+
+        consuming = bool(self.coordinator is not None and self.coordinator.active)
+        if self.subscriber is not None:
+            connected = bool(self.subscriber.connected)
+            checks["mqtt"] = {"ok": connected or not consuming, "connected": connected, "consuming": consuming}
+
+        if self.alert_listener is not None:
+            connected = bool(self.alert_listener.connected)
+            checks["alerts"] = {"ok": connected, "connected": connected, "received": self.alert_listener.received}
+
+        if self.writer is not None:
+            depth, capacity = self.writer.depth(), self.writer.capacity()
+            ratio = depth / capacity if capacity else 0.0
+            checks["queue"] = {"ok": self.writer.running and ratio < settings.HEALTH_QUEUE_MAX_RATIO,
+                               "running": self.writer.running, "depth": depth, "capacity": capacity,
+                               "max_ratio": settings.HEALTH_QUEUE_MAX_RATIO}
+
+        newest, lags = ingest_lag(datetime.now(timezone.utc))
+        limit = settings.HEALTH_INGEST_LAG_MAX_SECONDS
+        stale = [(d, lag) for d, lag in lags if lag > settings.HEALTH_DEVICE_STALE_SECONDS]
+        checks["ingest_lag"] = {
+            "ok": limit <= 0 or (newest is not None and newest <= limit),
+            "seconds": round(newest, 1) if newest is not None else None,
+            "max_seconds": limit,
+            "stale_devices": len(stale),
+            "stalest": {d: round(lag, 1) for d, lag in stale[:10]},
+        }
+
+        return {
+            "ready": all(c["ok"] for c in checks.values()),
+            "checks": checks,
+            "checked_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+
+    async def run(self) -> None:
+        while True:
+            try:
+                result = await self.check()
+                if result["ready"] != self.result["ready"] and self.result["checked_at"] is not None:
+                    failing = [k for k, c in result["checks"].items() if not c["ok"]]
+                    if result["ready"]:
+                        logger.info("✅ Ready again")
+                    else:
+                        logger.warning(f"⚠️ Not ready: {', '.join(failing)}")
+                self.result = result
+            except Exception as e:
+                logger.error(f"❌ Health check failed: {e}")
+            self.last_run = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    # ---------- probes (cached) ----------
+
+    def live(self) -> tuple[bool, dict]:
+        stalled = self.last_run is None or time.monotonic() - self.last_run > max(3 * self.interval, 10.0)
+        writer_dead = self.writer is not None and not self.writer.running
+        # Before the first check finishes the process is starting, not dead
+        ok = not writer_dead and (self.last_run is None or not stalled)
+        return ok, {"alive": ok, "monitor_stalled": self.last_run is not None and stalled,
+                    "writer_running": None if self.writer is None else self.writer.running}
+
+    def ready(self) -> tuple[bool, dict]:
+        result = dict(self.result)
+        started = self.probe_started
+        if started is not None:
+            # A probe stuck on the write lock has no result yet; report it as it stands
+            ms = round((time.monotonic() - started) * 1000.0, 1)
+            if ms > settings.HEALTH_DB_WRITE_MAX_MS:
+                result["checks"] = {**result["checks"], "db_write": {
+                    "ok": False, "ms": ms, "max_ms": settings.HEALTH_DB_WRITE_MAX_MS, "in_flight": True}}
+                result["ready"] = False
+        return bool(result["ready"]), result
+
+
+health_monitor = HealthMonitor(settings.HEALTH_CHECK_SECONDS)
+
+
+def _lag_samples():
+    lag = health_monitor.result["checks"].get("ingest_lag", {}).get("seconds")
+    return [((), lag)] if lag is not None else []
+
+
+def _db_write_samples():
+    ms = health_monitor.result["checks"].get("db_write", {}).get("ms")
+    return [((), ms / 1000.0)] if ms is not None else []
+
+
+registry.gauge("aq_ingest_lag_seconds", "Now minus the newest committed reading", fn=_lag_samples)
+registry.gauge("aq_db_write_probe_seconds", "Last write-lock probe duration", fn=_db_write_samples)
+registry.gauge("aq_ready", "1 when all readiness checks pass",
+               fn=lambda: [((), int(health_monitor.result["ready"]))])
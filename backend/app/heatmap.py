@@ -0,0 +1,251 @@
+"""
+Interpolated pollution heatmap tiles.
+
+Tiles follow the web-map z/x/y scheme. Each tile is an N x N grid of
+inverse-distance-weighted values computed in one NumPy pass
+(pixels x contributing sensors). Contributors are the sensors within
+HEATMAP_RADIUS_KM of the tile, found with the KD-tree.
+
+Rendered tiles are cached together with every candidate sensor (also
+those without a value yet); a new reading only evicts the tiles that
+device can feed. The pixel x sensor matrices are built in blocks of at
+most _IDW_BLOCK elements, so a low-zoom tile over a large fleet stays
+within a few MB.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+from .geo import EARTH_RADIUS_KM, nearest_index, unit_vectors
+from .latest_state import latest_state
+from .registry import device_registry
+
+HEATMAP_METRICS = ("eco2_ppm", "tvoc_ppb", "aq_score")
+_IDW_BLOCK = 1 << 18   # pixels x sensors per temporary matrix (2 MB of float64)
+
+
+@dataclass
+class HeatmapTile:
+    z: int
+    x: int
+    y: int
+    metric: str
+    city: Optional[str]
+    size: int
+    bounds: tuple[float, float, float, float]    # min_lat, min_lon, max_lat, max_lon
+    values: list[list[Optional[float]]]          # row 0 = north edge
+    device_ids: list[str]                        # sensors with a value that fed the tile
+    watch_ids: list[str]                         # every candidate sensor; their readings evict the tile
+
+
+# =========================================================
+# TILE GEOMETRY
+# =========================================================
+
+def tile_lon(x: float, z: int) -> float:
+    return x / (2 ** z) * 360.0 - 180.0
+
+
+def tile_lat(y: float, z: int) -> float:
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / (2 ** z)))))
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    return tile_lat(y + 1, z), tile_lon(x, z), tile_lat(y, z), tile_lon(x + 1, z)
+
+
+def pixel_centers(z: int, x: int, y: int, size: int) -> tuple[np.ndarray, np.ndarray]:
+    """(lats, lons) of pixel centers, shape (size, size)"""
+    steps = (np.arange(size) + 0.5) / size
+    n = 2 ** z
+    lons = (x + steps) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + steps) / n))))
+    return np.meshgrid(lats, lons, indexing="ij")
+
+
+# =========================================================
+# INTERPOLATION
+# =========================================================
+
+def idw_grid(
+    pixel_lats: np.ndarray,
+    pixel_lons: np.ndarray,
+    sensor_lats: np.ndarray,
+    sensor_lons: np.ndarray,
+    values: np.ndarray,
+    radius_km: float,
+    power: float,
+) -> np.ndarray:
+    """
+    Inverse-distance weighting, one block of pixels at a time.
+    Pixels with no sensor inside radius_km are NaN.
+    """
+    shape = pixel_lats.shape
+    if len(values) == 0:
+        return np.full(shape, np.nan)
+    p = unit_vectors(pixel_lats.ravel(), pixel_lons.ravel())     # (P, 3)
+    s = unit_vectors(sensor_lats, sensor_lons)                   # (S, 3)
+    grid = np.empty(len(p))
+    step = max(1, _IDW_BLOCK // len(s))
+    for i in range(0, len(p), step):
+        cos_angle = np.clip(p[i:i + step] @ s.T, -1.0, 1.0)     # (block, S)
+        dist = EARTH_RADIUS_KM * np.arccos(cos_angle)
+        weights = 1.0 / np.maximum(dist, 0.01) ** power
+        weights[dist > radius_km] = 0.0
+        total = weights.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            block = (weights @ values) / total
+        block[total == 0] = np.nan
+        grid[i:i + step] = block
+    return grid.reshape(shape)
+
+
+def render_tile(z: int, x: int, y: int, metric: str, city: Optional[str]) -> HeatmapTile:
+    """Render one tile from the current latest state"""
+    size = settings.HEATMAP_TILE_SIZE
+    radius = settings.HEATMAP_RADIUS_KM
+    bounds = tile_bounds(z, x, y)
+    min_lat, min_lon, max_lat, max_lon = bounds
+
+    # Candidate sensors: within radius of the tile's circumscribed circle
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+    half_diag = _haversine_km(center_lat, center_lon, max_lat, max_lon)
+    candidates = nearest_index.tree.within(center_lat, center_lon, half_diag + radius)
+
+    ids, lats, lons, vals, watch = [], [], [], [], []
+    for device_id, _ in candidates:
+        device = device_registry.get(device_id)
+        if device is None or (city is not None and device.city != city):
+            continue
+        watch.append(device_id)   # a first reading or a value for this metric changes the tile
+        reading = latest_state.get(device_id)
+        value = getattr(reading, metric, None) if reading is not None else None
+        if value is None:
+            continue
+        ids.append(device_id)
+        lats.append(device.lat)
+        lons.append(device.lon)
+        vals.append(float(value))
+
+    plats, plons = pixel_centers(z, x, y, size)
+    grid = idw_grid(
+        plats, plons,
+        np.asarray(lats), np.asarray(lons), np.asarray(vals),
+        radius, settings.HEATMAP_IDW_POWER,
+    )
+    rounded = np.round(grid, 1)
+    values = [[None if math.isnan(v) else v for v in row] for row in rounded.tolist()]
+    return HeatmapTile(
+        z=z, x=x, y=y, metric=metric, city=city, size=size,
+        bounds=bounds, values=values, device_ids=ids, watch_ids=watch,
+    )
+
+
+def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlat = p2 - p1
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+# =========================================================
+# TILE CACHE
+# =========================================================
+
+class TileCache:
+    """
+    LRU of rendered tiles plus a device -> tiles reverse index,
+    so a reading from one device evicts only the tiles it can feed.
+    """
+
+    def __init__(self, max_tiles: int):
+        self.max_tiles = max_tiles
+        self._tiles: OrderedDict[tuple, HeatmapTile] = OrderedDict()
+        self._by_device: dict[str, set[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def get(self, key: tuple) -> Optional[HeatmapTile]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key: tuple, tile: HeatmapTile) -> None:
+        with self._lock:
+            self._drop(key)
+            self._tiles[key] = tile
+            for device_id in tile.watch_ids:
+                self._by_device.setdefault(device_id, set()).add(key)
+            while len(self._tiles) > self.max_tiles:
+                self._drop(next(iter(self._tiles)))
+
+    def invalidate_device(self, device_id: str) -> int:
+        with self._lock:
+            keys = self._by_device.pop(device_id, set())
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+            self._by_device.clear()
+
+    def _drop(self, key: tuple) -> None:
+        tile = self._tiles.pop(key, None)
+        if tile is None:
+            return
+        for device_id in tile.watch_ids:
+            keys = self._by_device.get(device_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_device[device_id]
+
+
+tile_cache = TileCache(settings.HEATMAP_CACHE_TILES)
+latest_state.subscribe(tile_cache.invalidate_device)
+# A new sensor may feed any cached tile
+device_registry.subscribe(lambda event, device: tile_cache.clear())
+
+
+def get_tile(z: int, x: int, y: int, metric: str, city: Optional[str]) -> tuple[HeatmapTile, bool]:
+    """Cached tile or a fresh render; returns (tile, cache_hit)"""
+    key = (z, x, y, metric, city)
+    tile = tile_cache.get(key)
+    if tile is not None:
+        return tile, True
+    tile = render_tile(z, x, y, metric, city)
+    tile_cache.put(key, tile)
+    return tile, False
+
+
+def estimate_at(neighbours: list[tuple[str, float]]) -> dict[str, Optional[float]]:
+    """IDW estimate of each heatmap metric from (device_id, distance_km) neighbours"""
+    out: dict[str, Optional[float]] = {}
+    power = settings.HEATMAP_IDW_POWER
+    for metric in HEATMAP_METRICS:
+        num = den = 0.0
+        for device_id, km in neighbours:
+            reading = latest_state.get(device_id)
+            value = getattr(reading, metric, None) if reading is not None else None
+            if value is None:
+                continue
+            w = 1.0 / max(km, 0.01) ** power
+            num += w * value
+            den += w
+        out[metric] = round(num / den, 1) if den else None
+    return out
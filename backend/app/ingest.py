@@ -0,0 +1,223 @@
+"""
+Standalone ingest worker.
+
+Runs the MQTT consumer, payload decoding and batched writes in their own
+process so API traffic and ingest bursts don't share an event loop:
+
+    python -m app.ingest                # from backend/
+    python -m app.ingest --procs 4      # dispatcher + 4 decode/write processes
+    API_READ_ONLY=true uvicorn app.main:app --workers 4
+
+Uses the same .env / settings, models and database as the API. Serves
+GET /health, GET /metrics (Prometheus text) and GET /stats (JSON) on
+INGEST_HEALTH_HOST:INGEST_HEALTH_PORT. Also runs the forecasting job
+(app/forecasting.py) every FORECAST_JOB_SECONDS and follows edits of the
+alert rule file (RULES_PATH, app/rules.py).
+SIGTERM / SIGINT stop the consumer, flush the write queue (at most
+INGEST_DRAIN_SECONDS) and exit.
+"""
+import sys
+import asyncio
+
+# ✅ Windows asyncio fix (same as main.py)
+if sys.platform == 'win32':
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+import argparse
+import json
+import logging
+import os
+import signal
+import time
+from typing import Optional
+
+from .config import settings
+from .database import engine, Base, SessionLocal
+from .admission import admission
+from .batch_writer import batch_writer
+from .coordination import consumer_coordinator
+from .ingest_pool import IngestPool, make_pool
+from .metrics import CONTENT_TYPE, registry
+from .mqtt_client import mqtt_subscriber
+from .live_alerts import alert_writer
+from .registry import device_registry, run_refresher
+from .health import health_monitor
+from .latest_state import latest_state, run_follower
+from . import anomaly, crud, forecasting, rules
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("app.ingest")
+
+STARTED_AT = time.time()
+pool: Optional[IngestPool] = None   # set with --procs > 1
+
+
+# =========================================================
+# HEALTH / METRICS
+# =========================================================
+
+def health_status() -> tuple[int, dict]:
+    """503 when not live or not ready (see app.health)"""
+    sink = pool or batch_writer
+    live, _ = health_monitor.live()
+    ready, result = health_monitor.ready()
+    ok = live and ready
+    body = {
+        "status": "healthy" if ok else "unhealthy",
+        "mqtt": "connected" if mqtt_subscriber.connected else "disconnected",
+        "mqtt_consumer": consumer_coordinator.describe(),
+        "writer": "running" if sink.running else "stopped",
+        "queue_depth": sink.depth(),
+        **result,
+    }
+    return (200 if ok else 503), body
+
+
+def stats() -> dict:
+    out = {
+        "uptime_s": round(time.time() - STARTED_AT, 1),
+        "mqtt": {"received": mqtt_subscriber.received, "dropped": mqtt_subscriber.dropped},
+        "writer": (pool or batch_writer).stats(),
+        "admission": admission.stats(),
+        "anomaly": anomaly.anomaly_engine.stats() if anomaly.anomaly_engine is not None and not pool else None,
+        "alert_events": {"written": alert_writer.written, "failed": alert_writer.failed, "dropped": alert_writer.dropped},
+        "forecasting": dict(forecasting.totals),
+        "rules": rules.rule_engine.describe(),
+    }
+    if mqtt_subscriber.replayer is not None:
+        out["spool"] = mqtt_subscriber.replayer.stats()
+    return out
+
+
+# Pool workers write in child processes; their shared counters are read here
+registry.counter("aq_ingest_pool_rows_total", "Ingest worker process rows by outcome", ("outcome",),
+                 fn=lambda: [((k,), pool.stats()[k]) for k in ("written", "failed", "dropped")] if pool else [])
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Minimal HTTP/1.0 responder: GET /health, GET /metrics, GET /stats"""
+    try:
+        request_line = (await asyncio.wait_for(reader.readline(), 5)).decode(errors="replace")
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        path = parts[1].split("?")[0] if len(parts) >= 2 else ""
+        content_type = "application/json"
+        if path == "/health":
+            code, body = health_status()
+        elif path == "/stats":
+            code, body = 200, stats()
+        elif path == "/metrics":
+            code, body, content_type = 200, None, CONTENT_TYPE
+        else:
+            code, body = 404, {"detail": "Not Found"}
+        payload = registry.render().encode() if body is None else json.dumps(body).encode()
+        reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[code]
+        writer.write(
+            f"HTTP/1.0 {code} {reason}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"health request failed: {e}")
+    finally:
+        writer.close()
+
+
+# =========================================================
+# MAIN
+# =========================================================
+
+async def main(procs: int = 1) -> None:
+    global pool
+    if procs > 1 and settings.SPOOL_ENABLED:
+        raise SystemExit("SPOOL_ENABLED replays in-process; run with --procs 1 (or shard mode)")
+    logger.info("🚀 Starting ingest worker...")
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        device_registry.load(db)
+        latest_state.seed(crud.get_latest_many(db, [d.device_id for d in device_registry.all()]).values())
+    finally:
+        db.close()
+    rules.rule_engine.load(force=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+    server = await asyncio.start_server(_handle_http, settings.INGEST_HEALTH_HOST, settings.INGEST_HEALTH_PORT)
+    logger.info(f"✅ Ingest health on http://{settings.INGEST_HEALTH_HOST}:{settings.INGEST_HEALTH_PORT}/health")
+
+    if procs > 1:
+        pool = make_pool(procs)
+        pool.start()
+        mqtt_subscriber.dispatcher = pool
+    else:
+        anomaly.start(f"ingest-{os.getpid()}")
+        batch_writer.start()
+    alert_writer.start()   # the dispatcher handles /alert and /anomaly itself
+    registry_task = asyncio.create_task(run_refresher(settings.REGISTRY_REFRESH_SECONDS))
+    rules_task = asyncio.create_task(rules.run_watcher(settings.RULES_RELOAD_SECONDS))
+    # Pool workers / other shard consumers commit in other processes: tail their rows
+    following = pool is not None or consumer_coordinator.mode != "all"
+    follow_task = asyncio.create_task(run_follower(settings.LATEST_FOLLOW_SECONDS)) if following else None
+    health_monitor.configure(writer=pool or batch_writer, subscriber=mqtt_subscriber, coordinator=consumer_coordinator)
+    health_task = asyncio.create_task(health_monitor.run())
+    anomaly_task = None
+    if pool is None and settings.ANOMALY_SNAPSHOT_SECONDS > 0:
+        anomaly_task = asyncio.create_task(anomaly.run_snapshots(settings.ANOMALY_SNAPSHOT_SECONDS))
+    forecast_task = None
+    if settings.FORECAST_ENABLED:
+        forecast_task = asyncio.create_task(forecasting.run_job(settings.FORECAST_JOB_SECONDS))
+    mqtt_task = asyncio.create_task(mqtt_subscriber.run())
+
+    await stop.wait()
+
+    # Graceful drain: stop reading, flush what was already decoded, exit
+    logger.info("🛑 Draining ingest worker...")
+    await mqtt_subscriber.stop()
+    mqtt_task.cancel()
+    registry_task.cancel()
+    rules_task.cancel()
+    health_task.cancel()
+    if follow_task:
+        follow_task.cancel()
+    if anomaly_task:
+        anomaly_task.cancel()
+    if forecast_task:
+        forecast_task.cancel()
+    try:
+        await mqtt_task
+    except asyncio.CancelledError:
+        pass
+    await alert_writer.close()
+    if pool is not None:
+        await pool.close(settings.INGEST_DRAIN_SECONDS)
+    else:
+        try:
+            await asyncio.wait_for(batch_writer.close(), settings.INGEST_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Drain timed out; {batch_writer.depth()} readings not written")
+        await asyncio.to_thread(anomaly.save)
+    server.close()
+    await server.wait_closed()
+    logger.info("✅ Ingest worker stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone MQTT ingest worker")
+    parser.add_argument("--procs", type=int, default=settings.INGEST_PROCS,
+                        help="decode/write worker processes (1 = in-process)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.procs))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,264 @@
+"""
+Multi-process ingest: a dispatcher and N decode/write worker processes.
+
+The dispatcher (the process holding the MQTT connection) does no decoding
+work: it reads the device id from the topic and hands (topic, raw payload)
+to worker crc32(device_id) % N. Every reading of a device therefore lands in
+the same worker, so per-device state (latest reading, baselines) stays
+local. Workers decode, build Measurement objects and commit in batches;
+SQLite in WAL mode serializes only the short commits.
+
+Workers are started with the "spawn" method (same behaviour on Windows
+and Linux, no inherited SQLite connections). Each worker refreshes its
+device registry (REGISTRY_REFRESH_SECONDS) and alert rules between
+batches. The dispatcher checks its workers about once a second and when an
+inbox stays full; a dead worker is restarted on a fresh inbox that gets
+whatever could still be read from the old one.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+from typing import Optional
+
+from .config import settings
+from .coordination import shard_of
+
+logger = logging.getLogger(__name__)
+
+_STOP = None
+_PUT_TIMEOUT = 1.0   # a full inbox this long: check that its worker is alive
+
+
+# =========================================================
+# WORKER PROCESS
+# =========================================================
+
+def _worker_main(index: int, inbox, counters, batch_size: int, flush_ms: int, log_level: int) -> None:
+    """Entry point of one worker: decode + batched writes until _STOP"""
+    logging.basicConfig(
+        level=log_level,
+        format=f'%(asctime)s - ingest[{index}] - %(levelname)s - %(message)s'
+    )
+    # Imported here so the engine is created inside the child
+    from . import anomaly
+    from .batch_writer import BatchWriter
+    from .database import SessionLocal
+    from .mqtt_client import decode_topic_message
+    from .registry import device_registry, _refresh as refresh_registry
+    from .rules import rule_engine
+
+    db = SessionLocal()
+    try:
+        device_registry.load(db)
+    finally:
+        db.close()
+    rule_engine.load(force=True)
+
+    anomaly.start(f"ingest-worker-{os.getpid()}")
+    snapshot_at = time.monotonic() + settings.ANOMALY_SNAPSHOT_SECONDS
+    rules_at = time.monotonic() + settings.RULES_RELOAD_SECONDS
+    registry_at = time.monotonic() + settings.REGISTRY_REFRESH_SECONDS
+
+    written, failed, dropped = counters
+    flush_seconds = flush_ms / 1000.0
+    stopping = False
+    while not stopping:
+        item = inbox.get()
+        if item is _STOP:
+            break
+        raws = [item]
+        deadline = time.monotonic() + flush_seconds
+        while len(raws) < batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = inbox.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            raws.append(item)
+
+        # Before decoding: newly registered devices pass INGEST_REQUIRE_REGISTERED and get their rules
+        if time.monotonic() >= registry_at:
+            try:
+                refresh_registry()
+            except Exception as e:
+                logger.error(f"❌ Device registry refresh failed: {e}")
+            registry_at = time.monotonic() + settings.REGISTRY_REFRESH_SECONDS
+        if time.monotonic() >= rules_at:   # each worker follows RULES_PATH edits itself
+            rule_engine.load()
+            rules_at = time.monotonic() + settings.RULES_RELOAD_SECONDS
+
+        batch = []
+        for topic, raw in raws:
+            try:
+                rows = decode_topic_message(topic, raw)
+            except Exception as e:
+                logger.error(f"❌ Decode error: {e}")
+                rows = []
+            if not rows:
+                with dropped.get_lock():
+                    dropped.value += 1
+            else:
+                batch.extend(rows)
+        if not batch:
+            continue
+        try:
+            rejected = BatchWriter._write(batch)
+        except Exception as e:
+            logger.error(f"❌ Batch write failed ({len(batch)} rows dropped): {e}")
+            with failed.get_lock():
+                failed.value += len(batch)
+            continue
+        if rejected:
+            with failed.get_lock():
+                failed.value += rejected
+        with written.get_lock():
+            written.value += len(batch) - rejected
+        if settings.ANOMALY_SNAPSHOT_SECONDS > 0 and time.monotonic() >= snapshot_at:
+            anomaly.save()
+            snapshot_at = time.monotonic() + settings.ANOMALY_SNAPSHOT_SECONDS
+    anomaly.save()
+
+
+# =========================================================
+# DISPATCHER
+# =========================================================
+
+class IngestPool:
+    def __init__(self, procs: int, batch_size: int, flush_ms: int, queue_size: int):
+        self.procs = max(1, procs)
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.queue_size = queue_size
+        self._ctx = mp.get_context("spawn")
+        self._inboxes: list = []
+        self._workers: list = []
+        self._counters: list[tuple] = []
+        self._check_at = 0.0
+        self.received = 0
+        self.restarts = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers) and all(p.is_alive() for p in self._workers)
+
+    def start(self) -> None:
+        for i in range(self.procs):
+            self._inboxes.append(self._ctx.Queue(maxsize=self.queue_size))
+            self._counters.append(tuple(self._ctx.Value("q", 0) for _ in range(3)))
+            self._workers.append(self._spawn(i))
+        logger.info(f"✅ Ingest pool started: {self.procs} worker processes")
+
+    def _spawn(self, i: int):
+        proc = self._ctx.Process(
+            target=_worker_main,
+            # Spawned children don't inherit logging config; follow the parent's level
+            args=(i, self._inboxes[i], self._counters[i], self.batch_size, self.flush_ms,
+                  logging.getLogger().getEffectiveLevel()),
+            name=f"ingest-{i}",
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def _revive(self) -> None:
+        """Restart dead workers; a crashed reader may hold the old inbox's lock, so move to a fresh one"""
+        for i, proc in enumerate(self._workers):
+            if proc.is_alive():
+                continue
+            old, inbox = self._inboxes[i], self._ctx.Queue(maxsize=self.queue_size)
+            moved = 0
+            while moved < self.queue_size:
+                try:
+                    item = old.get(timeout=0.05)
+                except (queue.Empty, OSError, EOFError):
+                    break
+                inbox.put_nowait(item)
+                moved += 1
+            self._inboxes[i] = inbox
+            self.restarts += 1
+            logger.error(f"❌ {proc.name} died (exit code {proc.exitcode}); restarting with {moved} queued payload(s)")
+            self._workers[i] = self._spawn(i)
+
+    async def submit(self, device_id: str, topic: str, raw: bytes) -> None:
+        """Route a raw payload to its device's worker"""
+        self.received += 1
+        now = time.monotonic()
+        if now >= self._check_at:
+            self._check_at = now + 1.0
+            self._revive()
+        i = shard_of(device_id, self.procs)
+        item = (topic, raw)
+        try:
+            self._inboxes[i].put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        # Backpressure without blocking the event loop, nor forever on a dead worker
+        while True:
+            try:
+                await asyncio.to_thread(self._inboxes[i].put, item, True, _PUT_TIMEOUT)
+                return
+            except queue.Full:
+                self._revive()
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """Send stop markers after queued payloads and wait for the workers"""
+        if not self._workers:
+            return
+        for inbox, proc in zip(self._inboxes, self._workers):
+            if proc.is_alive():
+                try:
+                    await asyncio.to_thread(inbox.put, _STOP, True, timeout)
+                except queue.Full:
+                    logger.error(f"❌ {proc.name} inbox still full; not waiting for it to drain")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for proc in self._workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            await asyncio.to_thread(proc.join, remaining)
+            if proc.is_alive():
+                logger.error(f"❌ {proc.name} did not drain in time; terminating")
+                proc.terminate()
+        logger.info(f"✅ Ingest pool drained ({self.stats()['written']} written)")
+        self._workers.clear()
+
+    def capacity(self) -> int:
+        return self.queue_size * self.procs
+
+    def depth(self) -> int:
+        total = 0
+        for inbox in self._inboxes:
+            try:
+                total += inbox.qsize()
+            except NotImplementedError:  # macOS
+                pass
+        return total
+
+    def stats(self) -> dict:
+        per_worker = [
+            {"written": w.value, "failed": f.value, "dropped": d.value}
+            for w, f, d in self._counters
+        ]
+        return {
+            "procs": self.procs,
+            "received": self.received,
+            "restarts": self.restarts,
+            "written": sum(s["written"] for s in per_worker),
+            "failed": sum(s["failed"] for s in per_worker),
+            "dropped": sum(s["dropped"] for s in per_worker),
+            "queue_depth": self.depth(),
+            "workers": per_worker,
+        }
+
+
+def make_pool(procs: int) -> IngestPool:
+    return IngestPool(procs, settings.INGEST_BATCH_SIZE, settings.INGEST_FLUSH_MS, settings.INGEST_QUEUE_SIZE)
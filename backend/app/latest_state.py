@@ -0,0 +1,144 @@
+"""
+Latest reading per device, kept in memory.
+
+Seeded from the database at startup and updated by every ingest path
+after commit. Listeners are notified with the device_id so caches built
+on top of the latest state can invalidate only what a device touched.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Measurement
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class LatestReading:
+    """Same attribute names as Measurement, so either can be rendered"""
+    device_id: str
+    ts: datetime
+    temp_c: Optional[float] = None
+    hum_rh: Optional[float] = None
+    pressure_hpa: Optional[float] = None
+    tvoc_ppb: Optional[int] = None
+    eco2_ppm: Optional[int] = None
+    aq_score: Optional[int] = None
+    status: Optional[str] = None
+    alert: bool = False
+    anom_eco2: bool = False
+    anom_tvoc: bool = False
+
+    @classmethod
+    def from_measurement(cls, m) -> "LatestReading":
+        return cls(
+            device_id=m.device_id,
+            ts=m.ts,
+            temp_c=m.temp_c,
+            hum_rh=m.hum_rh,
+            pressure_hpa=m.pressure_hpa,
+            tvoc_ppb=m.tvoc_ppb,
+            eco2_ppm=m.eco2_ppm,
+            aq_score=m.aq_score,
+            status=m.status,
+            alert=bool(m.alert),
+            anom_eco2=bool(m.anom_eco2),
+            anom_tvoc=bool(m.anom_tvoc),
+        )
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+class LatestState:
+    def __init__(self):
+        self._items: dict[str, LatestReading] = {}
+        self._listeners: list[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, device_id: str) -> Optional[LatestReading]:
+        return self._items.get(device_id)
+
+    def snapshot(self) -> dict[str, LatestReading]:
+        return dict(self._items)
+
+    def subscribe(self, listener: Callable[[str], None]) -> None:
+        self._listeners.append(listener)
+
+    def seed(self, measurements) -> None:
+        """Replace state from a batch of latest measurements (startup)"""
+        items = {m.device_id: LatestReading.from_measurement(m) for m in measurements}
+        with self._lock:
+            self._items = items
+
+    def follow(self, db: Session, after_id: int, limit: int = 5000) -> int:
+        """
+        Apply rows committed by another process (the ingest worker, other
+        consumers) with id > after_id; returns the new high-water id. Rows
+        this process wrote itself are already held and skipped.
+        """
+        stmt = select(Measurement).where(Measurement.id > after_id).order_by(Measurement.id).limit(limit)
+        rows = db.execute(stmt).scalars().all()
+        for m in rows:
+            current = self._items.get(m.device_id)
+            if current is not None and _utc(current.ts) == _utc(m.ts):
+                continue
+            self.update(m)
+        return rows[-1].id if rows else after_id
+
+    def update(self, m) -> bool:
+        """Record a committed measurement; returns False if it is older than what we hold"""
+        reading = LatestReading.from_measurement(m)
+        with self._lock:
+            current = self._items.get(reading.device_id)
+            if current is not None and _utc(current.ts) > _utc(reading.ts):
+                return False
+            self._items[reading.device_id] = reading
+        for listener in self._listeners:
+            try:
+                listener(reading.device_id)
+            except Exception as e:
+                logger.error(f"❌ Latest-state listener failed: {e}", exc_info=True)
+        return True
+
+
+latest_state = LatestState()
+
+
+async def run_follower(interval_seconds: float) -> None:
+    """Background task for processes that don't write every reading themselves: tail new measurements by id"""
+    def _max_id() -> int:
+        db = SessionLocal()
+        try:
+            return db.execute(select(func.max(Measurement.id))).scalar() or 0
+        finally:
+            db.close()
+
+    def _step(after_id: int) -> int:
+        db = SessionLocal()
+        try:
+            return latest_state.follow(db, after_id)
+        finally:
+            db.close()
+
+    high = await asyncio.to_thread(_max_id)
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            high = await asyncio.to_thread(_step, high)
+        except Exception as e:
+            logger.error(f"❌ Latest-state follow failed: {e}")
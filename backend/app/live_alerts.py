@@ -0,0 +1,233 @@
+"""
+Alert fast path for the gateway's `<prefix><device_id>/alert` and
+`/anomaly` messages.
+
+The gateway publishes these next to the reading on `/data` (same JSON), so
+they never go through the measurement queue:
+
+- LiveAlerts, one per API process, is fed by a small MQTT listener on the
+  two topics (mqtt_client.AlertListener). It keeps the last alert per
+  device in memory and pushes every event to the SSE clients of
+  GET /api/alerts/stream as soon as it is decoded.
+- AlertEventWriter, in the process that consumes MQTT, stores each event in
+  `alert_events` in its own short transaction, straight away. The batch
+  writer waits for pending alert writes before its next bulk commit, so an
+  alert never queues behind a batch for SQLite's write lock.
+
+The reading itself is still stored from `/data`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import insert
+
+from .batch_writer import batch_writer
+from .config import settings
+from .database import SessionLocal
+from .metrics import ALERT_COMMIT_SECONDS, ALERT_PUSH_SECONDS, registry
+from .models import AlertEvent, Measurement
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def alert_event(kind: str, m: Measurement) -> dict:
+    """JSON-ready event from a decoded /alert or /anomaly message"""
+    ts = m.ts if m.ts.tzinfo is not None else m.ts.replace(tzinfo=timezone.utc)
+    return {
+        "kind": kind,
+        "device_id": m.device_id,
+        "ts": ts.isoformat(),
+        "status": m.status,
+        "eco2_ppm": m.eco2_ppm,
+        "tvoc_ppb": m.tvoc_ppb,
+        "aq_score": m.aq_score,
+        "alert": bool(m.alert),
+        "anom_eco2": bool(m.anom_eco2),
+        "anom_tvoc": bool(m.anom_tvoc),
+        "frame_counter": m.frame_counter,
+        "received_ms": int(time.time() * 1000),
+    }
+
+
+# =========================================================
+# IN-MEMORY STATE + SSE FAN-OUT
+# =========================================================
+
+class LiveAlerts:
+    def __init__(self, keep: int, client_queue: int, active_seconds: int):
+        self.recent: deque[dict] = deque(maxlen=max(1, keep))
+        self.active: dict[str, dict] = {}
+        self.client_queue = client_queue
+        self.active_seconds = active_seconds
+        self._clients: set[asyncio.Queue] = set()
+        self._last_id = 0
+        self.published = 0
+        self.client_drops = 0
+
+    def publish(self, event: dict, received_at: Optional[float] = None) -> dict:
+        """Record an event and queue it for every SSE client (event loop only)"""
+        # Ids are epoch microseconds, so Last-Event-ID means the same on every worker
+        self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+        event["id"] = self._last_id
+        self.recent.append(event)
+        self.active[event["device_id"]] = event
+        for q in self._clients:
+            self._offer(q, event)
+        self.published += 1
+        if received_at is not None:
+            ALERT_PUSH_SECONDS.observe(time.monotonic() - received_at)
+        return event
+
+    def _offer(self, q: asyncio.Queue, event: dict) -> None:
+        if q.full():
+            q.get_nowait()   # slow client: lose the oldest, never block the publisher
+            self.client_drops += 1
+        q.put_nowait(event)
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.client_queue))
+        if last_event_id is not None:
+            for event in self.recent:
+                if event["id"] > last_event_id:
+                    self._offer(q, event)
+        self._clients.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self._clients.discard(q)
+
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def active_alerts(self, device_ids: Optional[list[str]] = None) -> list[dict]:
+        """Last event per device within ALERT_ACTIVE_SECONDS, newest first"""
+        cutoff = (time.time() - self.active_seconds) * 1000
+        items = [
+            e for d, e in self.active.items()
+            if e["received_ms"] >= cutoff and (not device_ids or d in device_ids)
+        ]
+        return sorted(items, key=lambda e: e["id"], reverse=True)
+
+
+# =========================================================
+# PRIORITY WRITER
+# =========================================================
+
+class AlertEventWriter:
+    def __init__(self, queue_size: int = 10_000):
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._idle: Optional[asyncio.Event] = None
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> asyncio.Task:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def submit(self, event: dict, received_at: float) -> None:
+        if not self.running:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait((event, received_at))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"❌ Alert event queue full, event dropped ({event['device_id']})")
+            return
+        self._idle.clear()
+
+    async def wait_idle(self) -> None:
+        """Returns once no alert event is waiting to be written (the batch writer yields to us)"""
+        if self.running:
+            await self._idle.wait()
+
+    async def close(self) -> None:
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _STOP:
+                    return
+                items = [item]
+                stop = False
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is _STOP:
+                        stop = True
+                        break
+                    items.append(item)
+                try:
+                    await asyncio.to_thread(self._write, [e for e, _ in items])
+                    self.written += len(items)
+                    now = time.monotonic()
+                    for _, received_at in items:
+                        ALERT_COMMIT_SECONDS.observe(now - received_at)
+                except Exception as e:
+                    self.failed += len(items)
+                    logger.error(f"❌ Alert event write failed ({len(items)} dropped): {e}")
+                if self._queue.empty():
+                    self._idle.set()
+                if stop:
+                    return
+        finally:
+            self._idle.set()
+
+    @staticmethod
+    def _write(events: list[dict]) -> None:
+        rows = [{
+            "device_id": e["device_id"],
+            "kind": e["kind"],
+            "ts": datetime.fromisoformat(e["ts"]),
+            "received_at": datetime.fromtimestamp(e["received_ms"] / 1000.0, tz=timezone.utc),
+            "status": e["status"],
+            "eco2_ppm": e["eco2_ppm"],
+            "tvoc_ppb": e["tvoc_ppb"],
+            "aq_score": e["aq_score"],
+            "anom_eco2": e["anom_eco2"],
+            "anom_tvoc": e["anom_tvoc"],
+            "frame_counter": e["frame_counter"],
+        } for e in events]
+        db = SessionLocal()
+        try:
+            db.execute(insert(AlertEvent), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+live_alerts = LiveAlerts(settings.ALERT_RECENT_KEEP, settings.ALERT_CLIENT_QUEUE, settings.ALERT_ACTIVE_SECONDS)
+alert_writer = AlertEventWriter()
+batch_writer.yield_to = alert_writer.wait_idle
+
+registry.counter("aq_alert_events_total", "Alert fast path events by outcome", ("outcome",),
+                 fn=lambda: [(("pushed",), live_alerts.published), (("written",), alert_writer.written),
+                             (("failed",), alert_writer.failed), (("dropped",), alert_writer.dropped),
+                             (("client_dropped",), live_alerts.client_drops)])
+registry.gauge("aq_alert_stream_clients", "Connected SSE alert stream clients",
+               fn=lambda: [((), live_alerts.clients())])
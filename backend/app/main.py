@@ -9,14 +9,30 @@ if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 import logging
+import os
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import settings
-from .database import engine, Base
+from .database import engine, Base, SessionLocal
 from .routes import router
-from .mqtt_client import start_mqtt_subscriber 
+from .mqtt_client import alert_listener, mqtt_subscriber, start_mqtt_subscriber
+from .live_alerts import alert_writer
+from .coordination import consumer_coordinator
+from .latest_state import latest_state, run_follower
+from .batch_writer import batch_writer
+from .admission import admission
+from .health import health_monitor
+from .registry import device_registry, run_refresher
+from . import geo, heatmap  # noqa: F401  (subscribe map indexes to the registry)
+from . import anomaly, crud
+from .correlator import run_ticker
+from . import forecasting, rules
+from .profiling import request_profiler
+from .metrics import CONTENT_TYPE, HTTP_SECONDS, SQL_PER_REQUEST, registry, start_sql_count, stop_sql_count
 
 # Configure logging
 logging.basicConfig(
@@ -40,20 +56,73 @@ async def lifespan(app: FastAPI):
         logger.info("✅ Database tables created")
     except Exception as e:
         logger.error(f"❌ Database initialization error: {e}")
+
+    # Load the device registry (map indexes follow) and latest readings
+    db = SessionLocal()
+    try:
+        device_registry.load(db)
+        latest_state.seed(crud.get_latest_many(db, [d.device_id for d in device_registry.all()]).values())
+        geo.geo_index.rebuild(device_registry.all())  # seeding notifies no listeners; recount cluster statuses
+        logger.info(f"✅ Device registry loaded ({len(device_registry)} devices, {len(latest_state)} with readings)")
+    finally:
+        db.close()
+    registry_task = asyncio.create_task(run_refresher(settings.REGISTRY_REFRESH_SECONDS))
+    # Alert rules compiled against the registry, then followed on RULES_PATH edits
+    rules.rule_engine.load(force=True)
+    rules_task = asyncio.create_task(rules.run_watcher(settings.RULES_RELOAD_SECONDS))
+    admission_task = admission.start_flusher()
     
-    # Start MQTT subscriber
+    # Start MQTT subscriber (read-only API: the ingest worker consumes instead)
     mqtt_task = None
-    try:
-        mqtt_task = asyncio.create_task(start_mqtt_subscriber())
-        logger.info("✅ MQTT subscriber started")
-    except Exception as e:
-        logger.error(f"❌ MQTT subscriber error: {e}")
-        logger.warning("⚠️ Continuing without MQTT support")
+    follow_task = None
+    anomaly_task = None
+    forecast_task = None
+    # Other processes write (some of) the readings: standby / other-shard workers, the ingest worker
+    if settings.API_READ_ONLY or consumer_coordinator.mode != "all":
+        follow_task = asyncio.create_task(run_follower(settings.LATEST_FOLLOW_SECONDS))
+    listener = alert_listener if settings.ALERT_STREAM_ENABLED else None
+    if settings.API_READ_ONLY:
+        logger.info("📖 Read-only API: MQTT ingest runs in `python -m app.ingest`")
+        health_monitor.configure(alert_listener=listener)
+    else:
+        anomaly.start(f"api-{os.getpid()}")
+        if settings.ANOMALY_SNAPSHOT_SECONDS > 0:
+            anomaly_task = asyncio.create_task(anomaly.run_snapshots(settings.ANOMALY_SNAPSHOT_SECONDS))
+        if settings.FORECAST_ENABLED:
+            forecast_task = asyncio.create_task(forecasting.run_job(settings.FORECAST_JOB_SECONDS))
+        batch_writer.start()
+        alert_writer.start()
+        try:
+            mqtt_task = asyncio.create_task(start_mqtt_subscriber())
+            logger.info("✅ MQTT subscriber started")
+        except Exception as e:
+            logger.error(f"❌ MQTT subscriber error: {e}")
+            logger.warning("⚠️ Continuing without MQTT support")
+        health_monitor.configure(writer=batch_writer, subscriber=mqtt_subscriber, coordinator=consumer_coordinator,
+                                 alert_listener=listener)
+    health_task = asyncio.create_task(health_monitor.run())
+    correlator_task = asyncio.create_task(run_ticker(settings.CORRELATOR_TICK_SECONDS))
+    # Alert fast path to SSE clients, also in read-only and standby workers
+    alert_task = asyncio.create_task(listener.run()) if listener is not None else None
     
     yield
     
     # Shutdown
     logger.info("🛑 Shutting down application...")
+    registry_task.cancel()
+    rules_task.cancel()
+    health_task.cancel()
+    correlator_task.cancel()
+    if admission_task:
+        admission_task.cancel()
+    if follow_task:
+        follow_task.cancel()
+    if alert_task:
+        alert_task.cancel()
+    if anomaly_task:
+        anomaly_task.cancel()
+    if forecast_task:
+        forecast_task.cancel()
     
     if mqtt_task:
         mqtt_task.cancel()
@@ -61,6 +130,10 @@ async def lifespan(app: FastAPI):
             await mqtt_task
         except asyncio.CancelledError:
             logger.info("✅ MQTT subscriber stopped")
+    await alert_writer.close()
+    await batch_writer.close()
+    if not settings.API_READ_ONLY:
+        await asyncio.to_thread(anomaly.save)
 
 # Create FastAPI app
 app = FastAPI(
@@ -79,6 +152,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency + SQL statements per request, labelled by route template
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    t0 = time.perf_counter()
+    cell, token = start_sql_count()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_SECONDS.observe(time.perf_counter() - t0, request.method, path, status)
+        SQL_PER_REQUEST.observe(cell[0], path)
+        stop_sql_count(token)
+
+# Opt-in request profiling (SQL count / DB time / rows / N+1, `X-Profile: sample`)
+if settings.PROFILING_ENABLED:
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        sample = request.headers.get("x-profile") == "sample" and (
+            not settings.API_KEY or request.headers.get("x-api-key") == settings.API_KEY
+        )
+        sampler = request_profiler.sampler() if sample else None
+        t0 = time.perf_counter()
+        profile, token = request_profiler.start()
+        status = 500
+        if sampler:
+            sampler.__enter__()
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            if sampler:
+                sampler.__exit__()
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            request_profiler.finish(
+                profile, token, request.method, route, request.url.path, status, time.perf_counter() - t0
+            )
+        if sampler:
+            response.headers["X-Profile-Id"] = request_profiler.store_capture(sampler.collapsed())
+        return response
+
 # Include API routes
 app.include_router(router, prefix="/api")
 
@@ -98,9 +215,30 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Detailed health check"""
+    """Detailed health check (last background check)"""
+    ready, result = health_monitor.ready()
+    checks = result["checks"]
+    mqtt = checks.get("mqtt")
     return {
-        "status": "healthy",
-        "database": "connected",
-        "mqtt": "connected"
-    }
\ No newline at end of file
+        "status": "healthy" if ready else "degraded",
+        "database": "connected" if checks.get("db_write", {}).get("ok") else "unavailable",
+        "mqtt": "disabled" if mqtt is None else ("connected" if mqtt["connected"] else "disconnected"),
+        "mqtt_consumer": consumer_coordinator.describe(),
+        **result,
+    }
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the event loop and the writer are running"""
+    ok, body = health_monitor.live()
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: DB write latency, MQTT, writer queue and ingest lag within limits"""
+    ok, body = health_monitor.ready()
+    return JSONResponse(body, status_code=200 if ok else 503)
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition"""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,214 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and fixed-bucket histograms keyed by label values. An
+observation is a dict lookup, a bisect and a few additions under a
+per-metric lock, so it is cheap enough for per-message hot paths.
+Values owned by other modules (queue depths, admission counters) are
+collected at scrape time through registered callbacks instead of being
+pushed on every change.
+
+SQL statements are counted per HTTP request through a ContextVar set by
+the request middleware (see `count_sql`); raw DBAPI cursors bypass it.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+# Scrape-time source: yields (label values, value)
+Collector = Callable[[], Iterable[tuple[tuple, float]]]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), fn: Optional[Collector] = None):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+        self._fn = fn
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        if self._fn is not None:
+            items = list(self._fn())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}   # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *label_values) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out = []
+        for key, s in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-2]):
+                cumulative += n
+                le = 'le="' + _fmt_value(bound) + '"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(s[-2])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {s[-1]}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = (), fn: Optional[Collector] = None) -> Counter:
+        return self._add(Counter(name, help, labels, fn))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = (), fn: Optional[Collector] = None) -> Gauge:
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            samples = m.collect()
+            if samples:
+                lines += m.header() + samples
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# =========================================================
+# INGEST / QUERY METRICS
+# =========================================================
+
+DECODE_SECONDS = registry.histogram("aq_ingest_decode_seconds", "Payload JSON decode + mapping time")
+ALERT_EVAL_SECONDS = registry.histogram("aq_alert_eval_seconds", "Server-side alert evaluation time")
+DB_COMMIT_SECONDS = registry.histogram("aq_db_commit_seconds", "Measurement insert + commit time", ("path",))
+BATCH_SIZE = registry.histogram("aq_ingest_batch_size", "Rows per writer commit", buckets=SIZE_BUCKETS)
+RECEIVE_TO_COMMIT_SECONDS = registry.histogram(
+    "aq_ingest_receive_to_commit_seconds", "MQTT receive to DB commit latency"
+)
+ANOMALY_EVAL_SECONDS = registry.histogram(
+    "aq_anomaly_eval_seconds", "Anomaly engine scoring time per write batch"
+)
+FORECAST_STEP_SECONDS = registry.histogram(
+    "aq_forecast_step_seconds", "Forecasting job step time", ("step",), buckets=LATENCY_BUCKETS + (30.0, 60.0)
+)
+ALERT_PUSH_SECONDS = registry.histogram(
+    "aq_alert_push_seconds", "Alert message receipt to SSE push (API process)"
+)
+ALERT_COMMIT_SECONDS = registry.histogram(
+    "aq_alert_commit_seconds", "Alert message receipt to alert_events commit (MQTT consumer)"
+)
+HTTP_SECONDS = registry.histogram(
+    "aq_http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+SQL_PER_REQUEST = registry.histogram(
+    "aq_sql_queries_per_request", "SQL statements executed per HTTP request", ("route",), buckets=SIZE_BUCKETS
+)
+SQL_QUERIES = registry.counter("aq_sql_queries_total", "SQL statements executed through the engine")
+
+
+# =========================================================
+# SQL COUNTING
+# =========================================================
+
+# Mutable cell so increments made in threadpool copies of the context are seen
+_sql_count: ContextVar[Optional[list]] = ContextVar("aq_sql_count", default=None)
+
+
+def start_sql_count() -> tuple[list, object]:
+    cell = [0]
+    return cell, _sql_count.set(cell)
+
+
+def stop_sql_count(token) -> None:
+    _sql_count.reset(token)
+
+
+def count_sql(*_args) -> None:
+    """SQLAlchemy before_cursor_execute listener"""
+    SQL_QUERIES.inc()
+    cell = _sql_count.get()
+    if cell is not None:
+        cell[0] += 1
+
+
+def since(t0: float) -> float:
+    return time.perf_counter() - t0
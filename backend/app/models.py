@@ -63,4 +63,89 @@ class Measurement(Base):
 
 
 # Composite index for efficient queries
-Index("ix_device_ts", Measurement.device_id, Measurement.ts)
\ No newline at end of file
+Index("ix_device_ts", Measurement.device_id, Measurement.ts)
+
+class AlertEvent(Base):
+    """Gateway /alert and /anomaly messages (alert fast path, app/live_alerts.py)"""
+    __tablename__ = "alert_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[str] = mapped_column(String(64))
+    kind: Mapped[str] = mapped_column(String(16))   # alert / anomaly
+    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)  # reading time
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
+
+    status: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    eco2_ppm: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    tvoc_ppb: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    aq_score: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    anom_eco2: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    anom_tvoc: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    frame_counter: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+
+Index("ix_alert_events_device_ts", AlertEvent.device_id, AlertEvent.ts)
+
+
+# ==================== FORECASTING (app/forecasting.py) ====================
+
+class HourlyRollup(Base):
+    """Per device and UTC hour sums of `measurements`, maintained incrementally"""
+    __tablename__ = "hourly_rollups"
+    # Clustered by hour: the forecaster reads whole hour ranges in key order
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    hour: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)   # hour start, UTC
+    device_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+
+    samples: Mapped[int] = mapped_column(Integer, default=0)
+    eco2_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    eco2_n: Mapped[int] = mapped_column(Integer, default=0)
+    eco2_max: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    tvoc_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    tvoc_n: Mapped[int] = mapped_column(Integer, default=0)
+    tvoc_max: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    alerts: Mapped[int] = mapped_column(Integer, default=0)
+
+
+
+class Forecast(Base):
+    """Server forecast of one device's hourly mean; kept after the hour for scoring"""
+    __tablename__ = "forecasts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[str] = mapped_column(String(64))
+    target_hour: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    horizon: Mapped[int] = mapped_column(Integer)   # hours ahead of the last complete hour
+    eco2_ppm: Mapped[float | None] = mapped_column(Float, nullable=True)
+    tvoc_ppb: Mapped[float | None] = mapped_column(Float, nullable=True)
+    made_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
+
+
+Index("ux_forecasts_device_hour", Forecast.device_id, Forecast.target_hour, unique=True)
+Index("ix_forecasts_target_hour", Forecast.target_hour)
+
+
+class ForecastAccuracy(Base):
+    """Running error sums per device, forecast source (tinyml / server) and metric"""
+    __tablename__ = "forecast_accuracy"
+
+    device_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    source: Mapped[str] = mapped_column(String(16), primary_key=True)
+    metric: Mapped[str] = mapped_column(String(16), primary_key=True)   # eco2_ppm / tvoc_ppb
+
+    n: Mapped[int] = mapped_column(Integer, default=0)
+    sum_abs_err: Mapped[float] = mapped_column(Float, default=0.0)
+    sum_sq_err: Mapped[float] = mapped_column(Float, default=0.0)
+    sum_err: Mapped[float] = mapped_column(Float, default=0.0)          # predicted - actual
+    sum_actual: Mapped[float] = mapped_column(Float, default=0.0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
+
+
+class JobCursor(Base):
+    """High-water marks of incremental batch jobs"""
+    __tablename__ = "job_cursors"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, default=0)   # measurement id or epoch hour
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
@@ -5,160 +5,456 @@ Windows-compatible async implementation using aiomqtt
 import asyncio
 import json
 import logging
+import os
+import socket
+import time
 from datetime import datetime, timezone
 from typing import Optional
 
 import aiomqtt  # type: ignore
-from sqlalchemy.orm import Session
 
-from .database import SessionLocal
 from .models import Measurement
 from .config import settings
+from .frames import FrameError, decode_frames
+from .coordination import consumer_coordinator
+from .batch_writer import BatchWriter, batch_writer
+from .spool import Spool, SpoolReplayer
+from .admission import ADMITTED, admission
+from .live_alerts import alert_event, alert_writer, live_alerts
+from .metrics import DECODE_SECONDS, registry, since
+from .registry import device_registry
 
 logger = logging.getLogger(__name__)
 
 
+# Payload keys (short and long names) a reading may only fill with numbers
+_NUMERIC_KEYS = frozenset((
+    "ts", "ts_ms", "t", "h", "p", "v", "e", "s", "pe", "pv", "fc", "rssi", "snr", "sample_ms",
+    "temp_c", "hum_rh", "pressure_hpa", "press_hpa", "tvoc_ppb", "eco2_ppm", "aq_score",
+    "pred_eco2_60m", "pred_tvoc_60m",
+))
+_NUMBER = (int, float, bool, type(None))
+
+
+def _invalid_fields(payload: dict) -> Optional[str]:
+    """First field with a value of the wrong type (numbers / status string), or None"""
+    for key, value in payload.items():
+        if key in _NUMERIC_KEYS and type(value) not in _NUMBER:
+            return key
+    status = payload.get("st") or payload.get("status")
+    if status is not None and not isinstance(status, str):
+        return "status"
+    return None
+
+
+def decode_payload(payload: dict, device_id: str) -> Measurement:
+    """Map a gateway JSON payload (short or long field names) to a Measurement"""
+    # Timestamp
+    ts_raw = payload.get("ts")  # Gateway ts (seconds since boot)
+    ts_ms = payload.get("ts_ms")
+    
+    # Convert timestamp
+    if ts_ms:
+        ts = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc)
+    elif ts_raw:
+        # Gateway timestamp - use current time instead
+        ts = datetime.now(timezone.utc)
+    else:
+        ts = datetime.now(timezone.utc)
+
+    # ✅ Gateway field mapping - support both formats
+    # Temperature: Gateway sends "t" as x10 (234 = 23.4°C)
+    temp_c = None
+    if payload.get("t") is not None:
+        temp_c = payload.get("t") / 10.0
+    elif payload.get("temp_c") is not None:
+        temp_c = payload.get("temp_c")
+    
+    # Humidity: Gateway sends "h" as x10 (291 = 29.1%)
+    hum_rh = None
+    if payload.get("h") is not None:
+        hum_rh = payload.get("h") / 10.0
+    elif payload.get("hum_rh") is not None:
+        hum_rh = payload.get("hum_rh")
+    
+    # Pressure: Gateway sends "p" directly
+    pressure_hpa = payload.get("p") or payload.get("pressure_hpa") or payload.get("press_hpa")
+    
+    # TVOC: Gateway sends "v"
+    tvoc_ppb = payload.get("v") if payload.get("v") is not None else payload.get("tvoc_ppb")
+    
+    # eCO2: Gateway sends "e"
+    eco2_ppm = payload.get("e") if payload.get("e") is not None else payload.get("eco2_ppm")
+    
+    # Score: Gateway sends "s"
+    aq_score = payload.get("s") if payload.get("s") is not None else payload.get("aq_score")
+    
+    # Predictions: Gateway sends "pe" and "pv"
+    pred_eco2_60m = payload.get("pe") if payload.get("pe") is not None else payload.get("pred_eco2_60m")
+    pred_tvoc_60m = payload.get("pv") if payload.get("pv") is not None else payload.get("pred_tvoc_60m")
+    
+    # Anomalies: Gateway sends "ae" and "av"
+    anom_eco2 = payload.get("ae", False) or payload.get("anom_eco2", False)
+    anom_tvoc = payload.get("av", False) or payload.get("anom_tvoc", False)
+    
+    # Delta alert: Gateway sends "da"
+    alert = payload.get("da", False) or payload.get("alert", False) or payload.get("delta_alert", False)
+    
+    # ✅ CRITICAL: Status - Gateway sends "st"
+    status = payload.get("st") or payload.get("status", "NORMAL")
+    
+    # Frame counter: Gateway sends "fc"
+    frame_counter = payload.get("fc")
+
+    return Measurement(
+        device_id=device_id,
+        ts=ts,
+        temp_c=temp_c,
+        hum_rh=hum_rh,
+        pressure_hpa=pressure_hpa,
+        tvoc_ppb=tvoc_ppb,
+        eco2_ppm=eco2_ppm,
+        rssi=payload.get("rssi"),
+        snr=payload.get("snr"),
+        aq_score=aq_score,
+        pred_eco2_60m=pred_eco2_60m,
+        pred_tvoc_60m=pred_tvoc_60m,
+        anom_eco2=anom_eco2,
+        anom_tvoc=anom_tvoc,
+        alert=alert,
+        status=status,
+        sample_ms=payload.get("sample_ms"),
+        frame_counter=frame_counter
+    )
+
+
+def decode_message(raw: bytes) -> Optional[Measurement]:
+    """Raw MQTT payload -> Measurement, or None when the reading is dropped"""
+    t0 = time.perf_counter()
+    # Parse JSON payload
+    payload = json.loads(raw.decode())
+    # Per-message line only at DEBUG: formatting it costs real CPU at high rates
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📥 MQTT Message: {payload}")
+
+    if not isinstance(payload, dict):
+        logger.warning("⚠️ MQTT message that is not a JSON object dropped")
+        return None
+
+    # ✅ Gateway JSON mapping - support both formats
+    device_id = payload.get("id") or payload.get("device_id")
+    if not device_id or not isinstance(device_id, str):
+        logger.warning("⚠️ MQTT message without device id dropped")
+        return None
+    bad = _invalid_fields(payload)
+    if bad is not None:
+        logger.warning(f"⚠️ MQTT message from {device_id} dropped: bad {bad!r} value")
+        return None
+    if settings.INGEST_REQUIRE_REGISTERED and not device_registry.known(device_id):
+        logger.warning(f"⚠️ Unregistered device dropped: {device_id}")
+        return None
+    m = decode_payload(payload, device_id)
+    DECODE_SECONDS.observe(since(t0))
+    return m
+
+
+def _batch_reading(payload) -> Optional[Measurement]:
+    """One reading of a batch envelope, or None when it is unusable"""
+    if not isinstance(payload, dict):
+        return None
+    device_id = payload.get("id") or payload.get("device_id")
+    if not isinstance(device_id, str):
+        return None
+    if _invalid_fields(payload) is not None:
+        return None
+    if settings.INGEST_REQUIRE_REGISTERED and not device_registry.known(device_id):
+        return None
+    try:
+        return decode_payload(payload, device_id)
+    except (ValueError, OverflowError, OSError):  # timestamp out of range
+        return None
+
+
+def decode_batch(raw: bytes) -> list[Measurement]:
+    """
+    Gateway batch envelope -> Measurements in envelope order.
+
+    `{"gw": "<gateway id>", "readings": [<gateway JSON>, ...]}` (or `"r"`, or
+    a bare array); every reading carries its node's id. The envelope is
+    parsed once; readings that are not usable are dropped one by one.
+    """
+    t0 = time.perf_counter()
+    envelope = json.loads(raw)
+    readings = envelope.get("readings", envelope.get("r")) if isinstance(envelope, dict) else envelope
+    if not isinstance(readings, list):
+        logger.error("❌ Batch envelope without a readings array dropped")
+        return []
+    if len(readings) > settings.MQTT_BATCH_MAX_READINGS:
+        logger.error(f"❌ Batch envelope with {len(readings)} readings dropped (max {settings.MQTT_BATCH_MAX_READINGS})")
+        return []
+    rows = []
+    for payload in readings:
+        m = _batch_reading(payload)
+        if m is not None:
+            rows.append(m)
+    if len(rows) < len(readings):
+        logger.warning(f"⚠️ {len(readings) - len(rows)} of {len(readings)} batch reading(s) dropped")
+    DECODE_SECONDS.observe(since(t0))
+    return rows
+
+
+def decode_topic_message(topic: str, raw: bytes) -> list[Measurement]:
+    """Any subscribed topic -> Measurements: binary frames on /<MQTT_BINARY_SUFFIX>, batch envelopes on /<MQTT_BATCH_SUFFIX>, JSON otherwise"""
+    if topic.endswith("/" + settings.MQTT_BINARY_SUFFIX):
+        t0 = time.perf_counter()
+        device_id = topic_device(topic)
+        if not device_id:
+            logger.warning(f"⚠️ Binary frame on unexpected topic dropped: {topic}")
+            return []
+        if settings.INGEST_REQUIRE_REGISTERED and not device_registry.known(device_id):
+            logger.warning(f"⚠️ Unregistered device dropped: {device_id}")
+            return []
+        try:
+            rows = decode_frames(raw, device_id)
+        except FrameError as e:
+            logger.error(f"❌ Binary frame error ({device_id}): {e}")
+            return []
+        DECODE_SECONDS.observe(since(t0))
+        return rows
+    if is_batch_topic(topic):
+        return decode_batch(raw)
+    m = decode_message(raw)
+    return [] if m is None else [m]
+
+
+def is_batch_topic(topic: str) -> bool:
+    return topic.endswith("/" + settings.MQTT_BATCH_SUFFIX)
+
+
+ALERT_SUFFIXES = ("alert", "anomaly")
+
+
+def alert_kind(topic: str) -> Optional[str]:
+    """'alert' / 'anomaly' for the gateway's alert fast path topics, else None"""
+    suffix = topic.rpartition("/")[2]
+    return suffix if suffix in ALERT_SUFFIXES else None
+
+
+def topic_device(topic: str) -> Optional[str]:
+    """
+    Routing key of a topic: the device id of '<prefix><device_id>/data',
+    '.../<MQTT_BINARY_SUFFIX>', '.../alert' and '.../anomaly', the gateway id of '.../<MQTT_BATCH_SUFFIX>'
+    (so all batches of a gateway, and the order of its nodes' readings, stay
+    on one consumer / worker)
+    """
+    prefix = settings.MQTT_TOPIC_PREFIX
+    if topic.startswith(prefix):
+        device, _, suffix = topic[len(prefix):].rpartition("/")
+        if suffix in ("data", settings.MQTT_BINARY_SUFFIX, settings.MQTT_BATCH_SUFFIX) or suffix in ALERT_SUFFIXES:
+            return device or None
+    return None
+
+
+def is_priority(m: Measurement) -> bool:
+    """Readings that are never shed under load"""
+    return bool(m.alert or m.anom_eco2 or m.anom_tvoc) or m.status in ("WARN", "HIGH")
+
+
 class MQTTSubscriber:
-    def __init__(self):
+    def __init__(self, writer: BatchWriter = batch_writer):
         self.broker = settings.MQTT_BROKER
         self.port = settings.MQTT_PORT
-        self.topic = f"{settings.MQTT_TOPIC_PREFIX}+/data"  # Wildcard: tüm device'lar
+        self.topic_prefix = settings.MQTT_TOPIC_PREFIX
+        self.topic = f"{self.topic_prefix}+/data"  # Wildcard: tüm device'lar
+        self.topics = [
+            self.topic,
+            f"{self.topic_prefix}+/{settings.MQTT_BINARY_SUFFIX}",
+            f"{self.topic_prefix}+/{settings.MQTT_BATCH_SUFFIX}",
+            *(f"{self.topic_prefix}+/{suffix}" for suffix in ALERT_SUFFIXES),
+        ]
         self.client: Optional[aiomqtt.Client] = None
+        self.writer = writer
+        self.dispatcher = None   # IngestPool: raw payloads go to worker processes
+        self.spool: Optional[Spool] = None
+        self.replayer: Optional[SpoolReplayer] = None
+        self._manual_ack = False
         self.running = False
+        self.connected = False
+        self.received = 0
+        self.dropped = 0
         self._reconnect_interval = 5
 
     async def process_message(self, message: aiomqtt.Message):
-        """Process incoming MQTT message and save to database"""
+        """Decode an incoming MQTT message and queue its reading(s) for the batch writer"""
         try:
-            # Parse JSON payload
-            payload = json.loads(message.payload.decode())
-            logger.info(f"📥 MQTT Message: {payload}")
-
-            # ✅ Gateway JSON mapping - support both formats
-            device_id = payload.get("id") or payload.get("device_id", "unknown")
-            
-            # Timestamp
-            ts_raw = payload.get("ts")  # Gateway ts (seconds since boot)
-            ts_ms = payload.get("ts_ms")
-            
-            # Convert timestamp
-            if ts_ms:
-                ts = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc)
-            elif ts_raw:
-                # Gateway timestamp - use current time instead
-                ts = datetime.now(timezone.utc)
-            else:
-                ts = datetime.now(timezone.utc)
-
-            # ✅ Gateway field mapping - support both formats
-            # Temperature: Gateway sends "t" as x10 (234 = 23.4°C)
-            temp_c = None
-            if payload.get("t") is not None:
-                temp_c = payload.get("t") / 10.0
-            elif payload.get("temp_c") is not None:
-                temp_c = payload.get("temp_c")
-            
-            # Humidity: Gateway sends "h" as x10 (291 = 29.1%)
-            hum_rh = None
-            if payload.get("h") is not None:
-                hum_rh = payload.get("h") / 10.0
-            elif payload.get("hum_rh") is not None:
-                hum_rh = payload.get("hum_rh")
-            
-            # Pressure: Gateway sends "p" directly
-            pressure_hpa = payload.get("p") or payload.get("pressure_hpa") or payload.get("press_hpa")
-            
-            # TVOC: Gateway sends "v"
-            tvoc_ppb = payload.get("v") if payload.get("v") is not None else payload.get("tvoc_ppb")
-            
-            # eCO2: Gateway sends "e"
-            eco2_ppm = payload.get("e") if payload.get("e") is not None else payload.get("eco2_ppm")
-            
-            # Score: Gateway sends "s"
-            aq_score = payload.get("s") if payload.get("s") is not None else payload.get("aq_score")
-            
-            # Predictions: Gateway sends "pe" and "pv"
-            pred_eco2_60m = payload.get("pe") if payload.get("pe") is not None else payload.get("pred_eco2_60m")
-            pred_tvoc_60m = payload.get("pv") if payload.get("pv") is not None else payload.get("pred_tvoc_60m")
-            
-            # Anomalies: Gateway sends "ae" and "av"
-            anom_eco2 = payload.get("ae", False) or payload.get("anom_eco2", False)
-            anom_tvoc = payload.get("av", False) or payload.get("anom_tvoc", False)
-            
-            # Delta alert: Gateway sends "da"
-            alert = payload.get("da", False) or payload.get("alert", False) or payload.get("delta_alert", False)
-            
-            # ✅ CRITICAL: Status - Gateway sends "st"
-            status = payload.get("st") or payload.get("status", "NORMAL")
-            
-            # Frame counter: Gateway sends "fc"
-            frame_counter = payload.get("fc")
-
-            # Create measurement
-            measurement = Measurement(
-                device_id=device_id,
-                ts=ts,
-                temp_c=temp_c,
-                hum_rh=hum_rh,
-                pressure_hpa=pressure_hpa,
-                tvoc_ppb=tvoc_ppb,
-                eco2_ppm=eco2_ppm,
-                rssi=payload.get("rssi"),
-                snr=payload.get("snr"),
-                aq_score=aq_score,
-                pred_eco2_60m=pred_eco2_60m,
-                pred_tvoc_60m=pred_tvoc_60m,
-                anom_eco2=anom_eco2,
-                anom_tvoc=anom_tvoc,
-                alert=alert,
-                status=status,
-                sample_ms=payload.get("sample_ms"),
-                frame_counter=frame_counter
-            )
-
-            # Save to database
-            db = SessionLocal()
-            try:
-                db.add(measurement)
-                db.commit()
-                db.refresh(measurement)
-                logger.info(f"✅ Saved to DB: device={device_id} status={measurement.status} eco2={measurement.eco2_ppm} tvoc={measurement.tvoc_ppb}")
-            finally:
-                db.close()
+            received_at = time.monotonic()
+            topic = message.topic.value
+            kind = alert_kind(topic)
+            if kind is not None:
+                # Duplicate of a /data reading: only the alert event is stored, ahead of the batch writer
+                m = decode_message(message.payload)
+                if m is None:
+                    self.dropped += 1
+                    return
+                alert_writer.submit(alert_event(kind, m), received_at)
+                return
+            measurements = decode_topic_message(topic, message.payload)
+            if not measurements:
+                self.dropped += 1
+                return
+            # Batch envelopes skip per-message admission: rate limits apply per node here
+            per_reading = is_batch_topic(topic)
+            admitted = []
+            for measurement in measurements:
+                measurement._received_at = received_at  # receive -> commit latency
+                if per_reading and admission.admit("mqtt", measurement.device_id, measurement, self.writer.put) not in ADMITTED:
+                    continue
+                depth = self.writer.depth() + len(admitted)
+                if admission.should_shed(depth, self.writer.queue_size, is_priority(measurement)):
+                    admission.shed("mqtt", measurement.device_id)
+                    continue
+                admitted.append(measurement)
+            await self.writer.put_many(admitted)
 
         except json.JSONDecodeError as e:
+            self.dropped += 1
             logger.error(f"❌ JSON decode error: {e}")
         except Exception as e:
+            self.dropped += 1
             logger.error(f"❌ Error processing message: {e}", exc_info=True)
 
     async def run(self):
         """Main MQTT subscriber loop with graceful shutdown"""
         logger.info(f"🔄 Starting MQTT subscriber: {self.broker}:{self.port}")
-        logger.info(f"📡 Subscribing to: {self.topic}")
+        logger.info(f"📡 Subscribing to: {', '.join(self.topics)}")
         
         self.running = True
 
+        # Only one worker (or one per shard) consumes; the rest wait as standby
+        await consumer_coordinator.wait_until_active()
+        shard_task = asyncio.create_task(consumer_coordinator.maintain())
+        admission.start_flusher()
+        replay_task = self._start_spool() if settings.SPOOL_ENABLED else None
+        try:
+            await self._consume()
+        finally:
+            shard_task.cancel()
+            if replay_task is not None:
+                # Finish the batch in flight; the rest stays spooled for the next start
+                self.replayer.stop()
+                await asyncio.shield(replay_task)
+                self.spool.close()
+            consumer_coordinator.release()
+
+        logger.info("✅ MQTT subscriber stopped gracefully")
+
+    # ---------- spool mode ----------
+
+    def _start_spool(self) -> asyncio.Task:
+        spool_dir = settings.SPOOL_DIR or os.path.join(
+            os.path.dirname(os.path.abspath(settings.DB_PATH)), "spool"
+        )
+        self.spool = Spool(spool_dir, settings.SPOOL_SEGMENT_BYTES, settings.SPOOL_FSYNC_MS)
+        self.spool.open()
+        self.replayer = SpoolReplayer(self.spool, decode_topic_message, BatchWriter._write, settings.INGEST_BATCH_SIZE)
+        logger.info(f"📼 Ingest spool: {spool_dir}")
+        return asyncio.create_task(self.replayer.run())
+
+    def _client_args(self) -> dict:
+        """Spool mode: stable client id + persistent session so the broker keeps unacked QoS1 messages"""
+        if self.spool is None:
+            return {}
+        client_id = settings.MQTT_CLIENT_ID or f"know-the-air-{socket.gethostname()}"
+        if consumer_coordinator.mode == "shard":
+            client_id += f"-shard{min(consumer_coordinator.owned_slots())}"
+        return {"identifier": client_id, "clean_session": False}
+
+    def _enable_manual_ack(self, client: aiomqtt.Client) -> bool:
+        # aiomqtt 2.x has no public switch; paho acks on receipt unless told otherwise
+        try:
+            client._client.manual_ack_set(True)
+            return True
+        except AttributeError:
+            logger.warning("⚠️ paho without manual ack: messages are acked on receipt, not after spooling")
+            return False
+
+    def _ack(self, message: aiomqtt.Message) -> None:
+        if self._manual_ack and message.qos > 0:
+            self.client._client.ack(message.mid, message.qos)
+
+    async def _route(self, message: aiomqtt.Message, device: Optional[str], ack: bool = True) -> None:
+        """Hand an admitted message to the spool, the process pool or the in-process writer"""
+        if self.spool is not None:
+            # Durable first, then PUBACK; the replayer writes to the DB
+            self.spool.append(message.topic.value, bytes(message.payload))
+            if ack:
+                self._ack(message)
+        elif self.dispatcher is not None:
+            if admission.should_shed(self.dispatcher.depth(), self.dispatcher.capacity()):
+                admission.shed("mqtt", device or "")
+                return
+            await self.dispatcher.submit(device or "", message.topic.value, bytes(message.payload))
+        else:
+            await self.process_message(message)
+
+    async def _route_held(self, message: aiomqtt.Message) -> None:
+        """Coalesce flusher: the message was acked when it was held"""
+        await self._route(message, self._topic_device(message.topic.value), ack=False)
+
+    def _topic_device(self, topic: str) -> Optional[str]:
+        return topic_device(topic)
+
+    async def _consume(self):
         while self.running:
             try:
-                async with aiomqtt.Client(
+                self.client = aiomqtt.Client(
                     hostname=self.broker,
                     port=self.port,
-                    keepalive=60
-                ) as client:
-                    await client.subscribe(self.topic)
-                    logger.info(f"✅ MQTT connected and subscribed to {self.topic}")
+                    keepalive=60,
+                    **self._client_args()
+                )
+                self._manual_ack = self.spool is not None and self._enable_manual_ack(self.client)
+                async with self.client as client:
+                    for topic in self.topics:
+                        await client.subscribe(topic, qos=1 if self.spool is not None else 0)
+                    self.connected = True
+                    logger.info(f"✅ MQTT connected and subscribed to {', '.join(self.topics)}")
 
                     async for message in client.messages:
                         if not self.running:
                             logger.info("🛑 Stopping MQTT message loop...")
                             break
-                        await self.process_message(message)
+                        # Shard mode: skip other workers' devices before decoding
+                        device = self._topic_device(message.topic.value)
+                        if device is not None and not consumer_coordinator.owns(device):
+                            self._ack(message)
+                            continue
+                        self.received += 1
+                        if alert_kind(message.topic.value) is not None:
+                            # Alert fast path: never spooled, pooled or rate limited
+                            await self.process_message(message)
+                            self._ack(message)
+                            continue
+                        if is_batch_topic(message.topic.value):
+                            await self._route(message, device)  # readings are admitted per node after decoding
+                            continue
+                        if settings.INGEST_REQUIRE_REGISTERED and not device_registry.known(device or ""):
+                            # Not tracked by admission (random topics would grow it); decoding drops it
+                            await self._route(message, device)
+                            continue
+                        decision = admission.admit("mqtt", device or "", message, self._route_held)
+                        if decision not in ADMITTED:
+                            self._ack(message)  # dropped, or held in memory by coalesce
+                            continue
+                        await self._route(message, device)
 
             except asyncio.CancelledError:
+                self.connected = False
                 logger.info("🛑 MQTT task cancelled")
                 self.running = False
                 break
             except aiomqtt.MqttError as e:
+                self.connected = False
                 if self.running:  # Only reconnect if we're still supposed to be running
                     logger.error(f"❌ MQTT connection error: {e}")
                     logger.info(f"🔄 Reconnecting in {self._reconnect_interval} seconds...")
@@ -172,16 +468,75 @@ class MQTTSubscriber:
                 else:
                     break
 
-        logger.info("✅ MQTT subscriber stopped gracefully")
-
     async def stop(self):
         """Gracefully stop the MQTT subscriber"""
         logger.info("🛑 Stopping MQTT subscriber...")
         self.running = False
 
 
+class AlertListener:
+    """
+    API side of the alert fast path: its own connection, subscribed to
+    +/alert and +/anomaly only, feeding `live_alerts` (no database writes).
+    Runs in every API process, whether or not it consumes +/data.
+    """
+
+    def __init__(self):
+        self.topics = [f"{settings.MQTT_TOPIC_PREFIX}+/{suffix}" for suffix in ALERT_SUFFIXES]
+        self.running = False
+        self.connected = False
+        self.received = 0
+        self._reconnect_interval = 5
+
+    def handle(self, topic: str, raw: bytes, received_at: float) -> Optional[dict]:
+        kind = alert_kind(topic)
+        try:
+            m = decode_message(raw) if kind is not None else None
+        except Exception as e:
+            logger.error(f"❌ Alert message not decodable ({topic}): {e}")
+            return None
+        if m is None:
+            return None
+        return live_alerts.publish(alert_event(kind, m), received_at)
+
+    async def run(self) -> None:
+        self.running = True
+        while self.running:
+            try:
+                async with aiomqtt.Client(hostname=settings.MQTT_BROKER, port=settings.MQTT_PORT, keepalive=60) as client:
+                    for topic in self.topics:
+                        await client.subscribe(topic)
+                    self.connected = True
+                    logger.info(f"✅ Alert listener subscribed to {', '.join(self.topics)}")
+                    async for message in client.messages:
+                        self.received += 1
+                        self.handle(message.topic.value, message.payload, time.monotonic())
+            except asyncio.CancelledError:
+                self.connected = False
+                self.running = False
+                raise
+            except aiomqtt.MqttError as e:
+                self.connected = False
+                logger.error(f"❌ Alert listener connection error: {e}; retrying in {self._reconnect_interval} s")
+                await asyncio.sleep(self._reconnect_interval)
+            except Exception as e:
+                self.connected = False
+                logger.error(f"❌ Alert listener error: {e}; retrying in {self._reconnect_interval} s", exc_info=True)
+                await asyncio.sleep(self._reconnect_interval)
+
+
 # Global subscriber instance
 mqtt_subscriber = MQTTSubscriber()
+alert_listener = AlertListener()
+
+registry.counter("aq_mqtt_messages_total", "MQTT messages by outcome", ("outcome",),
+                 fn=lambda: [(("received",), mqtt_subscriber.received), (("dropped",), mqtt_subscriber.dropped)])
+registry.gauge("aq_mqtt_connected", "1 while the MQTT client is connected",
+               fn=lambda: [((), int(mqtt_subscriber.connected))])
+registry.gauge("aq_ingest_pool_depth", "Raw payloads queued for ingest worker processes",
+               fn=lambda: [((), mqtt_subscriber.dispatcher.depth())] if mqtt_subscriber.dispatcher else [])
+registry.gauge("aq_spool_pending_bytes", "Spooled bytes not yet committed to the database",
+               fn=lambda: [((), mqtt_subscriber.spool.pending_bytes())] if mqtt_subscriber.spool else [])
 
 
 async def start_mqtt_subscriber():
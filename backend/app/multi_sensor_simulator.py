@@ -41,9 +41,9 @@ def generate_sensor_data(device):
         "temp_c": round(device["base_temp"] + temp_variation, 2),
         "hum_rh": round(device["base_hum"] + hum_variation, 2),
         "pressure_hpa": round(random.uniform(1000.0, 1020.0), 2),
-        "tvoc_ppb": round(random.uniform(0, 500), 2),
-        "eco2_ppm": round(random.uniform(400, 1500), 2),
-        "rssi": round(random.uniform(-80, -40), 2),
+        "tvoc_ppb": random.randint(0, 500),
+        "eco2_ppm": random.randint(400, 1500),
+        "rssi": random.randint(-80, -40),
         "snr": round(random.uniform(5, 15), 2)
     }
 
@@ -53,13 +53,15 @@ def send_data_for_device(device):
         "Content-Type": "application/json",
         "X-API-Key": API_KEY
     }
+    # Her thread kendi keep-alive bağlantısını kullanır
+    session = requests.Session()
     
     while True:
         data = generate_sensor_data(device)
         
         try:
-            response = requests.post(
-                f"{BACKEND_URL}/ingest",
+            response = session.post(
+                f"{BACKEND_URL}/api/ingest",
                 json=data,
                 headers=headers
             )
@@ -76,6 +78,7 @@ def send_data_for_device(device):
 
 def main():
     print(f"🌡️  Çoklu sensör simülatörü başlatıldı")
+    print(f"ℹ️  Yük testi için: python -m benchmarks.loadgen --devices 10000 --rate 500")
     print(f"📡 Backend: {BACKEND_URL}")
     print(f"🔢 {len(DEVICES)} cihaz simüle ediliyor\n")
     
@@ -0,0 +1,256 @@
+"""
+Opt-in request profiler (PROFILING_ENABLED).
+
+For every HTTP request: SQL statements, DB time (execute + fetch), rows
+fetched and Python time (wall minus DB). Statements are grouped by shape (literals and IN
+lists collapsed); a shape repeated PROFILING_N_PLUS_ONE_MIN times in one
+request is reported as an N+1 suspect. The slowest requests are kept for
+GET /api/debug/requests.
+
+Single-request sampling profile: send `X-Profile: sample` (with the API
+key). The response carries `X-Profile-Id`; the collapsed stacks
+(flamegraph.pl format) are at GET /api/debug/profiles/{id}.
+
+Rows are counted by a sqlite3 cursor subclass installed through
+`connect_args["factory"]` only when profiling is enabled.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class RequestProfile:
+    __slots__ = ("statements", "db_seconds", "rows", "shapes")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.shapes: Counter = Counter()
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("aq_request_profile", default=None)
+
+
+# =========================================================
+# SQL HOOKS
+# =========================================================
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """`... WHERE id IN (?, ?, ?) AND x = 5` -> `... WHERE id IN (?...) AND x = ?`"""
+    s = _LITERALS.sub("?", statement)
+    s = _IN_LIST.sub("(?...)", s)
+    return _SPACES.sub(" ", s).strip()
+
+
+def _before_execute(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault("aq_profile_t0", []).append(time.perf_counter())
+
+
+def _after_execute(conn, _cursor, statement, _parameters, _context, _executemany) -> None:
+    p = _current.get()
+    if p is None:
+        return
+    stack = conn.info.get("aq_profile_t0")
+    if stack:
+        p.db_seconds += time.perf_counter() - stack.pop()
+    p.statements += 1
+    p.shapes[statement_shape(statement)] += 1
+
+
+def _add_rows(n: int, t0: float) -> None:
+    p = _current.get()
+    if p is not None:
+        p.rows += n
+        p.db_seconds += time.perf_counter() - t0  # SQLite does most of a SELECT's work while stepping
+
+
+class CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        _add_rows(0 if row is None else 1, t0)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        _add_rows(len(rows), t0)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        _add_rows(len(rows), t0)
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def install(engine) -> None:
+    """Attach the statement timing hooks to an engine"""
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+# =========================================================
+# SAMPLING PROFILER
+# =========================================================
+
+class SamplingProfiler:
+    """
+    Samples thread stacks every interval while active. Only stacks that pass
+    through app/ code are kept, which drops idle threadpool workers and the
+    idle event loop; concurrent requests can still show up.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="aq-sampler", daemon=True)
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(_APP_DIR)
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                if in_app:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+
+# =========================================================
+# PROFILER
+# =========================================================
+
+class RequestProfiler:
+    def __init__(self, keep: int, n_plus_one_min: int, sample_interval_ms: float):
+        self.keep = keep
+        self.n_plus_one_min = n_plus_one_min
+        self.sample_interval = sample_interval_ms / 1000.0
+        self.requests = 0
+        self._slowest: list[tuple[float, int, dict]] = []   # min-heap of the `keep` slowest
+        self._suspects: deque = deque(maxlen=keep)          # recent N+1 suspects
+        self.suspect_routes: Counter = Counter()
+        self._captures: OrderedDict[str, str] = OrderedDict()
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self) -> tuple[RequestProfile, object]:
+        p = RequestProfile()
+        return p, _current.set(p)
+
+    def finish(self, p: RequestProfile, token, method: str, route: str, path: str, status: int, seconds: float) -> dict:
+        _current.reset(token)
+        suspects = [
+            {"statement": shape, "count": n}
+            for shape, n in p.shapes.most_common()
+            if n >= self.n_plus_one_min
+        ]
+        record = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "method": method,
+            "route": route,
+            "path": path,
+            "status": status,
+            "ms": round(seconds * 1000.0, 2),
+            "sql_statements": p.statements,
+            "db_ms": round(p.db_seconds * 1000.0, 2),
+            "python_ms": round(max(0.0, seconds - p.db_seconds) * 1000.0, 2),
+            "rows": p.rows,
+            "n_plus_one": suspects,
+        }
+        with self._lock:
+            self.requests += 1
+            item = (seconds, next(self._seq), record)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, item)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+            if suspects:
+                self._suspects.append(record)
+                self.suspect_routes[f"{method} {route}"] += 1
+        if suspects:
+            logger.warning(
+                f"⚠️ N+1 suspect on {method} {route}: "
+                f"{suspects[0]['count']}x {suspects[0]['statement'][:120]}"
+            )
+        return record
+
+    def sampler(self) -> SamplingProfiler:
+        return SamplingProfiler(self.sample_interval)
+
+    def store_capture(self, collapsed: str) -> str:
+        capture_id = f"{int(time.time())}-{next(self._seq)}"
+        with self._lock:
+            self._captures[capture_id] = collapsed
+            while len(self._captures) > self.keep:
+                self._captures.popitem(last=False)
+        return capture_id
+
+    def capture(self, capture_id: str) -> Optional[str]:
+        with self._lock:
+            return self._captures.get(capture_id)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            slowest = [r for _, _, r in sorted(self._slowest, key=lambda x: x[0], reverse=True)]
+            return {
+                "requests": self.requests,
+                "slowest": slowest,
+                "n_plus_one_recent": list(self._suspects),
+                "n_plus_one_routes": dict(self.suspect_routes.most_common()),
+                "captures": list(self._captures),
+            }
+
+
+request_profiler = RequestProfiler(
+    settings.PROFILING_SLOWEST_KEEP, settings.PROFILING_N_PLUS_ONE_MIN, settings.PROFILING_SAMPLE_INTERVAL_MS
+)
@@ -0,0 +1,187 @@
+"""
+In-memory device registry.
+
+The devices table is small and almost never changes, so it is loaded once
+and served from memory with secondary indexes by city and district.
+Every change builds a new immutable snapshot (copy-on-write) and swaps the
+reference, so readers never take a lock. Listeners are notified after each
+swap so derived indexes (map grid, KD-tree, heatmap cache) can follow.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DeviceInfo:
+    """Immutable copy of a Device row; same attribute names as the model"""
+    id: int
+    device_id: str
+    name: str
+    lat: float
+    lon: float
+    city: str
+    district: str
+    created_at: datetime
+
+    @classmethod
+    def from_model(cls, d: Device) -> "DeviceInfo":
+        return cls(
+            id=d.id,
+            device_id=d.device_id,
+            name=d.name,
+            lat=d.lat,
+            lon=d.lon,
+            city=d.city,
+            district=d.district,
+            created_at=d.created_at,
+        )
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    by_id: dict[str, DeviceInfo] = field(default_factory=dict)
+    by_city: dict[str, tuple[DeviceInfo, ...]] = field(default_factory=dict)
+    by_district: dict[tuple[str, str], tuple[DeviceInfo, ...]] = field(default_factory=dict)
+    cities: tuple[str, ...] = ()
+    districts: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    version: tuple[int, int] = (0, 0)   # (row count, max id) in the DB when loaded
+
+    @classmethod
+    def build(cls, devices: list[DeviceInfo], version: tuple[int, int]) -> "_Snapshot":
+        by_id = {d.device_id: d for d in devices}
+        by_city: dict[str, list[DeviceInfo]] = {}
+        by_district: dict[tuple[str, str], list[DeviceInfo]] = {}
+        for d in by_id.values():
+            by_city.setdefault(d.city, []).append(d)
+            by_district.setdefault((d.city, d.district), []).append(d)
+        districts: dict[str, set[str]] = {}
+        for city, district in by_district:
+            if district:
+                districts.setdefault(city, set()).add(district)
+        return cls(
+            by_id=by_id,
+            by_city={k: tuple(v) for k, v in by_city.items()},
+            by_district={k: tuple(v) for k, v in by_district.items()},
+            cities=tuple(sorted(c for c in by_city if c)),
+            districts={k: tuple(sorted(v)) for k, v in districts.items()},
+            version=version,
+        )
+
+
+# listener(event, device): event is "reload" (device None) or "add"
+Listener = Callable[[str, Optional[DeviceInfo]], None]
+
+
+class DeviceRegistry:
+    def __init__(self):
+        self._snap = _Snapshot()
+        self._write_lock = threading.Lock()
+        self._listeners: list[Listener] = []
+
+    # ---------- reads (lock-free) ----------
+
+    def __len__(self) -> int:
+        return len(self._snap.by_id)
+
+    def get(self, device_id: str) -> Optional[DeviceInfo]:
+        return self._snap.by_id.get(device_id)
+
+    def known(self, device_id: str) -> bool:
+        return device_id in self._snap.by_id
+
+    def all(self) -> list[DeviceInfo]:
+        return list(self._snap.by_id.values())
+
+    def by_city(self, city: str) -> list[DeviceInfo]:
+        return list(self._snap.by_city.get(city, ()))
+
+    def by_district(self, city: str, district: str) -> list[DeviceInfo]:
+        return list(self._snap.by_district.get((city, district), ()))
+
+    def cities(self) -> list[str]:
+        return list(self._snap.cities)
+
+    def districts(self, city: str) -> list[str]:
+        return list(self._snap.districts.get(city, ()))
+
+    # ---------- writes (copy-on-write) ----------
+
+    def subscribe(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def load(self, db: Session) -> None:
+        """(Re)load every device from the database"""
+        devices = [DeviceInfo.from_model(d) for d in db.execute(select(Device)).scalars().all()]
+        snap = _Snapshot.build(devices, _db_version(db))
+        with self._write_lock:
+            self._snap = snap
+        self._notify("reload", None)
+
+    def refresh_if_changed(self, db: Session) -> bool:
+        """
+        Cheap staleness check for multi-process deployments: devices
+        registered by another worker show up as a changed (count, max id).
+        """
+        if _db_version(db) == self._snap.version:
+            return False
+        self.load(db)
+        logger.info(f"🔄 Device registry reloaded ({len(self)} devices)")
+        return True
+
+    def add(self, device: Device) -> DeviceInfo:
+        """Publish a newly committed device"""
+        info = DeviceInfo.from_model(device)
+        with self._write_lock:
+            old = self._snap
+            devices = [d for d in old.by_id.values() if d.device_id != info.device_id] + [info]
+            count, max_id = old.version
+            self._snap = _Snapshot.build(devices, (count + 1, max(max_id, info.id)))
+        self._notify("add", info)
+        return info
+
+    def _notify(self, event: str, device: Optional[DeviceInfo]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event, device)
+            except Exception as e:
+                logger.error(f"❌ Registry listener failed: {e}", exc_info=True)
+
+
+def _db_version(db: Session) -> tuple[int, int]:
+    count, max_id = db.execute(select(func.count(Device.id), func.max(Device.id))).one()
+    return int(count or 0), int(max_id or 0)
+
+
+device_registry = DeviceRegistry()
+
+
+def _refresh() -> None:
+    db = SessionLocal()
+    try:
+        device_registry.refresh_if_changed(db)
+    finally:
+        db.close()
+
+
+async def run_refresher(interval_seconds: float) -> None:
+    """Background task: pick up devices registered by other processes"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(_refresh)
+        except Exception as e:
+            logger.error(f"❌ Device registry refresh failed: {e}")
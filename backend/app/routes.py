@@ -1,16 +1,44 @@
-from fastapi import APIRouter, Depends, Header, HTTPException, Query
+import asyncio
+import json
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 
-from .database import get_db
+import numpy as np
+
+from .database import SessionLocal, get_db
 from .config import settings
 from .schemas import (
-    IngestPayload, IngestResponse, LatestResponse, MeasurementOut, 
-    HistoryResponse, AlertLatestResponse, AlertHistoryResponse, DeviceCreate, DeviceOut,
-    MapPoint, MapPointsResponse, CitiesResponse, DistrictsResponse
+    IngestPayload, IngestResponse, IngestBatch, IngestBatchResponse, LatestResponse, MeasurementOut, 
+    HistoryResponse, AlertLatestResponse, AlertHistoryResponse, AlertEventOut, AlertEventsResponse,
+    AreaSummary, AreaSummaryResponse, AreaEventOut, AreaEventsResponse,
+    ForecastPoint, ForecastResponse, ForecastAccuracyOut, ForecastAccuracyResponse,
+    DeviceRulesOut, RulesResponse,
+    DeviceCreate, DeviceOut,
+    MapPoint, MapPointsResponse, CitiesResponse, DistrictsResponse,
+    AggregatePoint, AggregateResponse, MapCluster, MapClustersResponse,
+    NearbySensor, NearestResponse, HeatmapTileResponse, ExportResponse
 )
 from . import crud
+from . import aggregates
+from .geo import BBox, geo_index, nearest_index
+from .latest_state import latest_state
+from .registry import device_registry
+from . import heatmap
+from . import downsample as downsampling
+from . import encoding
+from .admission import ADMITTED, COALESCED, KEY_LIMITED, RATE_DROPPED, admission
+from .batch_writer import batch_writer
+from .frames import FrameError, decode_frames
+from .profiling import request_profiler
+from .live_alerts import live_alerts
+from .correlator import LEVELS, area_correlator
+from .forecasting import METRICS as FORECAST_METRICS, SOURCES as FORECAST_SOURCES
+from .rules import rule_engine
 
 
 router = APIRouter()
@@ -19,6 +47,10 @@ def require_api_key(x_api_key: str | None):
     if settings.API_KEY and x_api_key != settings.API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
+def require_writable():
+    if settings.API_READ_ONLY:
+        raise HTTPException(status_code=503, detail="API is read-only; ingest runs in the ingest worker")
+
 @router.get("/health")
 def health():
     return {"ok": True, "name": settings.APP_NAME}
@@ -30,8 +62,141 @@ def ingest(
     x_api_key: Optional[str] = Header(None),
 ):
     require_api_key(x_api_key)
+    require_writable()
+    if settings.INGEST_REQUIRE_REGISTERED and not device_registry.known(payload.device_id):
+        raise HTTPException(status_code=404, detail=f"Device not registered: {payload.device_id}")
+
+    # Writer protection first, then per-key / per-device rate limits
+    if admission.should_shed(batch_writer.depth(), batch_writer.queue_size):
+        admission.shed("http", payload.device_id)
+        raise HTTPException(status_code=503, detail="Ingest overloaded", headers={"Retry-After": "1"})
+    decision = admission.admit("http", payload.device_id, payload, _store_held, api_key=x_api_key or "")
+    if decision in (KEY_LIMITED, RATE_DROPPED):
+        raise HTTPException(status_code=429, detail=f"Rate limit exceeded ({decision})", headers={"Retry-After": "1"})
+    if decision not in ADMITTED:
+        return IngestResponse(ok=decision == COALESCED, id=None, admission=decision)
+
     m = crud.create_measurement(db, payload)
-    return IngestResponse(ok=True, id=m.id)
+    return IngestResponse(ok=True, id=m.id, admission=decision)
+
+
+@router.post("/ingest/batch", response_model=IngestBatchResponse)
+def ingest_batch(
+    batch: IngestBatch,
+    db: Session = Depends(get_db),
+    x_api_key: Optional[str] = Header(None),
+):
+    """Many readings in one request and one transaction; admission applies per reading"""
+    require_api_key(x_api_key)
+    require_writable()
+    if len(batch.readings) > settings.INGEST_HTTP_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {settings.INGEST_HTTP_BATCH_MAX} readings per batch")
+    if admission.should_shed(batch_writer.depth(), batch_writer.queue_size):
+        for p in batch.readings:
+            admission.shed("http", p.device_id)
+        raise HTTPException(status_code=503, detail="Ingest overloaded", headers={"Retry-After": "1"})
+
+    decisions: dict[str, int] = {}
+    admitted = []
+    for p in batch.readings:
+        if settings.INGEST_REQUIRE_REGISTERED and not device_registry.known(p.device_id):
+            decision = "unregistered"
+        else:
+            decision = admission.admit("http", p.device_id, p, _store_held, api_key=x_api_key or "")
+        decisions[decision] = decisions.get(decision, 0) + 1
+        if decision in ADMITTED:
+            admitted.append(p)
+    if not admitted and (decisions.get(KEY_LIMITED) or decisions.get(RATE_DROPPED)):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers={"Retry-After": "1"})
+
+    rows = crud.create_measurements(db, admitted) if admitted else []
+    # ok only when nothing was dropped (held coalesced readings are stored later)
+    dropped = len(batch.readings) - len(admitted) - decisions.get(COALESCED, 0)
+    return IngestBatchResponse(ok=dropped == 0, ids=[m.id for m in rows], decisions=decisions)
+
+
+@router.post("/ingest/frames/{device_id}", response_model=IngestBatchResponse)
+def ingest_frames(
+    device_id: str,
+    body: bytes = Body(..., media_type="application/octet-stream"),
+    db: Session = Depends(get_db),
+    x_api_key: Optional[str] = Header(None),
+):
+    """Binary frames (app/frames.py), one or many packed; admission applies per request like an MQTT message"""
+    require_api_key(x_api_key)
+    require_writable()
+    if settings.INGEST_REQUIRE_REGISTERED and not device_registry.known(device_id):
+        raise HTTPException(status_code=404, detail=f"Device not registered: {device_id}")
+    try:
+        rows = decode_frames(body, device_id)
+    except FrameError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(rows) > settings.INGEST_HTTP_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {settings.INGEST_HTTP_BATCH_MAX} readings per batch")
+    if admission.should_shed(batch_writer.depth(), batch_writer.queue_size):
+        admission.shed("http", device_id)
+        raise HTTPException(status_code=503, detail="Ingest overloaded", headers={"Retry-After": "1"})
+    decision = admission.admit("http", device_id, rows, _store_held_rows, api_key=x_api_key or "")
+    if decision in (KEY_LIMITED, RATE_DROPPED):
+        raise HTTPException(status_code=429, detail=f"Rate limit exceeded ({decision})", headers={"Retry-After": "1"})
+    if decision not in ADMITTED or not rows:
+        return IngestBatchResponse(ok=decision == COALESCED or not rows, ids=[], decisions={decision: len(rows)})
+
+    crud.store_measurements(db, rows, "http_frames", gateway=True)
+    return IngestBatchResponse(ok=True, ids=[m.id for m in rows], decisions={decision: len(rows)})
+
+
+def _store_rows(rows: list) -> None:
+    db = SessionLocal()
+    try:
+        crud.store_measurements(db, rows, "http_frames", gateway=True)
+    finally:
+        db.close()
+
+
+async def _store_held_rows(rows: list) -> None:
+    """Coalesce flusher: store the newest held frame message"""
+    await asyncio.to_thread(_store_rows, rows)
+
+
+def _store_payload(payload: IngestPayload) -> None:
+    db = SessionLocal()
+    try:
+        crud.create_measurement(db, payload)
+    finally:
+        db.close()
+
+
+async def _store_held(payload: IngestPayload) -> None:
+    """Coalesce flusher: store the newest held HTTP reading"""
+    await asyncio.to_thread(_store_payload, payload)
+
+
+@router.get("/ingest/stats")
+def ingest_stats():
+    """Admission-control decisions and writer queue state"""
+    return {"admission": admission.stats(), "writer": batch_writer.stats()}
+
+def require_profiling():
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (PROFILING_ENABLED)")
+
+@router.get("/debug/requests")
+def debug_requests(x_api_key: Optional[str] = Header(None)):
+    """Slowest profiled requests and N+1 suspects"""
+    require_api_key(x_api_key)
+    require_profiling()
+    return request_profiler.snapshot()
+
+@router.get("/debug/profiles/{capture_id}", response_class=PlainTextResponse)
+def debug_profile(capture_id: str, x_api_key: Optional[str] = Header(None)):
+    """Collapsed stacks of one `X-Profile: sample` request (flamegraph.pl input)"""
+    require_api_key(x_api_key)
+    require_profiling()
+    collapsed = request_profiler.capture(capture_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(collapsed)
 
 @router.get("/latest", response_model=LatestResponse)
 def latest(device_id: str = Query(...), db: Session = Depends(get_db)):
@@ -66,13 +231,56 @@ def latest(device_id: str = Query(...), db: Session = Depends(get_db)):
 
 @router.get("/history", response_model=HistoryResponse)
 def history(
+    request: Request,
     device_id: str = Query(...),
     start: Optional[datetime] = Query(None),
     end: Optional[datetime] = Query(None),
     limit: int = Query(500, ge=1, le=5000),
+    max_points: Optional[int] = Query(None, ge=10, le=5000, description="Downsample to about this many points"),
+    downsample: str = Query("lttb", description="lttb or minmax"),
+    metric: str = Query("eco2_ppm", description="Column whose shape is preserved"),
     db: Session = Depends(get_db),
 ):
-    items = crud.get_history(db, device_id, start, end, limit)
+    """
+    Raw or downsampled history.
+    Honors Accept for Arrow IPC / MessagePack bodies; JSON is compressed when large.
+    """
+    # One window for every representation and path (ORM rows, raw cursor scans)
+    start, end = crud.to_naive_utc(start), crud.to_naive_utc(end)
+    media_type = encoding.negotiate(request.headers.get("accept"))
+    keep_ids = None
+    source_count = None
+    if max_points is not None:
+        if downsample not in downsampling.METHODS:
+            raise HTTPException(status_code=400, detail=f"Unknown downsample method: {downsample}")
+        if metric not in aggregates.METRICS:
+            raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+        # Scan light columns for the whole window, then load full rows only for kept points
+        rows = crud.get_history_columns(
+            db, device_id, start, end, settings.HISTORY_DOWNSAMPLE_SOURCE_ROWS, metric
+        )
+        source_count = len(rows)
+        cols = np.array(rows, dtype=np.float64).reshape(-1, 4)
+        keep = downsampling.downsample(cols[:, 1], cols[:, 2], cols[:, 3] > 0, max_points, downsample)
+        keep_ids = cols[keep, 0].astype(np.int64).tolist()
+
+    if media_type != encoding.JSON:
+        if keep_ids is None:
+            batches = crud.export_measurement_batches(db, [device_id], start, end, limit)
+        else:
+            batches = crud.export_measurement_batches_by_ids(db, keep_ids)
+        meta = {
+            "device_id": device_id,
+            "count": sum(len(b) for b in batches),
+            "downsampled": downsample if max_points is not None else None,
+            "source_count": source_count,
+        }
+        return encoding.columnar_response(media_type, crud.EXPORT_COLUMNS, batches, meta)
+
+    if keep_ids is None:
+        items = crud.get_history(db, device_id, start, end, limit)
+    else:
+        items = crud.get_measurements_by_ids(db, keep_ids)
     
     # ✅ TÜM FIELD'LARI İÇEREN RESPONSE
     out_items = [
@@ -98,7 +306,13 @@ def history(
         )
         for m in items
     ]
-    return HistoryResponse(device_id=device_id, count=len(out_items), items=out_items)
+    return encoding.json_response(request, HistoryResponse(
+        device_id=device_id,
+        count=len(out_items),
+        items=out_items,
+        downsampled=downsample if max_points is not None else None,
+        source_count=source_count
+    ))
 
 
 @router.get("/alerts/latest", response_model=AlertLatestResponse)
@@ -162,11 +376,279 @@ def alerts_history(
     return AlertHistoryResponse(device_id=device_id, count=len(out_items), items=out_items)
 
 
+def _live_event_out(e: dict) -> AlertEventOut:
+    return AlertEventOut(
+        id=e["id"], kind=e["kind"], device_id=e["device_id"], ts=e["ts"],
+        received_at=datetime.fromtimestamp(e["received_ms"] / 1000.0, tz=timezone.utc),
+        status=e["status"], eco2_ppm=e["eco2_ppm"], tvoc_ppb=e["tvoc_ppb"], aq_score=e["aq_score"],
+        anom_eco2=e["anom_eco2"], anom_tvoc=e["anom_tvoc"], frame_counter=e["frame_counter"],
+    )
+
+
+@router.get("/alerts/active", response_model=AlertEventsResponse)
+def alerts_active(device_id: Optional[List[str]] = Query(None)):
+    """Last fast-path alert per device within ALERT_ACTIVE_SECONDS (memory, no DB)"""
+    items = [_live_event_out(e) for e in live_alerts.active_alerts(device_id)]
+    return AlertEventsResponse(count=len(items), items=items)
+
+
+@router.get("/alerts/events", response_model=AlertEventsResponse)
+def alerts_events(
+    device_id: Optional[str] = Query(None),
+    hours: int = Query(24, ge=1, le=168),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Stored /alert and /anomaly events, newest first"""
+    start = datetime.now(timezone.utc) - timedelta(hours=hours)
+    items = [
+        AlertEventOut(
+            id=e.id, kind=e.kind, device_id=e.device_id, ts=e.ts, received_at=e.received_at,
+            status=e.status, eco2_ppm=e.eco2_ppm, tvoc_ppb=e.tvoc_ppb, aq_score=e.aq_score,
+            anom_eco2=e.anom_eco2, anom_tvoc=e.anom_tvoc, frame_counter=e.frame_counter,
+        )
+        for e in crud.get_alert_events(db, device_id, start, limit)
+    ]
+    return AlertEventsResponse(count=len(items), items=items)
+
+
+@router.get("/alerts/stream")
+async def alerts_stream(
+    request: Request,
+    device_id: Optional[List[str]] = Query(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    """Server-sent events: one `alert` event per gateway /alert or /anomaly message"""
+    wanted = set(device_id or ())
+    try:
+        resume = int(last_event_id) if last_event_id else None
+    except ValueError:
+        resume = None
+    queue = live_alerts.subscribe(resume)
+
+    async def events():
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.ALERT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if wanted and event["device_id"] not in wanted:
+                    continue
+                yield f"id: {event['id']}\nevent: alert\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        finally:
+            live_alerts.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/areas", response_model=AreaSummaryResponse)
+def areas(
+    level: str = Query("district", description="district, city"),
+    city: Optional[str] = Query(None),
+):
+    """Sliding-window reporting / elevated device counts per area (memory, no DB)"""
+    if level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"level must be one of {', '.join(LEVELS)}")
+    items = [AreaSummary(**a) for a in area_correlator.summaries(level, city)]
+    return AreaSummaryResponse(window_seconds=area_correlator.window_seconds, count=len(items), items=items)
+
+
+def _utc_from_epoch(t: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(t, tz=timezone.utc) if t is not None else None
+
+
+@router.get("/areas/events", response_model=AreaEventsResponse)
+def area_events(
+    level: Optional[str] = Query(None, description="district, city"),
+    city: Optional[str] = Query(None),
+    district: Optional[str] = Query(None),
+    active: bool = Query(False, description="only events still open"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """District / city events raised when several devices are elevated together, newest first"""
+    if level is not None and level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"level must be one of {', '.join(LEVELS)}")
+    items = [
+        AreaEventOut(**{**e, "started_at": _utc_from_epoch(e["started_at"]), "ended_at": _utc_from_epoch(e["ended_at"])})
+        for e in area_correlator.list_events(level, city, district, active, limit)
+    ]
+    return AreaEventsResponse(count=len(items), items=items)
+
+
+@router.get("/forecast", response_model=ForecastResponse)
+def forecast(device_id: str = Query(...), db: Session = Depends(get_db)):
+    """Server forecasts of the hourly means from the current hour on (forecasting job)"""
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    items = [
+        ForecastPoint(target_hour=f.target_hour, horizon=f.horizon, eco2_ppm=f.eco2_ppm,
+                      tvoc_ppb=f.tvoc_ppb, made_at=f.made_at)
+        for f in crud.get_forecasts(db, device_id, hour)
+    ]
+    return ForecastResponse(device_id=device_id, count=len(items), items=items)
+
+
+@router.get("/forecast/accuracy", response_model=ForecastAccuracyResponse)
+def forecast_accuracy(
+    device_id: Optional[str] = Query(None),
+    source: Optional[str] = Query(None, description="tinyml, server"),
+    metric: Optional[str] = Query(None, description="eco2_ppm, tvoc_ppb"),
+    limit: int = Query(100, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """Per-device error of TinyML predictions and server forecasts, worst MAE first"""
+    if source is not None and source not in FORECAST_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(FORECAST_SOURCES)}")
+    if metric is not None and metric not in FORECAST_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(FORECAST_METRICS)}")
+    items = [
+        ForecastAccuracyOut(
+            device_id=a.device_id, source=a.source, metric=a.metric, n=a.n,
+            mae=round(a.sum_abs_err / a.n, 2),
+            rmse=round((a.sum_sq_err / a.n) ** 0.5, 2),
+            bias=round(a.sum_err / a.n, 2),
+            wape=round(100.0 * a.sum_abs_err / a.sum_actual, 2) if a.sum_actual else None,
+            updated_at=a.updated_at,
+        )
+        for a in crud.get_forecast_accuracy(db, device_id, source, metric, limit)
+    ]
+    return ForecastAccuracyResponse(count=len(items), items=items)
+
+
+def _rules_response(device_id: Optional[str] = None) -> RulesResponse:
+    info = rule_engine.describe(device_id)
+    device = info.pop("device", None)
+    return RulesResponse(
+        **{**info, "loaded_at": datetime.fromtimestamp(info["loaded_at"], tz=timezone.utc)},
+        device=DeviceRulesOut(**device) if device else None,
+    )
+
+
+@router.get("/rules", response_model=RulesResponse)
+def get_rules(device_id: Optional[str] = Query(None, description="also return this device's effective thresholds")):
+    """Loaded alert rule set (app/rules.py)"""
+    return _rules_response(device_id)
+
+
+@router.post("/rules/reload", response_model=RulesResponse)
+def reload_rules(x_api_key: Optional[str] = Header(None)):
+    """Recompile RULES_PATH now in this process (others follow within RULES_RELOAD_SECONDS); 400 if invalid"""
+    require_api_key(x_api_key)
+    if not rule_engine.load(force=True):
+        raise HTTPException(status_code=400, detail=f"Rules not loaded: {rule_engine.last_error}")
+    return _rules_response()
+
+
+@router.get("/aggregate", response_model=AggregateResponse)
+async def aggregate(
+    request: Request,
+    metric: str = Query("eco2_ppm", description="eco2_ppm, tvoc_ppb, temp_c, hum_rh, pressure_hpa, aq_score"),
+    bucket: str = Query("1h", description="1m, 5m, 15m, 1h, 6h, 1d"),
+    group_by: str = Query("device", description="device, district, city"),
+    agg: str = Query("avg", description="avg, min, max, p95, alert_count"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    city: Optional[str] = Query(None),
+    district: Optional[str] = Query(None),
+    device_id: Optional[str] = Query(None),
+):
+    """
+    Time-bucketed aggregates computed in the database.
+    Runs on the aggregate worker pool; results are cached per query.
+    """
+    try:
+        q = aggregates.normalize_query(metric, bucket, group_by, agg, start, end, city, district, device_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows, cached = await aggregates.aggregate(q)
+
+    media_type = encoding.negotiate(request.headers.get("accept"))
+    if media_type != encoding.JSON:
+        meta = {
+            "metric": q.metric, "bucket": q.bucket, "group_by": q.group_by, "agg": q.agg,
+            "start": q.start, "end": q.end, "cached": cached, "count": len(rows),
+        }
+        batch = [
+            (r.group, r.city, int(r.bucket_start.timestamp()) * 1_000_000, r.value, r.samples)
+            for r in rows
+        ]
+        return encoding.columnar_response(
+            media_type, ["group", "city", "bucket_start", "value", "samples"], [batch], meta
+        )
+
+    items = [
+        AggregatePoint(
+            group=r.group,
+            city=r.city,
+            bucket_start=r.bucket_start,
+            value=r.value,
+            samples=r.samples
+        )
+        for r in rows
+    ]
+    return encoding.json_response(request, AggregateResponse(
+        metric=q.metric,
+        bucket=q.bucket,
+        group_by=q.group_by,
+        agg=q.agg,
+        start=q.start,
+        end=q.end,
+        cached=cached,
+        count=len(items),
+        items=items
+    ))
+
+
+@router.get("/export/measurements", response_model=ExportResponse)
+def export_measurements(
+    request: Request,
+    device_id: Optional[List[str]] = Query(None, description="Repeatable; default all devices"),
+    city: Optional[str] = Query(None),
+    district: Optional[str] = Query(None),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: int = Query(100_000, ge=1),
+    db: Session = Depends(get_db),
+):
+    """
+    Bulk export of raw measurements in time order.
+    Columnar body (columns + rows, ts in epoch microseconds); prefer
+    Accept: application/vnd.apache.arrow.stream or application/x-msgpack.
+    """
+    limit = min(limit, settings.EXPORT_MAX_ROWS)
+    start, end = crud.to_naive_utc(start), crud.to_naive_utc(end)
+    device_ids = device_id
+    if city:
+        scope = device_registry.by_district(city, district) if district else device_registry.by_city(city)
+        in_scope = [d.device_id for d in scope]
+        device_ids = in_scope if device_ids is None else [d for d in device_ids if d in set(in_scope)]
+
+    batches = crud.export_measurement_batches(db, device_ids, start, end, limit)
+    count = sum(len(b) for b in batches)
+    media_type = encoding.negotiate(request.headers.get("accept"))
+    if media_type != encoding.JSON:
+        meta = {"count": count, "start": start, "end": end}
+        return encoding.columnar_response(media_type, crud.EXPORT_COLUMNS, batches, meta)
+
+    body = ExportResponse(
+        columns=crud.EXPORT_COLUMNS,
+        count=count,
+        rows=[list(r) for b in batches for r in b]
+    )
+    return encoding.json_response(request, body)
+
+
 # ✅ YENİ ENDPOINT: List All Devices
 @router.get("/devices", response_model=List[DeviceOut])
-def list_all_devices(db: Session = Depends(get_db)):
+def list_all_devices():
     """List all registered devices"""
-    devices = crud.get_all_devices(db)
+    devices = device_registry.all()
     
     return [
         DeviceOut(
@@ -190,12 +672,18 @@ def register_device(
 ):
     """Register new device"""
     require_api_key(x_api_key)
+    require_writable()
     
-    existing = crud.get_device(db, device.device_id)
-    if existing:
+    if device_registry.known(device.device_id):
         raise HTTPException(status_code=400, detail=f"Device already exists: {device.device_id}")
     
-    db_device = crud.create_device(db, device)
+    try:
+        db_device = crud.create_device(db, device)
+    except IntegrityError:
+        # Registered by another worker since our last registry refresh
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Device already exists: {device.device_id}")
+    device_registry.add(db_device)  # map indexes and heatmap cache follow via listeners
     
     return DeviceOut(
         device_id=db_device.device_id,
@@ -209,9 +697,9 @@ def register_device(
 
 
 @router.get("/devices/{device_id}", response_model=DeviceOut)
-def get_device_info(device_id: str, db: Session = Depends(get_db)):
+def get_device_info(device_id: str):
     """Get device information"""
-    device = crud.get_device(db, device_id)
+    device = device_registry.get(device_id)
     if not device:
         raise HTTPException(status_code=404, detail=f"Device not found: {device_id}")
     
@@ -229,16 +717,16 @@ def get_device_info(device_id: str, db: Session = Depends(get_db)):
 # Harita Endpoint'leri
 
 @router.get("/locations/cities", response_model=CitiesResponse)
-def get_cities(db: Session = Depends(get_db)):
+def get_cities():
     """List all cities"""
-    cities = crud.get_all_cities(db)
+    cities = device_registry.cities()
     return CitiesResponse(cities=cities)
 
 
 @router.get("/locations/districts", response_model=DistrictsResponse)
-def get_districts(city: str = Query(..., description="City name"), db: Session = Depends(get_db)):
+def get_districts(city: str = Query(..., description="City name")):
     """List districts by city"""
-    districts = crud.get_districts_by_city(db, city)
+    districts = device_registry.districts(city)
     
     if not districts:
         raise HTTPException(status_code=404, detail=f"No districts found for city: {city}")
@@ -246,68 +734,178 @@ def get_districts(city: str = Query(..., description="City name"), db: Session =
     return DistrictsResponse(city=city, districts=districts)
 
 
+def _bbox_param(
+    min_lat: Optional[float],
+    min_lon: Optional[float],
+    max_lat: Optional[float],
+    max_lon: Optional[float],
+) -> Optional[BBox]:
+    given = [v is not None for v in (min_lat, min_lon, max_lat, max_lon)]
+    if not any(given):
+        return None
+    if not all(given):
+        raise HTTPException(status_code=400, detail="bbox needs min_lat, min_lon, max_lat and max_lon")
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="bbox min must not exceed max")
+    return BBox(min_lat, min_lon, max_lat, max_lon)
+
+
+def _map_point(device, latest) -> MapPoint:
+    if latest is None:
+        # No measurement yet
+        return MapPoint(
+            id=device.device_id,
+            device_id=device.device_id,
+            name=device.name,
+            lat=device.lat,
+            lon=device.lon,
+            city=device.city,
+            district=device.district,
+            status="NO_DATA",
+            last_update=None
+        )
+
+    # ✅ FRONTEND'İN BEKLEDİĞİ FORMAT
+    return MapPoint(
+        id=device.device_id,
+        device_id=device.device_id,
+        name=device.name,
+        lat=device.lat,
+        lon=device.lon,
+        city=device.city,
+        district=device.district,
+        tvoc_ppb=latest.tvoc_ppb,
+        eco2_ppm=latest.eco2_ppm,
+        temperature=latest.temp_c,  # ✅ temp_c → temperature
+        humidity=latest.hum_rh,     # ✅ hum_rh → humidity
+        pressure=latest.pressure_hpa,
+        score=latest.aq_score,       # ✅ aq_score → score (frontend compatibility)
+        status=latest.status,
+        last_update=latest.ts
+    )
+
+
 @router.get("/map/points", response_model=MapPointsResponse)
 def get_map_points(
     city: Optional[str] = Query(None, description="City filter"),
     district: Optional[str] = Query(None, description="District filter"),
-    db: Session = Depends(get_db)
+    min_lat: Optional[float] = Query(None, description="Viewport bbox"),
+    min_lon: Optional[float] = Query(None),
+    max_lat: Optional[float] = Query(None),
+    max_lon: Optional[float] = Query(None),
 ):
     """
     Get all sensor points for map with latest measurements
     """
+    bbox = _bbox_param(min_lat, min_lon, max_lat, max_lon)
+
     # Filter devices
     if district and city:
-        devices = crud.get_devices_by_district(db, city, district)
+        devices = device_registry.by_district(city, district)
     elif city:
-        devices = crud.get_devices_by_city(db, city)
+        devices = device_registry.by_city(city)
     else:
-        devices = crud.get_all_devices(db)
-    
-    points = []
-    
-    for device in devices:
-        # Get latest measurement
-        latest = crud.get_latest(db, device.device_id)
-        
-        if latest:
-            # ✅ FRONTEND'İN BEKLEDİĞİ FORMAT
-            point = MapPoint(
-                id=device.device_id,
-                device_id=device.device_id,
-                name=device.name,
-                lat=device.lat,
-                lon=device.lon,
-                city=device.city,
-                district=device.district,
-                tvoc_ppb=latest.tvoc_ppb,
-                eco2_ppm=latest.eco2_ppm,
-                temperature=latest.temp_c,  # ✅ temp_c → temperature
-                humidity=latest.hum_rh,     # ✅ hum_rh → humidity
-                pressure=latest.pressure_hpa,
-                score=latest.aq_score,       # ✅ aq_score → score (frontend compatibility)
-                status=latest.status,
-                last_update=latest.ts
-            )
-        else:
-            # No measurement yet
-            point = MapPoint(
-                id=device.device_id,
-                device_id=device.device_id,
-                name=device.name,
-                lat=device.lat,
-                lon=device.lon,
-                city=device.city,
-                district=device.district,
-                tvoc_ppb=None,
-                eco2_ppm=None,
-                temperature=None,
-                humidity=None,
-                pressure=None,
-                score=None,
-                status="NO_DATA",
-                last_update=None
-            )
-        
-        points.append(point)
+        devices = device_registry.all()
+
+    if bbox is not None:
+        visible = set(geo_index.query_points(bbox))
+        devices = [d for d in devices if d.device_id in visible]
+
+    points = [_map_point(device, latest_state.get(device.device_id)) for device in devices]
     
-    return MapPointsResponse(points=points)
\ No newline at end of file
+    return MapPointsResponse(points=points)
+
+
+@router.get("/map/clusters", response_model=MapClustersResponse)
+def get_map_clusters(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22),
+):
+    """
+    Viewport query backed by the grid index.
+    Cells with several sensors come back as clusters (status and worst score
+    precomputed per cell), lone sensors as points.
+    """
+    bbox = _bbox_param(min_lat, min_lon, max_lat, max_lon)
+
+    if zoom > geo_index.max_zoom:
+        cells = []
+        lone = geo_index.query_points(bbox)
+    else:
+        cells = geo_index.query_clusters(bbox, zoom)
+        lone = [c.device_ids[0] for c in cells if c.count == 1]
+
+    clusters = [
+        MapCluster(
+            lat=cell.lat,
+            lon=cell.lon,
+            count=cell.count,
+            status=cell.status,
+            worst_score=cell.worst_score,
+            device_ids=cell.device_ids[:settings.MAP_CLUSTER_SAMPLE_IDS]
+        )
+        for cell in cells if cell.count > 1
+    ]
+    points: list[MapPoint] = []
+    for device_id in lone:
+        device = device_registry.get(device_id)
+        if device is not None:
+            points.append(_map_point(device, latest_state.get(device_id)))
+
+    return MapClustersResponse(zoom=zoom, clusters=clusters, points=points)
+
+
+@router.get("/nearest", response_model=NearestResponse)
+def nearest_sensors(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(3, ge=1),
+):
+    """
+    Air quality at a location: k nearest sensors (KD-tree) and an
+    inverse-distance estimate from their latest readings
+    """
+    k = min(k, settings.NEAREST_MAX_K)
+    neighbours = nearest_index.tree.knn(lat, lon, k)
+
+    sensors = []
+    for device_id, km in neighbours:
+        device = device_registry.get(device_id)
+        if device is None:
+            continue
+        point = _map_point(device, latest_state.get(device_id))
+        sensors.append(NearbySensor(**point.model_dump(), distance_km=round(km, 3)))
+
+    return NearestResponse(lat=lat, lon=lon, estimate=heatmap.estimate_at(neighbours), sensors=sensors)
+
+
+@router.get("/heatmap/{z}/{x}/{y}", response_model=HeatmapTileResponse)
+def heatmap_tile(
+    z: int,
+    x: int,
+    y: int,
+    metric: str = Query("eco2_ppm", description="eco2_ppm, tvoc_ppb, aq_score"),
+    city: Optional[str] = Query(None, description="Only interpolate sensors of this city"),
+):
+    """Interpolated heatmap tile, cached until a contributing sensor reports"""
+    if metric not in heatmap.HEATMAP_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+
+    tile, cached = heatmap.get_tile(z, x, y, metric, city)
+    return HeatmapTileResponse(
+        z=tile.z,
+        x=tile.x,
+        y=tile.y,
+        metric=tile.metric,
+        city=tile.city,
+        size=tile.size,
+        bounds=list(tile.bounds),
+        values=tile.values,
+        device_ids=tile.device_ids,
+        cached=cached
+    )
@@ -0,0 +1,358 @@
+"""
+Alert rules per city, district and device.
+
+The alert thresholds in Settings (WARN_INCREASE_PCT, ECO2_TEST_MAX,
+ECO2_HYST, ECO2_DELTA_PPM, ...) were global and read one attribute at a
+time for every reading. They are now the defaults of a JSON rule file
+(RULES_PATH) that overrides any of them per city, district or device:
+
+    {"rules": [
+        {"city": "Istanbul", "eco2_max": 800},
+        {"city": "Istanbul", "district": "Kadikoy", "eco2_hyst": 40},
+        {"device_id": "node-001", "high_increase_pct": 60, "baseline_seconds": 300}
+    ]}
+
+Precedence is default < city < district < device; a later entry of the
+same scope wins. At load time each device with a matching rule gets an
+Evaluator whose resolved thresholds are bound into closures, so judging a
+reading is one dict lookup plus local comparisons. Devices sharing the same
+scopes share one Evaluator.
+
+A RuleSet is immutable. Reloads (RULES_PATH mtime polled every
+RULES_RELOAD_SECONDS, POST /api/rules/reload, device registry changes)
+compile a new one and swap the reference, so a batch is judged by a single
+version and the ingest loop keeps running. An invalid file is logged and
+the previous set stays.
+
+The rules are used in two places:
+- baseline (HTTP JSON ingest, alerts.evaluate_alert): percent increase over
+  the mean of the last baseline_seconds -> OK / WARN / HIGH and a score
+- gateway readings (MQTT, batch envelopes, frames): for devices with rules
+  the server replaces the gateway's status and delta alert. It checks the
+  eCO2 / TVOC range with hysteresis and the deltas against the device's
+  previous reading (NORMAL / HIGH). Devices without rules keep the
+  gateway's verdict.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+from .config import settings
+from .latest_state import latest_state
+from .metrics import registry
+from .registry import DeviceInfo, device_registry
+
+logger = logging.getLogger(__name__)
+
+# Rule parameter -> Settings attribute holding its default
+PARAMS = {
+    "baseline_seconds": "BASELINE_SECONDS",
+    "warn_increase_pct": "WARN_INCREASE_PCT",
+    "high_increase_pct": "HIGH_INCREASE_PCT",
+    "eco2_min": "ECO2_TEST_MIN",
+    "eco2_max": "ECO2_TEST_MAX",
+    "tvoc_min": "TVOC_TEST_MIN",
+    "tvoc_max": "TVOC_TEST_MAX",
+    "eco2_hyst": "ECO2_HYST",
+    "tvoc_hyst": "TVOC_HYST",
+    "eco2_delta_ppm": "ECO2_DELTA_PPM",
+    "tvoc_delta_ppb": "TVOC_DELTA_PPB",
+    "temp_delta_c": "TEMP_DELTA_C",
+    "hum_delta_rh": "HUM_DELTA_RH",
+    "press_delta_hpa": "PRESS_DELTA_HPA",
+}
+_SCOPE_KEYS = ("device_id", "city", "district")
+_NOTE_KEYS = ("name", "comment")
+
+# (by_city, by_district, by_device) parameter overrides
+Overrides = tuple[dict[str, dict], dict[tuple[str, str], dict], dict[str, dict]]
+_NO_OVERRIDES: Overrides = ({}, {}, {})
+
+
+class RuleError(ValueError):
+    """Invalid rule file"""
+
+
+def defaults() -> dict:
+    return {key: getattr(settings, attr) for key, attr in PARAMS.items()}
+
+
+def parse(doc) -> Overrides:
+    """Rule file JSON -> overrides per scope"""
+    if not isinstance(doc, dict) or not isinstance(doc.get("rules"), list):
+        raise RuleError('expected an object with a "rules" list')
+    by_city: dict[str, dict] = {}
+    by_district: dict[tuple[str, str], dict] = {}
+    by_device: dict[str, dict] = {}
+    for n, rule in enumerate(doc["rules"]):
+        if not isinstance(rule, dict):
+            raise RuleError(f"rule {n}: expected an object")
+        params = {}
+        for key, value in rule.items():
+            if key in _SCOPE_KEYS or key in _NOTE_KEYS:
+                continue
+            if key not in PARAMS:
+                raise RuleError(f"rule {n}: unknown parameter {key!r}")
+            if type(value) not in (int, float) or value < 0:
+                raise RuleError(f"rule {n}: {key} must be a number >= 0")
+            params[key] = value
+        scope = {k: rule.get(k) for k in _SCOPE_KEYS}
+        if any(v is not None and not isinstance(v, str) for v in scope.values()):
+            raise RuleError(f"rule {n}: device_id / city / district must be strings")
+        device_id, city, district = scope["device_id"], scope["city"], scope["district"]
+        if device_id is not None:
+            if city is not None or district is not None:
+                raise RuleError(f"rule {n}: a device_id rule can't also name a city or district")
+            by_device.setdefault(device_id, {}).update(params)
+        elif district is not None:
+            if city is None:
+                raise RuleError(f"rule {n}: a district rule needs its city")
+            by_district.setdefault((city, district), {}).update(params)
+        elif city is not None:
+            by_city.setdefault(city, {}).update(params)
+        else:
+            raise RuleError(f"rule {n}: needs device_id, city or city + district")
+    return by_city, by_district, by_device
+
+
+# =========================================================
+# COMPILED EVALUATORS
+# =========================================================
+
+def _compile_classify(p: dict) -> Callable:
+    warn, high = float(p["warn_increase_pct"]), float(p["high_increase_pct"])
+    scale = 80.0 / high if high > 0 else 0.0
+
+    def classify(tvoc_pct: Optional[float], eco2_pct: Optional[float]) -> tuple[str, float]:
+        """Percent increase over the baseline -> (OK / WARN / HIGH, 0..100 score); the larger one decides"""
+        if tvoc_pct is None:
+            if eco2_pct is None:
+                return "OK", 0.0
+            peak = eco2_pct
+        elif eco2_pct is None or tvoc_pct >= eco2_pct:
+            peak = tvoc_pct
+        else:
+            peak = eco2_pct
+        status = "HIGH" if peak >= high else "WARN" if peak >= warn else "OK"
+        return status, min(max(peak * scale, 0.0), 100.0)
+
+    return classify
+
+
+def _compile_check(p: dict) -> Callable:
+    e_lo, e_hi, e_hyst = p["eco2_min"], p["eco2_max"], p["eco2_hyst"]
+    t_lo, t_hi, t_hyst = p["tvoc_min"], p["tvoc_max"], p["tvoc_hyst"]
+    d_eco2, d_tvoc = p["eco2_delta_ppm"], p["tvoc_delta_ppb"]
+    d_temp, d_hum, d_press = p["temp_delta_c"], p["hum_delta_rh"], p["press_delta_hpa"]
+
+    def check(m, prev: Optional[tuple]) -> tuple[str, bool]:
+        """
+        Gateway-style verdict for reading `m`, given the device's previous
+        (status, eco2, tvoc, temp, hum, pressure): (NORMAL / HIGH, delta alert)
+        """
+        eco2, tvoc = m.eco2_ppm, m.tvoc_ppb
+        high = False
+        if prev is not None:
+            status, p_eco2, p_tvoc, p_temp, p_hum, p_press = prev
+            if (
+                (eco2 is not None and p_eco2 is not None and abs(eco2 - p_eco2) >= d_eco2)
+                or (tvoc is not None and p_tvoc is not None and abs(tvoc - p_tvoc) >= d_tvoc)
+                or (m.temp_c is not None and p_temp is not None and abs(m.temp_c - p_temp) >= d_temp)
+                or (m.hum_rh is not None and p_hum is not None and abs(m.hum_rh - p_hum) >= d_hum)
+                or (m.pressure_hpa is not None and p_press is not None and abs(m.pressure_hpa - p_press) >= d_press)
+            ):
+                return "HIGH", True
+            high = status == "HIGH"
+        if high:
+            # Back to NORMAL only once both are inside the range narrowed by the hysteresis
+            high = not (
+                (eco2 is None or e_lo + e_hyst <= eco2 <= e_hi - e_hyst)
+                and (tvoc is None or t_lo + t_hyst <= tvoc <= t_hi - t_hyst)
+            )
+        else:
+            high = (eco2 is not None and not e_lo <= eco2 <= e_hi) or (tvoc is not None and not t_lo <= tvoc <= t_hi)
+        return ("HIGH" if high else "NORMAL"), False
+
+    return check
+
+
+class Evaluator:
+    """One device's resolved thresholds, compiled"""
+    __slots__ = ("params", "scopes", "baseline_seconds", "classify", "check")
+
+    def __init__(self, params: dict, scopes: tuple[str, ...]):
+        self.params = params
+        self.scopes = scopes            # e.g. ("city:Istanbul", "device:node-001"); () = Settings only
+        self.baseline_seconds = params["baseline_seconds"]
+        self.classify = _compile_classify(params)
+        self.check = _compile_check(params)
+
+
+def compile_rules(overrides: Overrides, devices: Iterable[DeviceInfo]) -> tuple[Evaluator, dict[str, Evaluator]]:
+    """(default evaluator, {device_id: evaluator} for devices with at least one rule)"""
+    base = defaults()
+    by_city, by_district, by_device = overrides
+    shared: dict[tuple, Evaluator] = {}
+    compiled: dict[str, Evaluator] = {}
+    places = {d.device_id: (d.city, d.district) for d in devices}
+    for device_id in by_device:
+        places.setdefault(device_id, (None, None))   # rules for devices not registered yet
+    for device_id, (city, district) in places.items():
+        layers = []
+        if city in by_city:
+            layers.append((f"city:{city}", by_city[city]))
+        if (city, district) in by_district:
+            layers.append((f"district:{city}/{district}", by_district[(city, district)]))
+        if device_id in by_device:
+            layers.append((f"device:{device_id}", by_device[device_id]))
+        if not layers:
+            continue
+        scopes = tuple(name for name, _ in layers)
+        ev = shared.get(scopes)
+        if ev is None:
+            params = dict(base)
+            for _, layer in layers:
+                params.update(layer)
+            ev = shared[scopes] = Evaluator(params, scopes)
+        compiled[device_id] = ev
+    return Evaluator(base, ()), compiled
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    version: int
+    source: str                         # RULES_PATH, or "" for Settings only
+    loaded_at: float
+    overrides: Overrides
+    default: Evaluator
+    devices: dict[str, Evaluator] = field(default_factory=dict)
+
+
+# =========================================================
+# ENGINE
+# =========================================================
+
+class RuleEngine:
+    def __init__(self, path: str):
+        self.path = path
+        default, devices = compile_rules(_NO_OVERRIDES, ())
+        self._set = RuleSet(0, "", time.time(), _NO_OVERRIDES, default, devices)
+        self._lock = threading.Lock()   # reloads only; readers take the reference
+        self._mtime: Optional[int] = None
+        self._last: dict[str, tuple] = {}   # device -> previous reading, for check()
+        self.reloads = {"ok": 0, "error": 0}
+        self.last_error: Optional[str] = None
+        self.evaluated = 0
+
+    @property
+    def current(self) -> RuleSet:
+        return self._set
+
+    def for_device(self, device_id: str) -> Evaluator:
+        rs = self._set
+        return rs.devices.get(device_id, rs.default)
+
+    # ---------- reloads (copy-on-write) ----------
+
+    def _swap(self, overrides: Overrides) -> RuleSet:
+        default, devices = compile_rules(overrides, device_registry.all())
+        rs = self._set = RuleSet(self._set.version + 1, self.path, time.time(), overrides, default, devices)
+        return rs
+
+    def load(self, force: bool = False) -> bool:
+        """Compile RULES_PATH if it changed (or `force`); False if it is invalid and the old set stays"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns if self.path else None
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._mtime and not force:
+                return True
+            self._mtime = mtime   # a broken file is reported once, not on every poll
+            try:
+                overrides = _NO_OVERRIDES
+                if mtime is not None:
+                    with open(self.path, encoding="utf-8") as fh:
+                        overrides = parse(json.load(fh))
+            except (OSError, ValueError) as e:   # JSONDecodeError and RuleError are ValueErrors
+                self.reloads["error"] += 1
+                self.last_error = str(e)
+                logger.error(f"❌ Alert rules {self.path} not loaded, keeping v{self._set.version}: {e}")
+                return False
+            rs = self._swap(overrides)
+            self.reloads["ok"] += 1
+            self.last_error = None
+        if self.path:
+            logger.info(f"✅ Alert rules v{rs.version}: {len(rs.devices)} devices with rules ({self.path})")
+        return True
+
+    def on_registry(self, event: str, device: Optional[DeviceInfo]) -> None:
+        """Registry listener: added or reloaded devices get their city / district rules"""
+        with self._lock:
+            if self._set.overrides is not _NO_OVERRIDES:
+                self._swap(self._set.overrides)
+
+    # ---------- gateway readings ----------
+
+    def apply(self, rows: list) -> None:
+        """Set status / alert of gateway readings of devices with rules (before they are written)"""
+        devices = self._set.devices   # one version for the whole batch
+        if not devices:
+            return
+        last = self._last
+        for m in rows:
+            ev = devices.get(m.device_id)
+            if ev is None or getattr(m, "_rules_applied", False):   # write retries
+                continue
+            prev = last.get(m.device_id)
+            if prev is None:
+                r = latest_state.get(m.device_id)
+                if r is not None:
+                    prev = (r.status, r.eco2_ppm, r.tvoc_ppb, r.temp_c, r.hum_rh, r.pressure_hpa)
+            m.status, m.alert = ev.check(m, prev)
+            m._rules_applied = True
+            last[m.device_id] = (m.status, m.eco2_ppm, m.tvoc_ppb, m.temp_c, m.hum_rh, m.pressure_hpa)
+            self.evaluated += 1
+
+    def describe(self, device_id: Optional[str] = None) -> dict:
+        rs = self._set
+        out = {
+            "version": rs.version,
+            "path": rs.source or None,
+            "loaded_at": rs.loaded_at,
+            "devices_with_rules": len(rs.devices),
+            "last_error": self.last_error,
+        }
+        if device_id is not None:
+            ev = rs.devices.get(device_id, rs.default)
+            out["device"] = {"device_id": device_id, "scopes": list(ev.scopes), "params": dict(ev.params)}
+        return out
+
+
+rule_engine = RuleEngine(settings.RULES_PATH)
+device_registry.subscribe(rule_engine.on_registry)
+
+
+async def run_watcher(interval_seconds: float) -> None:
+    """Background task: pick up edits of RULES_PATH"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(rule_engine.load)
+        except Exception as e:
+            logger.error(f"❌ Alert rules reload failed: {e}", exc_info=True)
+
+
+registry.counter("aq_rules_reloads_total", "Alert rule file loads by outcome", ("outcome",),
+                 fn=lambda: [((k,), n) for k, n in rule_engine.reloads.items()])
+registry.gauge("aq_rules_version", "Alert rule set version in this process",
+               fn=lambda: [((), rule_engine.current.version)])
+registry.counter("aq_rules_evaluated_total", "Gateway readings judged by per-device alert rules",
+                 fn=lambda: [((), rule_engine.evaluated)])
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class IngestPayload(BaseModel):
     device_id: str = Field(..., examples=["node-001"])
@@ -18,7 +18,16 @@ class IngestPayload(BaseModel):
 
 class IngestResponse(BaseModel):
     ok: bool
-    id: int
+    id: Optional[int] = None            # None when the reading was held or thinned by admission control
+    admission: str = "accepted"
+
+class IngestBatch(BaseModel):
+    readings: List[IngestPayload] = Field(..., min_length=1)
+
+class IngestBatchResponse(BaseModel):
+    ok: bool
+    ids: List[int]                      # stored rows, in request order
+    decisions: Dict[str, int]           # admission decision -> readings
 
 class MeasurementOut(BaseModel):
     device_id: str
@@ -63,6 +72,8 @@ class HistoryResponse(BaseModel):
     device_id: str
     count: int
     items: List[MeasurementOut]
+    downsampled: Optional[str] = None   # method used when max_points was applied
+    source_count: Optional[int] = None  # raw rows before downsampling
 
 class AlertLatestResponse(BaseModel):
     found: bool
@@ -130,6 +141,50 @@ class MapPointsResponse(BaseModel):
     points: List[MapPoint]
 
 
+class MapCluster(BaseModel):
+    """Group of nearby sensors at the requested zoom"""
+    lat: float
+    lon: float
+    count: int
+    status: str                          # worst status in the cluster
+    worst_score: Optional[int] = None    # lowest aq_score in the cluster
+    device_ids: List[str]                # first MAP_CLUSTER_SAMPLE_IDS members
+
+
+class MapClustersResponse(BaseModel):
+    """Viewport query response: clusters plus standalone points"""
+    zoom: int
+    clusters: List[MapCluster]
+    points: List[MapPoint]
+
+
+class NearbySensor(MapPoint):
+    """Map point with its distance to the query location"""
+    distance_km: float
+
+
+class NearestResponse(BaseModel):
+    """Nearest sensors plus an interpolated estimate at the location"""
+    lat: float
+    lon: float
+    estimate: dict[str, Optional[float]]
+    sensors: List[NearbySensor]
+
+
+class HeatmapTileResponse(BaseModel):
+    """Interpolated z/x/y grid; values[0] is the north edge, None = no coverage"""
+    z: int
+    x: int
+    y: int
+    metric: str
+    city: Optional[str] = None
+    size: int
+    bounds: List[float]                  # min_lat, min_lon, max_lat, max_lon
+    values: List[List[Optional[float]]]
+    device_ids: List[str]
+    cached: bool = False
+
+
 class CitiesResponse(BaseModel):
     """City list response"""
     cities: List[str]
@@ -144,4 +199,136 @@ class DistrictsResponse(BaseModel):
 class AlertHistoryResponse(BaseModel):
     device_id: str
     count: int
-    items: List[MeasurementOut]
\ No newline at end of file
+    items: List[MeasurementOut]
+
+# Alert fast path (gateway /alert, /anomaly)
+class AlertEventOut(BaseModel):
+    id: int
+    kind: str                           # alert / anomaly
+    device_id: str
+    ts: datetime                        # reading time
+    received_at: datetime
+    status: Optional[str] = None
+    eco2_ppm: Optional[int] = None
+    tvoc_ppb: Optional[int] = None
+    aq_score: Optional[int] = None
+    anom_eco2: Optional[bool] = None
+    anom_tvoc: Optional[bool] = None
+    frame_counter: Optional[int] = None
+
+class AlertEventsResponse(BaseModel):
+    count: int
+    items: List[AlertEventOut]
+
+# Area correlation (app/correlator.py)
+class AreaSummary(BaseModel):
+    level: str                          # district / city
+    city: str
+    district: Optional[str] = None
+    reporting: int                      # devices with a reading in the window
+    elevated: int                       # ... with an alert / anomaly / WARN / HIGH reading
+    mean_aq_score: Optional[float] = None
+    mean_eco2_ppm: Optional[float] = None
+    mean_tvoc_ppb: Optional[float] = None
+    event_id: Optional[int] = None      # open area event
+
+class AreaSummaryResponse(BaseModel):
+    window_seconds: float
+    count: int
+    items: List[AreaSummary]
+
+class AreaEventOut(BaseModel):
+    id: int
+    level: str
+    city: str
+    district: Optional[str] = None
+    started_at: datetime
+    ended_at: Optional[datetime] = None  # None while open
+    elevated: int
+    reporting: int
+    peak_elevated: int
+    devices: List[str]                  # every device elevated during the event
+    mean_aq_score: Optional[float] = None
+    mean_eco2_ppm: Optional[float] = None
+    mean_tvoc_ppb: Optional[float] = None
+
+class AreaEventsResponse(BaseModel):
+    count: int
+    items: List[AreaEventOut]
+
+# ==================== Forecast Schemas ====================
+
+class ForecastPoint(BaseModel):
+    target_hour: datetime               # hour start, UTC; the value is that hour's mean
+    horizon: int                        # hours ahead of the last complete hour
+    eco2_ppm: Optional[float] = None
+    tvoc_ppb: Optional[float] = None
+    made_at: datetime
+
+class ForecastResponse(BaseModel):
+    device_id: str
+    count: int
+    items: List[ForecastPoint]
+
+class ForecastAccuracyOut(BaseModel):
+    device_id: str
+    source: str                         # tinyml / server
+    metric: str                         # eco2_ppm / tvoc_ppb
+    n: int                              # predictions scored
+    mae: float
+    rmse: float
+    bias: float                         # mean(predicted - actual)
+    wape: Optional[float] = None        # sum |error| / sum actual, percent
+    updated_at: datetime
+
+class ForecastAccuracyResponse(BaseModel):
+    count: int
+    items: List[ForecastAccuracyOut]
+
+# ==================== Alert Rule Schemas ====================
+
+class DeviceRulesOut(BaseModel):
+    """A device's effective alert thresholds (Settings defaults + matching rules)"""
+    device_id: str
+    scopes: List[str]                   # matching rules, lowest precedence first; [] = defaults only
+    params: Dict[str, float]
+
+class RulesResponse(BaseModel):
+    version: int                        # bumped on every compile in this process
+    path: Optional[str] = None          # RULES_PATH; null = Settings defaults only
+    loaded_at: datetime
+    devices_with_rules: int
+    last_error: Optional[str] = None    # why the last load of RULES_PATH was rejected
+    device: Optional[DeviceRulesOut] = None
+
+# ==================== Aggregation Schemas ====================
+
+class AggregatePoint(BaseModel):
+    """One (group, time bucket) aggregate"""
+    group: str
+    city: Optional[str] = None
+    bucket_start: datetime
+    value: Optional[float] = None
+    samples: int
+
+
+class AggregateResponse(BaseModel):
+    """Time-bucketed aggregation response"""
+    metric: str
+    bucket: str
+    group_by: str
+    agg: str
+    start: datetime
+    end: datetime
+    cached: bool = False
+    count: int
+    items: List[AggregatePoint]
+
+
+# ==================== Export Schemas ====================
+
+class ExportResponse(BaseModel):
+    """Columnar JSON export; ts is epoch microseconds"""
+    columns: List[str]
+    count: int
+    rows: List[list]
@@ -9,6 +9,9 @@ BACKEND_URL = "http://localhost:8000"  # Backend adresini buraya yaz
 API_KEY = "know-the-air-you-breaathe-in"  # config.py'deki API_KEY ile aynı olmalı
 DEVICE_ID = "node-001"  # Cihaz ID'si
 
+# Keep-alive: tek bağlantı tekrar kullanılır
+session = requests.Session()
+
 def generate_sensor_data():
     """Sensör verilerini simüle et"""
     return {
@@ -17,9 +20,9 @@ def generate_sensor_data():
         "temp_c": round(random.uniform(18.0, 28.0), 2),
         "hum_rh": round(random.uniform(30.0, 70.0), 2),
         "pressure_hpa": round(random.uniform(1000.0, 1020.0), 2),
-        "tvoc_ppb": round(random.uniform(0, 500), 2),
-        "eco2_ppm": round(random.uniform(400, 1500), 2),
-        "rssi": round(random.uniform(-80, -40), 2),
+        "tvoc_ppb": random.randint(0, 500),
+        "eco2_ppm": random.randint(400, 1500),
+        "rssi": random.randint(-80, -40),
         "snr": round(random.uniform(5, 15), 2)
     }
 
@@ -33,8 +36,8 @@ def send_data():
     }
     
     try:
-        response = requests.post(
-            f"{BACKEND_URL}/ingest",
+        response = session.post(
+            f"{BACKEND_URL}/api/ingest",
             json=data,
             headers=headers
         )
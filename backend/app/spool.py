@@ -0,0 +1,320 @@
+"""
+Durable on-disk ingest spool.
+
+MQTT receive and the database writer are decoupled by append-only segment
+files:
+
+    broker --QoS1--> append to segment (flush) --> PUBACK
+                          |
+                 SpoolReplayer: read -> decode -> commit -> checkpoint
+
+A message is acknowledged only after it is in the spool file, so a crash
+or a locked database no longer loses readings: the broker redelivers what
+was not acked (persistent session) and the replayer re-reads whatever was
+spooled but not committed. Fully committed segments are deleted.
+
+Record format: <u32 body length><u32 crc32(body)> body, where
+body = <u16 topic length> topic payload. A torn record at the end of a
+segment (crash mid-write) is detected by length / CRC and skipped.
+
+Delivery is at-least-once: a crash between a commit and the checkpoint
+write replays that one batch.
+
+Only database availability errors (OperationalError: locked, busy, I/O)
+keep a batch in the spool for another try. A batch that fails for any other
+reason is split in halves until the failing records are isolated; those go
+to `quarantine.rec` (same record format) and the position moves past them.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from typing import Callable, Optional
+
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<II")
+_TOPIC_LEN = struct.Struct("<H")
+_SUFFIX = ".seg"
+_QUARANTINE = "quarantine.rec"
+
+
+def _seg_name(seq: int) -> str:
+    return f"{seq:012d}{_SUFFIX}"
+
+
+class Spool:
+    def __init__(self, directory: str, segment_bytes: int, fsync_ms: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_seconds = fsync_ms / 1000.0
+        self._fh = None
+        self._active_seq = 0
+        self._active_size = 0
+        self._last_fsync = 0.0
+        self._read_pos = (0, 0)   # (segment seq, offset) of the next uncommitted record
+        self.appended = 0
+        self.skipped = 0
+        self.quarantined = 0
+        self.has_data = asyncio.Event()
+
+    # ---------- lifecycle ----------
+
+    def open(self) -> None:
+        """Recover the checkpoint and start a fresh segment for new appends"""
+        os.makedirs(self.directory, exist_ok=True)
+        seqs = self.segments()
+        self._read_pos = self._load_checkpoint(seqs)
+        self._active_seq = (seqs[-1] + 1) if seqs else 1
+        self._open_active()
+        pending = self.pending_bytes()
+        if pending:
+            logger.info(f"📼 Spool has {pending} bytes to replay in {len(seqs)} segment(s)")
+            self.has_data.set()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+            self._fh = None
+
+    def segments(self) -> list[int]:
+        return sorted(int(n[:-len(_SUFFIX)]) for n in os.listdir(self.directory) if n.endswith(_SUFFIX))
+
+    def pending_bytes(self) -> int:
+        seq, offset = self._read_pos
+        total = 0
+        for s in self.segments():
+            if s >= seq:
+                total += os.path.getsize(self._path(s)) - (offset if s == seq else 0)
+        return total
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, _seg_name(seq))
+
+    def _open_active(self) -> None:
+        self._fh = open(self._path(self._active_seq), "ab")
+        self._active_size = self._fh.tell()
+
+    # ---------- append (receive side) ----------
+
+    def append(self, topic: str, payload: bytes) -> None:
+        """Write one record; survives a process crash once this returns"""
+        t = topic.encode()
+        body = _TOPIC_LEN.pack(len(t)) + t + payload
+        self._fh.write(_HEADER.pack(len(body), zlib.crc32(body)) + body)
+        self._fh.flush()  # into the OS page cache
+        self._active_size += _HEADER.size + len(body)
+        self.appended += 1
+
+        now = time.monotonic()
+        if self.fsync_seconds == 0 or now - self._last_fsync >= self.fsync_seconds:
+            os.fsync(self._fh.fileno())  # power loss
+            self._last_fsync = now
+        if self._active_size >= self.segment_bytes:
+            self._fh.close()
+            self._active_seq += 1
+            self._open_active()
+        self.has_data.set()
+
+    def quarantine(self, topic: str, payload: bytes) -> None:
+        """Keep a record that can't be written, outside the replay path"""
+        t = topic.encode()
+        body = _TOPIC_LEN.pack(len(t)) + t + payload
+        with open(os.path.join(self.directory, _QUARANTINE), "ab") as fh:
+            fh.write(_HEADER.pack(len(body), zlib.crc32(body)) + body)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.quarantined += 1
+
+    # ---------- read / commit (replay side) ----------
+
+    @property
+    def position(self) -> tuple[int, int]:
+        return self._read_pos
+
+    def read_batch(self, max_records: int) -> tuple[list[tuple[str, bytes]], tuple[int, int]]:
+        """Up to max_records from the read position; returns (records, position after them)"""
+        seq, offset = self._read_pos
+        records: list[tuple[str, bytes]] = []
+        while len(records) < max_records:
+            # Captured before reading: a segment that was active may still be growing
+            active_seq = self._active_seq
+            path = self._path(seq)
+            if os.path.exists(path):
+                offset, clean_end = self._read_segment(path, offset, max_records - len(records), records)
+                if len(records) >= max_records or seq >= active_seq:
+                    break
+                if not clean_end:
+                    # Torn tail of an old segment (crash mid-write): nothing valid after it
+                    self.skipped += 1
+                    logger.warning(f"⚠️ Spool segment {_seg_name(seq)} has a torn tail; skipped")
+            later = [s for s in self.segments() if s > seq]
+            if not later:
+                break
+            seq, offset = later[0], 0
+        return records, (seq, offset)
+
+    def _read_segment(self, path: str, offset: int, limit: int, out: list) -> tuple[int, bool]:
+        """Append up to limit records from offset; returns (new offset, ended cleanly)"""
+        with open(path, "rb") as fh:
+            fh.seek(offset)
+            while limit > 0:
+                header = fh.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return offset, not header
+                length, crc = _HEADER.unpack(header)
+                if length > self.segment_bytes * 2:
+                    return offset, False
+                body = fh.read(length)
+                if len(body) < length:
+                    return offset, False
+                offset += _HEADER.size + length
+                if zlib.crc32(body) != crc:
+                    self.skipped += 1
+                    logger.warning(f"⚠️ Spool record with bad CRC skipped ({os.path.basename(path)}@{offset})")
+                    continue
+                (tlen,) = _TOPIC_LEN.unpack_from(body)
+                topic = body[_TOPIC_LEN.size:_TOPIC_LEN.size + tlen].decode(errors="replace")
+                out.append((topic, body[_TOPIC_LEN.size + tlen:]))
+                limit -= 1
+        return offset, True
+
+    def commit(self, position: tuple[int, int]) -> None:
+        """Everything before position is in the database"""
+        self._read_pos = position
+        tmp = os.path.join(self.directory, "checkpoint.tmp")
+        with open(tmp, "w") as fh:
+            json.dump({"seq": position[0], "offset": position[1]}, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, os.path.join(self.directory, "checkpoint"))
+        for s in self.segments():
+            if s < position[0] and s != self._active_seq:
+                os.remove(self._path(s))
+
+    def _load_checkpoint(self, seqs: list[int]) -> tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, "checkpoint")) as fh:
+                data = json.load(fh)
+            return int(data["seq"]), int(data["offset"])
+        except (OSError, ValueError, KeyError):
+            return (seqs[0], 0) if seqs else (1, 0)
+
+    def stats(self) -> dict:
+        return {
+            "appended": self.appended,
+            "skipped": self.skipped,
+            "quarantined": self.quarantined,
+            "segments": len(self.segments()),
+            "pending_bytes": self.pending_bytes(),
+        }
+
+
+class SpoolReplayer:
+    """Moves spooled records into the database; never drops on DB availability errors"""
+
+    def __init__(
+        self,
+        spool: Spool,
+        decode: Callable[[str, bytes], list],
+        write: Callable[[list], Optional[int]],   # returns rows the database rejected
+        batch_size: int,
+        retry_seconds: float = 1.0,
+    ):
+        self.spool = spool
+        self.decode = decode
+        self.write = write
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self.replayed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.retries = 0
+        self._stopping = False
+
+    async def run(self) -> None:
+        while not self._stopping:
+            self.spool.has_data.clear()
+            records, position = await asyncio.to_thread(self.spool.read_batch, self.batch_size)
+            if not records:
+                if position != self.spool.position:
+                    self.spool.commit(position)  # skipped torn / bad records
+                try:
+                    await asyncio.wait_for(self.spool.has_data.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            groups = []   # (topic, payload, rows) per record
+            for topic, payload in records:
+                try:
+                    rows = self.decode(topic, payload)
+                except Exception as e:
+                    logger.error(f"❌ Spooled message undecodable, dropped: {e}")
+                    rows = []
+                if not rows:
+                    self.dropped += 1
+                else:
+                    groups.append((topic, payload, rows))
+
+            pending = deque([groups]) if groups else deque()
+            while pending:
+                try:
+                    await asyncio.to_thread(self._drain, pending)
+                except OperationalError as e:
+                    # Locked / unavailable DB: keep the records, try again
+                    self.retries += 1
+                    logger.error(f"❌ Spool replay write failed, retrying: {e.orig}")
+                    await asyncio.sleep(self.retry_seconds)
+                    if self._stopping:
+                        return  # still spooled; replayed on next start
+            await asyncio.to_thread(self.spool.commit, position)
+
+    def _drain(self, pending: deque) -> None:
+        """
+        Write chunks of records front to back. A chunk failing for anything
+        but DB availability is halved until the bad record is alone, which is
+        quarantined. Written chunks leave `pending`, so a retry after an
+        OperationalError doesn't write them twice.
+        """
+        while pending:
+            chunk = pending[0]
+            rows = [m for _, _, group in chunk for m in group]
+            try:
+                self.rejected += self.write(rows) or 0
+            except OperationalError:
+                raise
+            except Exception as e:
+                pending.popleft()
+                if len(chunk) > 1:
+                    mid = len(chunk) // 2
+                    pending.appendleft(chunk[mid:])
+                    pending.appendleft(chunk[:mid])
+                    continue
+                topic, payload, _ = chunk[0]
+                logger.error(f"❌ Spooled message from {topic} can't be written, quarantined: {e}")
+                self.spool.quarantine(topic, payload)
+                continue
+            pending.popleft()
+            self.replayed += len(rows)
+
+    def stop(self) -> None:
+        """Finish the batch in progress, then exit run()"""
+        self._stopping = True
+        self.spool.has_data.set()
+
+    def stats(self) -> dict:
+        return {
+            "replayed": self.replayed, "dropped": self.dropped, "rejected": self.rejected,
+            "retries": self.retries, **self.spool.stats(),
+        }
@@ -0,0 +1,149 @@
+"""
+Alert-to-dashboard latency of the alert fast path.
+
+Publishes gateway alerts the way the firmware does (the reading on
+`<prefix><device>/data`, then the same JSON on `.../alert`) and measures
+publish -> SSE event on GET /api/alerts/stream, in milliseconds, optionally
+under a background `/data` load. Also reports the server's
+receipt -> SSE push and receipt -> alert_events commit histograms, and the
+/data receive -> commit latency the old poll-based dashboard waited for on
+top of its POLL_MS.
+
+Usage (from backend/, backend pointed at the stand-in broker):
+    MQTT_BROKER=127.0.0.1 MQTT_PORT=1883 uvicorn app.main:app
+    python -m benchmarks.bench_alert_latency --broker-standin --alerts 200 --load-rate 2000
+
+Prints one JSON object.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+
+async def read_sse(client, url: str, on_event, ready: asyncio.Event) -> None:
+    async with client.stream("GET", url, timeout=None) as r:
+        ready.set()
+        data = []
+        async for line in r.aiter_lines():
+            if line.startswith("data:"):
+                data.append(line[5:].strip())
+            elif not line and data:
+                on_event(json.loads("\n".join(data)))
+                data = []
+
+
+async def run(args) -> dict:
+    import httpx
+    from app.config import settings
+    from benchmarks.loadgen import Fleet, histogram_quantiles, parse_histogram, percentiles
+    from benchmarks.mini_broker import MiniBroker, MiniPublisher
+
+    broker = None
+    if args.broker_standin:
+        broker = MiniBroker("127.0.0.1", args.port)
+        await broker.start()
+        deadline = time.monotonic() + args.wait_subscriber
+        # The backend holds two subscriptions: the consumer and the alert listener
+        while broker.subscribers() < 2 and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        if broker.subscribers() < 2:
+            print(f"⚠️ {broker.subscribers()} subscriber(s) on 127.0.0.1:{broker.port}; publishing anyway", file=sys.stderr)
+
+    loop = asyncio.get_running_loop()
+    prefix = settings.MQTT_TOPIC_PREFIX
+    fleet = Fleet(args.devices, args.seed)
+    sent: dict[tuple, float] = {}
+    latencies: list[float] = []
+
+    def on_event(event: dict) -> None:
+        t = sent.pop((event["device_id"], event["frame_counter"]), None)
+        if t is not None:
+            latencies.append(loop.time() - t)
+
+    pub = MiniPublisher(args.host, broker.port if broker else args.port, client_id="bench-alerts")
+    await pub.connect()
+    consumer_metrics = args.metrics_url or args.url + "/metrics"
+
+    async with httpx.AsyncClient(base_url=args.url) as client:
+        before = (await client.get("/metrics")).text, (await client.get(consumer_metrics)).text
+        ready = asyncio.Event()
+        reader = asyncio.create_task(read_sse(client, "/api/alerts/stream", on_event, ready))
+        await asyncio.wait_for(ready.wait(), 10)
+
+        async def load() -> None:
+            if args.load_rate <= 0:
+                return
+            step = 1.0 / args.load_rate
+            next_at = loop.time()
+            while True:
+                i = fleet.rng.randrange(args.devices)
+                pub.publish(f"{prefix}{fleet.ids[i]}/data", fleet.gateway_payload(i, time.time()))
+                next_at += step
+                delay = next_at - loop.time()
+                if delay > 0:
+                    await pub.drain()
+                    await asyncio.sleep(delay)
+
+        load_task = asyncio.create_task(load())
+        await asyncio.sleep(args.warmup)
+        for n in range(args.alerts):
+            i = fleet.rng.randrange(args.devices)
+            reading = fleet.gateway_reading(i, time.time())
+            reading.update(fc=1_000_000 + n, da=True, st="HIGH")
+            payload = json.dumps(reading, separators=(",", ":")).encode()
+            pub.publish(f"{prefix}{fleet.ids[i]}/data", payload)
+            sent[(fleet.ids[i], 1_000_000 + n)] = loop.time()
+            pub.publish(f"{prefix}{fleet.ids[i]}/alert", payload)
+            await pub.drain()
+            await asyncio.sleep(args.interval)
+        load_task.cancel()
+        await asyncio.sleep(args.settle)
+        reader.cancel()
+        after = (await client.get("/metrics")).text, (await client.get(consumer_metrics)).text
+        stored = (await client.get("/api/alerts/events", params={"hours": 1, "limit": 1000})).json()["count"]
+
+    await pub.close()
+    if broker is not None:
+        await broker.close()
+
+    def server(name: str, consumer: bool) -> dict:
+        k = 1 if consumer else 0
+        return histogram_quantiles(parse_histogram(before[k], name), parse_histogram(after[k], name))
+
+    return {
+        "alerts": args.alerts,
+        "load_rate": args.load_rate,
+        "received": len(latencies),
+        "lost": len(sent),
+        "stored_events_last_hour": stored,
+        "publish_to_sse_ms": percentiles(latencies),
+        "server_push_ms": server("aq_alert_push_seconds", False),
+        "server_alert_commit_ms": server("aq_alert_commit_seconds", True),
+        "data_receive_to_commit_ms": server("aq_ingest_receive_to_commit_seconds", True),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--metrics-url", default="", help="MQTT consumer /metrics (ingest worker when the API is read-only; default the API)")
+    parser.add_argument("--host", default="127.0.0.1", help="broker host (without --broker-standin)")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--broker-standin", action="store_true", help="run benchmarks.mini_broker in-process")
+    parser.add_argument("--wait-subscriber", type=float, default=15.0)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--alerts", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between alerts")
+    parser.add_argument("--load-rate", type=float, default=0.0, help="background /data readings/s")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--settle", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    json.dump(asyncio.run(run(args)), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Anomaly engine throughput, detection and snapshot round trip.
+
+Replays --hours of loadgen fleet readings (one per device every
+--interval seconds, in time order, in writer-sized batches) through
+app.anomaly.AnomalyEngine and reports readings/s spent scoring. A fraction
+(--spike-rate) of readings gets a one-off eCO2 / TVOC spike added; recall
+counts how many of those were flagged once the detectors were warm. The
+fleet also has its own pollution episodes (--episodes-per-hour), so
+`flagged_other_pct` is the false positive rate only with 0 episodes.
+Finally the state is saved and loaded into a fresh engine.
+
+Usage (from backend/):
+    python -m benchmarks.bench_anomaly
+    python -m benchmarks.bench_anomaly --devices 2000 --hours 6 --detectors ewma,mad
+
+Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("MQTT_BROKER", "localhost")
+
+
+class Row:
+    """The Measurement attributes the engine reads and writes"""
+    def __init__(self, device_id, ts, eco2_ppm, tvoc_ppb):
+        self.device_id = device_id
+        self.ts = ts
+        self.eco2_ppm = eco2_ppm
+        self.tvoc_ppb = tvoc_ppb
+        self.anom_eco2 = None
+        self.anom_tvoc = None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--hours", type=float, default=12.0)
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds between a device's readings")
+    parser.add_argument("--batch", type=int, default=0, help="rows per observe() call (default INGEST_BATCH_SIZE)")
+    parser.add_argument("--detectors", default="", help="default ANOMALY_DETECTORS")
+    parser.add_argument("--spike-rate", type=float, default=0.002)
+    parser.add_argument("--episodes-per-hour", type=float, default=0.5, help="fleet pollution episodes per device")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import numpy as np
+    from app.anomaly import AnomalyEngine
+    from app.config import settings
+    from benchmarks.loadgen import Fleet
+
+    names = [d.strip() for d in (args.detectors or settings.ANOMALY_DETECTORS).split(",") if d.strip()]
+    batch_size = args.batch or settings.INGEST_BATCH_SIZE
+    fleet = Fleet(args.devices, args.seed, args.episodes_per_hour)
+    rng = fleet.rng
+    start = time.time() - args.hours * 3600
+    steps = int(args.hours * 3600 / args.interval)
+    warm_after = settings.ANOMALY_WARMUP * args.interval
+
+    engine = AnomalyEngine(names, settings.ANOMALY_Z_THRESHOLD)
+    spent = 0.0
+    total = spikes = caught = other = other_flagged = 0
+    batch: list[Row] = []
+    truth: list[bool] = []
+
+    def flush() -> None:
+        nonlocal spent, caught, other, other_flagged
+        t0 = time.perf_counter()
+        engine.observe(batch)
+        spent += time.perf_counter() - t0
+        for row, spiked in zip(batch, truth):
+            flagged = bool(row.anom_eco2 or row.anom_tvoc)
+            if row.ts.timestamp() - start < warm_after:
+                continue
+            if spiked:
+                caught += flagged
+            else:
+                other += 1
+                other_flagged += flagged
+        batch.clear()
+        truth.clear()
+
+    for k in range(steps):
+        for i in range(args.devices):
+            now = start + k * args.interval + i * args.interval / args.devices
+            r = fleet.step(i, now)
+            spiked = rng.random() < args.spike_rate
+            if spiked:
+                r["eco2_ppm"] += rng.randint(400, 1200)
+                r["tvoc_ppb"] += rng.randint(300, 900)
+                spikes += now - start >= warm_after
+            batch.append(Row(fleet.ids[i], datetime.fromtimestamp(now, tz=timezone.utc), r["eco2_ppm"], r["tvoc_ppb"]))
+            truth.append(spiked)
+            total += 1
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine.tag = "bench"
+        t0 = time.perf_counter()
+        path = engine.save(tmp)
+        save_ms = (time.perf_counter() - t0) * 1000.0
+        size = os.path.getsize(path)
+        restored = AnomalyEngine(names, settings.ANOMALY_Z_THRESHOLD)
+        t0 = time.perf_counter()
+        count = restored.load(tmp)
+        load_ms = (time.perf_counter() - t0) * 1000.0
+        identical = all(
+            np.array_equal(a[:len(engine)], b[:len(restored)]) for a, b in zip(engine._state, restored._state)
+        )
+
+    json.dump({
+        "detectors": names,
+        "devices": args.devices,
+        "readings": total,
+        "batch": batch_size,
+        "observe_s": round(spent, 3),
+        "readings_per_s": round(total / spent),
+        "us_per_reading": round(spent / total * 1e6, 2),
+        "spikes": spikes,
+        "spike_recall_pct": round(100.0 * caught / spikes, 1) if spikes else None,
+        "flagged_other_pct": round(100.0 * other_flagged / other, 3) if other else None,
+        "snapshot": {
+            "bytes": size, "bytes_per_device": round(size / args.devices),
+            "save_ms": round(save_ms, 1), "load_ms": round(load_ms, 1),
+            "devices_restored": count, "identical": identical,
+        },
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Area correlator cost and detection on a simulated fleet.
+
+--devices spread over --cities x --districts report every --interval
+seconds for --hours (simulated clock, no database). Isolated readings are
+elevated at random (--noise, a single flaky sensor); every
+--episode-every minutes one district gets an episode in which
+--episode-share of its devices are elevated for --episode-minutes.
+Reports microseconds per reading through AreaCorrelator.observe, how many
+episodes raised a district event and after how long, and district events
+raised where there was no episode.
+
+Usage (from backend/):
+    python -m benchmarks.bench_correlator
+    python -m benchmarks.bench_correlator --devices 10000 --districts 20 --noise 0.02
+
+Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("MQTT_BROKER", "localhost")
+
+
+class Reading:
+    """The LatestReading attributes the correlator reads"""
+    __slots__ = ("device_id", "ts", "alert", "anom_eco2", "anom_tvoc", "status", "aq_score", "eco2_ppm", "tvoc_ppb")
+
+    def __init__(self, device_id, ts, elevated, rng):
+        self.device_id = device_id
+        self.ts = ts
+        self.alert = elevated
+        self.anom_eco2 = self.anom_tvoc = False
+        self.status = "HIGH" if elevated else "NORMAL"
+        self.aq_score = rng.randint(20, 40) if elevated else rng.randint(70, 95)
+        self.eco2_ppm = rng.randint(900, 1500) if elevated else rng.randint(420, 600)
+        self.tvoc_ppb = rng.randint(400, 900) if elevated else rng.randint(20, 120)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--cities", type=int, default=4)
+    parser.add_argument("--districts", type=int, default=10, help="per city")
+    parser.add_argument("--interval", type=float, default=60.0)
+    parser.add_argument("--hours", type=float, default=6.0)
+    parser.add_argument("--noise", type=float, default=0.01, help="probability a reading is elevated on its own")
+    parser.add_argument("--episode-every", type=float, default=30.0, help="minutes")
+    parser.add_argument("--episode-minutes", type=float, default=10.0)
+    parser.add_argument("--episode-share", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    from app.config import settings
+    from app.correlator import AreaCorrelator
+
+    rng = random.Random(args.seed)
+    areas = [(f"city-{c}", f"district-{c}-{d}") for c in range(args.cities) for d in range(args.districts)]
+    home = {f"sim-{i:05d}": areas[i % len(areas)] for i in range(args.devices)}
+    ids = list(home)
+    correlator = AreaCorrelator(
+        settings.CORRELATOR_WINDOW_SECONDS, settings.CORRELATOR_MIN_DEVICES,
+        settings.CORRELATOR_MIN_FRACTION, 100_000, area_of=home.get,
+    )
+
+    start = time.time() - args.hours * 3600
+    end = start + args.hours * 3600
+    episodes = []   # (area, start, end, member device ids)
+    t = start + args.episode_every * 60
+    while t + args.episode_minutes * 60 < end:
+        area = rng.choice(areas)
+        members = {d for d in ids if home[d] == area and rng.random() < args.episode_share}
+        episodes.append((area, t, t + args.episode_minutes * 60, members))
+        t += args.episode_every * 60
+
+    spent = 0.0
+    readings = 0
+    steps = int(args.hours * 3600 / args.interval)
+    for k in range(steps):
+        base = start + k * args.interval
+        active = [e for e in episodes if e[1] <= base < e[2]]
+        for j, device_id in enumerate(ids):
+            now = base + j * args.interval / len(ids)
+            elevated = rng.random() < args.noise or any(device_id in e[3] for e in active)
+            r = Reading(device_id, datetime.fromtimestamp(now, tz=timezone.utc), elevated, rng)
+            t0 = time.perf_counter()
+            correlator.observe(r, now)
+            spent += time.perf_counter() - t0
+            readings += 1
+        correlator.tick(base + args.interval)
+
+    events = correlator.list_events(level="district", limit=100_000)
+    detected, delays, matched = 0, [], set()
+    for area, s, e, _ in episodes:
+        hits = [ev for ev in events if (ev["city"], ev["district"]) == area and s <= ev["started_at"] <= e]
+        if hits:
+            detected += 1
+            delays.append(min(ev["started_at"] for ev in hits) - s)
+            matched.update(ev["id"] for ev in hits)
+    false_events = [
+        ev for ev in events
+        if ev["id"] not in matched and not any(
+            (ev["city"], ev["district"]) == area and s <= ev["started_at"] <= e + settings.CORRELATOR_WINDOW_SECONDS
+            for area, s, e, _ in episodes
+        )
+    ]
+    delays.sort()
+
+    json.dump({
+        "devices": args.devices,
+        "areas": {"cities": args.cities, "districts": len(areas)},
+        "readings": readings,
+        "us_per_reading": round(spent / readings * 1e6, 2),
+        "readings_per_s": round(readings / spent),
+        "episodes": len(episodes),
+        "episodes_detected": detected,
+        "detection_delay_s": {
+            "p50": round(delays[len(delays) // 2], 1) if delays else None,
+            "max": round(delays[-1], 1) if delays else None,
+        },
+        "district_events": len(events),
+        "district_events_without_episode": len(false_events),
+        "city_events": len(correlator.list_events(level="city", limit=100_000)),
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Downsampling benchmark on a 1M-row series.
+
+Usage (from backend/):
+    python -m benchmarks.bench_downsample                # algorithms only
+    python -m benchmarks.bench_downsample --e2e          # + /api/history on a temp SQLite DB
+    python -m benchmarks.bench_downsample --rows 5000000 --points 1000
+
+Prints one JSON object with timings in milliseconds.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+
+def synthetic_series(rows: int, seed: int = 42):
+    """eCO2-like random walk with a few sharp pollution spikes flagged as alerts"""
+    rng = np.random.default_rng(seed)
+    x = np.arange(rows, dtype=np.float64) * 5.0  # one reading every 5 s
+    y = 450 + np.cumsum(rng.normal(0, 1.5, rows))
+    alert = np.zeros(rows, dtype=bool)
+    for pos in rng.integers(0, rows, size=20):
+        width = int(rng.integers(1, 4))
+        y[pos:pos + width] += rng.uniform(300, 900)
+        alert[pos:pos + width] = True
+    return x, y, alert
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
+
+
+def bench_algorithms(rows: int, points: int) -> dict:
+    from app.downsample import downsample
+
+    x, y, alert = synthetic_series(rows)
+    out = {}
+    for method in ("lttb", "minmax"):
+        keep = downsample(x, y, alert, points, method)
+        survived = bool(np.isin(np.flatnonzero(alert), keep).all())
+        out[method] = {
+            "ms": round(best_of(lambda: downsample(x, y, alert, points, method)), 2),
+            "points": int(len(keep)),
+            "alerts_survived": survived,
+        }
+    return out
+
+
+def seed_db(path: str, rows: int) -> None:
+    x, y, alert = synthetic_series(rows)
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc).replace(tzinfo=None)
+    from app.database import Base, engine  # engine is bound to DB_PATH
+    from app import models  # noqa: F401  (register tables)
+    Base.metadata.create_all(bind=engine)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO measurements (device_id, ts, eco2_ppm, tvoc_ppb, alert, status) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            ("bench-1", (base + timedelta(seconds=float(t))).strftime("%Y-%m-%d %H:%M:%S.%f"), int(v), 50, int(a), "NORMAL")
+            for t, v, a in zip(x, y, alert)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def bench_endpoint(rows: int, points: int) -> dict:
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    seed_db(os.environ["DB_PATH"], rows)
+    out = {}
+    with TestClient(app) as client:
+        for method in ("lttb", "minmax"):
+            params = {"device_id": "bench-1", "max_points": points, "downsample": method}
+            resp = client.get("/api/history", params=params)
+            body = resp.json()
+            out[method] = {
+                "ms": round(best_of(lambda: client.get("/api/history", params=params), repeat=2), 1),
+                "points": body["count"],
+                "source_count": body["source_count"],
+                "json_bytes": len(resp.content),
+            }
+        resp = client.get("/api/history", params={"device_id": "bench-1", "limit": 5000})
+        out["raw_limit_5000"] = {"json_bytes": len(resp.content)}
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--points", type=int, default=1000)
+    parser.add_argument("--e2e", action="store_true", help="also time /api/history on a temp DB")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.e2e:
+        # Must be set before app modules create the engine
+        tmpdir = tempfile.mkdtemp(prefix="bench-ds-")
+        os.environ["DB_PATH"] = os.path.join(tmpdir, "bench.db")
+        os.environ["MQTT_BROKER"] = "localhost"
+
+    result = {"rows": args.rows, "points": args.points, "algorithms": bench_algorithms(args.rows, args.points)}
+    if args.e2e:
+        result["endpoint"] = bench_endpoint(args.rows, args.points)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Forecasting job cost on a synthetic fleet.
+
+Seeds --devices devices with --hours of readings every --interval seconds
+(init_db.seed_dataset) into a temporary database; every other device gets
+TinyML-style predictions (the reading plus noise, i.e. a persistence model).
+The newest hour is held back, then:
+
+1. full pass:        the whole history is rolled up, every matured
+                     prediction scored, every device forecast
+2. incremental pass: the held-back hour is inserted and the job runs again
+                     one hour later, so only new ids are rolled up and only
+                     newly matured predictions (and the forecasts of the
+                     completed hour) are scored
+
+Reports seconds per step for both passes and the mean per-device MAE of
+the TinyML predictions and the server forecasts.
+
+Usage (from backend/):
+    python -m benchmarks.bench_forecast
+    python -m benchmarks.bench_forecast --devices 2000 --hours 168 --interval 300
+
+Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--hours", type=int, default=48)
+    parser.add_argument("--interval", type=int, default=600, help="seconds between a device's readings")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-forecast-")
+    path = os.path.join(tmp, "forecast.db")
+    os.environ["DB_PATH"] = path
+    os.environ["MQTT_LOCK_DIR"] = tmp
+    os.environ.setdefault("MQTT_BROKER", "localhost")
+
+    import logging
+    logging.disable(logging.WARNING)
+    from app.database import Base, engine
+    from app.forecasting import run_pass
+    from init_db import seed_dataset
+
+    Base.metadata.create_all(bind=engine)
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    cut = end - timedelta(hours=1)
+
+    t0 = time.perf_counter()
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA synchronous=OFF")
+    rows = seed_dataset(con, args.devices, args.hours * 3600 // args.interval, args.interval, args.seed, end, prefix="fc")
+    con.execute(
+        "UPDATE measurements SET pred_eco2_60m = eco2_ppm + abs(random()) % 61 - 30, "
+        "pred_tvoc_60m = tvoc_ppb + abs(random()) % 21 - 10 WHERE CAST(substr(device_id, 4) AS INTEGER) % 2 = 0"
+    )
+    con.execute("CREATE TABLE held_back AS SELECT * FROM measurements WHERE ts >= ?", (cut.isoformat(sep=" "),))
+    con.execute("DELETE FROM measurements WHERE ts >= ?", (cut.isoformat(sep=" "),))
+    con.commit()
+    seed_s = time.perf_counter() - t0
+
+    utc = timezone.utc
+    full = run_pass(now=cut.replace(tzinfo=utc) + timedelta(minutes=6))
+    columns = ", ".join(c[1] for c in con.execute("PRAGMA table_info(held_back)") if c[1] != "id")
+    con.execute(f"INSERT INTO measurements ({columns}) SELECT {columns} FROM held_back ORDER BY id")
+    con.commit()
+    incremental = run_pass(now=end.replace(tzinfo=utc) + timedelta(minutes=6))
+
+    def mean_mae(source: str, metric: str):
+        row = con.execute(
+            "SELECT avg(sum_abs_err / n), count(*) FROM forecast_accuracy WHERE source = ? AND metric = ? AND n > 0",
+            (source, metric),
+        ).fetchone()
+        return {"mae": round(row[0], 1) if row[0] is not None else None, "devices": row[1]}
+
+    report = {
+        "devices": args.devices,
+        "rows": rows,
+        "seed_s": round(seed_s, 1),
+        "full_pass": full,
+        "full_pass_s": round(sum(full["seconds"].values()), 2),
+        "incremental_pass": incremental,
+        "incremental_pass_s": round(sum(incremental["seconds"].values()), 2),
+        "rollup_rows": con.execute("SELECT count(*) FROM hourly_rollups").fetchone()[0],
+        "accuracy": {
+            f"{source}_{metric}": mean_mae(source, metric)
+            for source in ("tinyml", "server") for metric in ("eco2_ppm", "tvoc_ppb")
+        },
+    }
+    con.close()
+    engine.dispose()
+    shutil.rmtree(tmp, ignore_errors=True)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
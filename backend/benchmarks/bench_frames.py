@@ -0,0 +1,110 @@
+"""
+Decode throughput: gateway JSON vs binary frames vs batch envelopes.
+
+Decodes the same readings (from the loadgen fleet) as
+    json          decode_message, one long-key JSON message per reading
+    json_short    decode_message, gateway short-key JSON
+    frame         decode_frames, one 24-byte frame per message
+    frame_packed  decode_frames, --pack frames per message
+    json_batch    decode_batch, --pack short-key readings per gateway envelope
+and reports readings/s and bytes per reading. Decoding to Measurement
+objects is timed, no database; building the ORM object costs about as much
+as parsing, so two parse-only cases are added:
+    json_loads    json.loads of the short-key messages
+    frame_rows    decode_frame_rows of the packed messages (Python tuples)
+
+Usage (from backend/):
+    python -m benchmarks.bench_frames
+    python -m benchmarks.bench_frames --readings 200000 --pack 64
+
+Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("MQTT_BROKER", "localhost")
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=50_000)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--pack", type=int, default=32, help="frames per packed message")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    from app.frames import decode_frame_rows, decode_frames, encode_frames
+    from app.mqtt_client import decode_batch, decode_message
+    from benchmarks.loadgen import Fleet
+
+    fleet = Fleet(args.devices)
+    now = time.time()
+    readings = []
+    for n in range(args.readings):
+        i = n % args.devices
+        r = fleet.step(i, now + n)
+        r.update(device_id=fleet.ids[i], frame_counter=fleet.frame[i], ts=int(now + n), status="NORMAL")
+        readings.append(r)
+
+    long_json = [json.dumps({**r, "ts_ms": r["ts"] * 1000, "ts": None}).encode() for r in readings]
+    short_json = [json.dumps({
+        "id": r["device_id"], "ts_ms": r["ts"] * 1000, "t": int(r["temp_c"] * 10), "h": int(r["hum_rh"] * 10),
+        "p": r["pressure_hpa"], "v": r["tvoc_ppb"], "e": r["eco2_ppm"], "st": "NORMAL",
+        "fc": r["frame_counter"], "rssi": r["rssi"], "snr": r["snr"],
+    }, separators=(",", ":")).encode() for r in readings]
+    frames = [(r["device_id"], encode_frames([r])) for r in readings]
+    by_device: dict[str, list] = {}
+    for r in readings:
+        by_device.setdefault(r["device_id"], []).append(r)
+    packed = [
+        (device, encode_frames(rows[k:k + args.pack]))
+        for device, rows in by_device.items()
+        for k in range(0, len(rows), args.pack)
+    ]
+
+    short_readings = [json.loads(raw) for raw in short_json]
+    envelopes = [
+        json.dumps({"gw": "gw-0000", "readings": short_readings[k:k + args.pack]}, separators=(",", ":")).encode()
+        for k in range(0, len(short_readings), args.pack)
+    ]
+
+    cases = {
+        "json": (lambda: [decode_message(raw) for raw in long_json], sum(map(len, long_json))),
+        "json_short": (lambda: [decode_message(raw) for raw in short_json], sum(map(len, short_json))),
+        "frame": (lambda: [decode_frames(raw, d) for d, raw in frames], sum(len(raw) for _, raw in frames)),
+        "frame_packed": (lambda: [decode_frames(raw, d) for d, raw in packed], sum(len(raw) for _, raw in packed)),
+        "json_batch": (lambda: [decode_batch(raw) for raw in envelopes], sum(map(len, envelopes))),
+        "json_loads": (lambda: [json.loads(raw) for raw in short_json], sum(map(len, short_json))),
+        "frame_rows": (lambda: [decode_frame_rows(raw) for _, raw in packed], sum(len(raw) for _, raw in packed)),
+    }
+    result = {"readings": args.readings, "pack": args.pack, "cases": {}}
+    for name, (fn, size) in cases.items():
+        seconds = best_of(fn, args.repeat)
+        result["cases"][name] = {
+            "ms": round(seconds * 1000.0, 1),
+            "readings_per_s": round(args.readings / seconds),
+            "bytes_per_reading": round(size / args.readings, 1),
+        }
+    base = result["cases"]["json"]["readings_per_s"]
+    for case in result["cases"].values():
+        case["speedup_vs_json"] = round(case["readings_per_s"] / base, 2)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
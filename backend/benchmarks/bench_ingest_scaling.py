@@ -0,0 +1,121 @@
+"""
+Ingest throughput vs. number of worker processes.
+
+Feeds synthetic gateway payloads (no broker) straight into the ingest
+paths and measures end-to-end readings/s until everything is committed:
+
+- inproc:  the single-process path (decode in the event loop + BatchWriter)
+- procs=N: IngestPool dispatcher + N decode/write processes
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingest_scaling
+    python -m benchmarks.bench_ingest_scaling --messages 200000 --procs 1 2 4 8
+
+Each run uses a fresh temp SQLite DB. Prints one JSON object. Scaling is
+bounded by the cores available and by SQLite's single writer (commits are
+serialized; decoding and object construction run in parallel).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Must be set before app modules create the engine. Spawned
+# workers re-import this module and must keep the parent's DB.
+if "BENCH_INGEST_DB" not in os.environ:
+    os.environ["BENCH_INGEST_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench-ingest-"), "bench.db")
+os.environ["DB_PATH"] = os.environ["BENCH_INGEST_DB"]
+os.environ.setdefault("MQTT_BROKER", "localhost")
+
+
+def payloads(messages: int, devices: int) -> list[tuple[str, bytes]]:
+    out = []
+    for i in range(messages):
+        device_id = f"bench-{i % devices:04d}"
+        body = {
+            "id": device_id, "ts_ms": 1_735_689_600_000 + i * 100,
+            "t": 234 + i % 7, "h": 291, "p": 905, "v": 40 + i % 50, "e": 450 + i % 300,
+            "s": 90, "pe": 470, "pv": 45, "ae": 0, "av": 0, "da": 0, "st": "NORMAL",
+            "fc": i, "rssi": -60, "snr": 9.5,
+        }
+        out.append((device_id, json.dumps(body).encode()))
+    return out
+
+
+def _reset_db() -> None:
+    from app.database import Base, engine
+    from app import models  # noqa: F401
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def _count() -> int:
+    import sqlite3
+    con = sqlite3.connect(os.environ["DB_PATH"])
+    try:
+        return con.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+    finally:
+        con.close()
+
+
+async def run_inproc(items: list[tuple[str, bytes]]) -> float:
+    from app.batch_writer import BatchWriter
+    from app.config import settings
+    from app.mqtt_client import decode_message
+
+    writer = BatchWriter(settings.INGEST_BATCH_SIZE, settings.INGEST_FLUSH_MS, settings.INGEST_QUEUE_SIZE)
+    t0 = time.perf_counter()
+    writer.start()
+    for _, raw in items:
+        await writer.put(decode_message(raw))
+    await writer.close()
+    return time.perf_counter() - t0
+
+
+async def run_pool(items: list[tuple[str, bytes]], procs: int) -> float:
+    from app.config import settings
+    from app.ingest_pool import make_pool
+
+    pool = make_pool(procs)
+    pool.start()
+    await asyncio.sleep(2.0)  # let workers import and load the registry
+    t0 = time.perf_counter()
+    for device_id, raw in items:
+        await pool.submit(device_id, f"{settings.MQTT_TOPIC_PREFIX}{device_id}/data", raw)
+    await pool.close()
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    # Per-message logging would dominate the numbers
+    logging.getLogger("app.mqtt_client").setLevel(logging.WARNING)
+
+    items = payloads(args.messages, args.devices)
+    result = {"messages": args.messages, "devices": args.devices, "cpus": os.cpu_count(), "runs": {}}
+
+    _reset_db()
+    secs = asyncio.run(run_inproc(items))
+    result["runs"]["inproc"] = {"s": round(secs, 2), "msg_per_s": round(args.messages / secs), "rows": _count()}
+
+    for procs in args.procs:
+        _reset_db()
+        secs = asyncio.run(run_pool(items, procs))
+        result["runs"][f"procs={procs}"] = {"s": round(secs, 2), "msg_per_s": round(args.messages / secs), "rows": _count()}
+
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
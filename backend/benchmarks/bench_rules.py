@@ -0,0 +1,152 @@
+"""
+Alert rule compile time and per-reading evaluation cost.
+
+Builds --devices devices over --cities x --districts (no database) and a
+rule set with one rule per city, one per district and one for every
+--device-share-th device, then reports:
+
+- compile_ms:      rules.compile_rules for the whole fleet (one reload)
+- check_us:        compiled Evaluator.check per gateway reading (range +
+                   hysteresis + deltas against the previous reading)
+- legacy_check_us: the same verdict through the Settings-based helpers in
+                   alerts.py (evaluate_test_ranges + check_delta_change),
+                   which read every threshold from Settings per reading
+- classify_us:     compiled baseline classification (status + score)
+- apply_us:        RuleEngine.apply per reading, batches of --batch rows
+                   (lookup + check + previous-reading bookkeeping)
+
+Usage (from backend/):
+    python -m benchmarks.bench_rules
+    python -m benchmarks.bench_rules --devices 50000 --readings 500000
+
+Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("MQTT_BROKER", "localhost")
+
+
+class Reading:
+    """The Measurement attributes the rule engine reads and sets"""
+    __slots__ = ("device_id", "eco2_ppm", "tvoc_ppb", "temp_c", "hum_rh", "pressure_hpa", "status", "alert",
+                 "_rules_applied")
+
+    def __init__(self, device_id, prev, rng):
+        # random walk per device: mostly small steps, now and then a jump over the delta defaults
+        step = 60 if rng.random() < 0.02 else 12
+        self.device_id = device_id
+        self.eco2_ppm = max(400, prev.eco2_ppm + rng.randint(-step, step)) if prev else rng.randint(450, 650)
+        self.tvoc_ppb = max(0, prev.tvoc_ppb + rng.randint(-6, 6)) if prev else rng.randint(20, 130)
+        self.temp_c = round(prev.temp_c + rng.uniform(-0.1, 0.1), 2) if prev else 21.0
+        self.hum_rh = round(prev.hum_rh + rng.uniform(-0.5, 0.5), 2) if prev else 40.0
+        self.pressure_hpa = round(prev.pressure_hpa + rng.uniform(-0.2, 0.2), 2) if prev else 1006.0
+        self.status = "NORMAL"
+        self.alert = False
+        self._rules_applied = False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--cities", type=int, default=4)
+    parser.add_argument("--districts", type=int, default=10, help="per city")
+    parser.add_argument("--device-share", type=int, default=20, help="every Nth device gets its own rule")
+    parser.add_argument("--readings", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    from datetime import datetime
+    from app import alerts, rules
+    from app.config import settings
+    from app.registry import DeviceInfo
+
+    rng = random.Random(args.seed)
+    devices = []
+    for i in range(args.devices):
+        c, d = i % args.cities, (i // args.cities) % args.districts
+        devices.append(DeviceInfo(i, f"sim-{i:05d}", f"sim {i}", 0.0, 0.0, f"city-{c}", f"district-{c}-{d}", datetime.now()))
+    doc = {"rules": (
+        [{"city": f"city-{c}", "eco2_max": 650 + c} for c in range(args.cities)]
+        + [{"city": f"city-{c}", "district": f"district-{c}-{d}", "eco2_hyst": 25 + d}
+           for c in range(args.cities) for d in range(args.districts)]
+        + [{"device_id": d.device_id, "tvoc_max": 140} for d in devices[::args.device_share]]
+    )}
+
+    t0 = time.perf_counter()
+    overrides = rules.parse(doc)
+    default, compiled = rules.compile_rules(overrides, devices)
+    compile_ms = (time.perf_counter() - t0) * 1000
+
+    ids = [d.device_id for d in devices]
+    readings, last = [], {}
+    for _ in range(args.readings):
+        device_id = rng.choice(ids)
+        m = last[device_id] = Reading(device_id, last.get(device_id), rng)
+        readings.append(m)
+
+    # compiled check against the previous reading of the same device
+    prev: dict = {}
+    t0 = time.perf_counter()
+    for m in readings:
+        p = prev.get(m.device_id)
+        st, _ = compiled[m.device_id].check(m, p)
+        prev[m.device_id] = (st, m.eco2_ppm, m.tvoc_ppb, m.temp_c, m.hum_rh, m.pressure_hpa)
+    check_s = time.perf_counter() - t0
+
+    # the same through the Settings-based helpers
+    prev = {}
+    s = settings
+    t0 = time.perf_counter()
+    for m in readings:
+        p = prev.get(m.device_id)
+        delta = p is not None and (
+            alerts.check_delta_change(m.eco2_ppm, p[1], s.ECO2_DELTA_PPM)
+            or alerts.check_delta_change(m.tvoc_ppb, p[2], s.TVOC_DELTA_PPB)
+            or alerts.check_delta_change(m.temp_c, p[3], s.TEMP_DELTA_C)
+            or alerts.check_delta_change(m.hum_rh, p[4], s.HUM_DELTA_RH)
+            or alerts.check_delta_change(m.pressure_hpa, p[5], s.PRESS_DELTA_HPA)
+        )
+        st = alerts.evaluate_test_ranges(m.eco2_ppm, m.tvoc_ppb, p[0] if p else None, delta).status
+        prev[m.device_id] = (st, m.eco2_ppm, m.tvoc_ppb, m.temp_c, m.hum_rh, m.pressure_hpa)
+    legacy_s = time.perf_counter() - t0
+
+    pcts = [(rng.uniform(-20, 120), rng.uniform(-20, 120)) for _ in range(len(readings))]
+    t0 = time.perf_counter()
+    for (tp, ep), m in zip(pcts, readings):
+        compiled[m.device_id].classify(tp, ep)
+    classify_s = time.perf_counter() - t0
+
+    engine = rules.RuleEngine("")
+    engine._set = rules.RuleSet(1, "bench", time.time(), overrides, default, compiled)
+    t0 = time.perf_counter()
+    for i in range(0, len(readings), args.batch):
+        engine.apply(readings[i:i + args.batch])
+    apply_s = time.perf_counter() - t0
+
+    n = len(readings)
+    json.dump({
+        "devices": args.devices,
+        "rules": len(doc["rules"]),
+        "devices_with_rules": len(compiled),
+        "distinct_evaluators": len({id(ev) for ev in compiled.values()}),
+        "compile_ms": round(compile_ms, 1),
+        "readings": n,
+        "check_us": round(check_s / n * 1e6, 3),
+        "legacy_check_us": round(legacy_s / n * 1e6, 3),
+        "classify_us": round(classify_s / n * 1e6, 3),
+        "apply_us": round(apply_s / n * 1e6, 3),
+        "high_share": round(sum(m.status == "HIGH" for m in readings) / n, 3),
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Open-loop load generator with thousands of virtual sensor nodes.
+
+Targets:
+    http        POST /api/ingest, one reading per request (keep-alive pool)
+    http-batch  POST /api/ingest/batch, --batch readings per request
+    mqtt        gateway JSON on <MQTT_TOPIC_PREFIX><device>/data at QoS 0
+                (--payload binary: frames on .../<MQTT_BINARY_SUFFIX>;
+                --payload batch: --batch readings per gateway envelope on
+                <prefix><gateway>/<MQTT_BATCH_SUFFIX>);
+                --broker-standin starts benchmarks.mini_broker in-process
+
+Arrivals are Poisson at --rate readings/s no matter how fast the server
+answers (open loop). Latency is measured from the scheduled send time, so
+queueing in the server and in the client pool is included. Arrivals that
+find --max-inflight requests outstanding are counted as `missed`.
+
+Each node has its own baseline, a slow random-walk drift, a daily cycle
+and occasional pollution events (eCO2/TVOC spike with exponential decay).
+
+Usage (from backend/, with the server running):
+    python -m benchmarks.loadgen --target http --devices 10000 --rate 500 --duration 30
+    python -m benchmarks.loadgen --target http-batch --batch 100 --rate 5000
+    python -m benchmarks.loadgen --target mqtt --broker-standin --port 1883 --rate 20000 \\
+        --metrics-url http://127.0.0.1:8000/metrics
+
+For mqtt, point the backend at the stand-in (MQTT_BROKER=127.0.0.1
+MQTT_PORT=1883) and pass --metrics-url: client-side latency is only the
+socket write, the server's receive-to-commit histogram is diffed instead.
+With HTTP admission limits on (INGEST_KEY_RATE / INGEST_DEVICE_RATE,
+off by default) the run measures 429s. Prints one
+JSON object.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Optional
+
+os.environ.setdefault("MQTT_BROKER", "localhost")
+
+DAY = 86400.0
+
+
+# =========================================================
+# VIRTUAL FLEET
+# =========================================================
+
+class Fleet:
+    def __init__(self, devices: int, seed: int = 42, event_rate_per_hour: float = 0.5):
+        rng = random.Random(seed)
+        self.rng = rng
+        self.ids = [f"sim-{i:05d}" for i in range(devices)]
+        self.base_temp = [rng.gauss(20.0, 4.0) for _ in range(devices)]
+        self.base_hum = [min(90.0, max(10.0, rng.gauss(45.0, 10.0))) for _ in range(devices)]
+        self.base_press = [rng.gauss(1013.0, 6.0) - rng.uniform(0, 120) for _ in range(devices)]
+        self.base_tvoc = [rng.lognormvariate(4.0, 0.5) for _ in range(devices)]
+        self.base_eco2 = [rng.gauss(480.0, 40.0) for _ in range(devices)]
+        self.phase = [rng.uniform(0, 2 * math.pi) for _ in range(devices)]
+        self.drift = [0.0] * devices            # slow random walk (sensor drift / weather)
+        self.event_eco2 = [0.0] * devices       # pollution event excess, decays
+        self.event_tvoc = [0.0] * devices
+        self.last_t = [None] * devices
+        self.frame = [0] * devices
+        self.event_rate = event_rate_per_hour / 3600.0
+
+    def step(self, i: int, now: float) -> dict:
+        rng = self.rng
+        dt = 5.0 if self.last_t[i] is None else max(0.0, now - self.last_t[i])
+        self.last_t[i] = now
+        self.frame[i] += 1
+
+        self.drift[i] += rng.gauss(0.0, 0.02 * math.sqrt(dt))
+        decay = math.exp(-dt / 600.0)
+        self.event_eco2[i] *= decay
+        self.event_tvoc[i] *= decay
+        if rng.random() < self.event_rate * dt:
+            self.event_eco2[i] += rng.uniform(300, 1500)
+            self.event_tvoc[i] += rng.uniform(200, 1500)
+
+        daily = math.sin(2 * math.pi * (now % DAY) / DAY + self.phase[i])
+        return {
+            "temp_c": round(self.base_temp[i] + 3.0 * daily + self.drift[i] + rng.gauss(0, 0.1), 2),
+            "hum_rh": round(min(100.0, max(0.0, self.base_hum[i] - 8.0 * daily + rng.gauss(0, 0.5))), 2),
+            "pressure_hpa": round(self.base_press[i] + 2.0 * self.drift[i] + rng.gauss(0, 0.2), 2),
+            "tvoc_ppb": max(0, int(self.base_tvoc[i] * (1 + 0.3 * daily) + self.event_tvoc[i] + rng.gauss(0, 5))),
+            "eco2_ppm": max(400, int(self.base_eco2[i] + 60 * daily + self.event_eco2[i] + rng.gauss(0, 10))),
+            "rssi": int(rng.gauss(-70, 6)),
+            "snr": round(rng.gauss(8.0, 2.0), 1),
+        }
+
+    def http_reading(self, i: int, now: float) -> dict:
+        r = self.step(i, now)
+        r["device_id"] = self.ids[i]
+        r["ts"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now % 1 * 1e6):06d}+00:00"
+        return r
+
+    def gateway_reading(self, i: int, now: float) -> dict:
+        """Short-key JSON as the gateway publishes it"""
+        r = self.step(i, now)
+        return {
+            "id": self.ids[i], "ts_ms": int(now * 1000),
+            "t": int(r["temp_c"] * 10), "h": int(r["hum_rh"] * 10), "p": r["pressure_hpa"],
+            "v": r["tvoc_ppb"], "e": r["eco2_ppm"], "st": "NORMAL",
+            "fc": self.frame[i], "rssi": r["rssi"], "snr": r["snr"],
+        }
+
+    def gateway_payload(self, i: int, now: float) -> bytes:
+        return json.dumps(self.gateway_reading(i, now), separators=(",", ":")).encode()
+
+    def batch_payload(self, gateway: int, gateways: int, n: int, now: float) -> bytes:
+        """Batch envelope of n readings from nodes behind one gateway (node i sits behind i % gateways)"""
+        nodes = range(gateway, len(self.ids), gateways)
+        readings = [self.gateway_reading(self.rng.choice(nodes), now) for _ in range(n)]
+        return json.dumps({"gw": f"gw-{gateway:04d}", "readings": readings}, separators=(",", ":")).encode()
+
+    def frame_payload(self, i: int, now: float) -> bytes:
+        """One 24-byte binary frame (app/frames.py)"""
+        from app.frames import encode_frames
+        r = self.step(i, now)
+        r["ts"], r["frame_counter"] = int(now), self.frame[i]
+        return encode_frames([r])
+
+
+# =========================================================
+# STATS
+# =========================================================
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.readings = 0
+        self.completed = 0
+        self.completed_readings = 0
+        self.last_done: Optional[float] = None   # loop time of the last completion
+        self.missed = 0
+        self.errors: Counter = Counter()
+        self.status: Counter = Counter()
+        self.latency: list[float] = []      # from scheduled time
+        self.service: list[float] = []      # from actual send
+        self.server_receive_to_commit_ms: Optional[dict] = None   # mqtt + --metrics-url
+
+    def report(self, elapsed: float) -> dict:
+        """elapsed: length of the arrival window; throughput runs until the last answer"""
+        busy = max(elapsed, self.last_done or 0.0)
+        return {
+            "requests_sent": self.sent,
+            "readings_sent": self.readings,
+            "completed": self.completed,
+            "missed": self.missed,
+            "elapsed_s": round(elapsed, 2),
+            "offered_readings_per_s": round(self.readings / elapsed, 1) if elapsed else 0.0,
+            "throughput_readings_per_s": round(self.completed_readings / busy, 1) if busy else 0.0,
+            "status": dict(self.status),
+            "errors": dict(self.errors),
+            "latency_ms": percentiles(self.latency),
+            "service_ms": percentiles(self.service),
+        }
+
+
+def percentiles(values: list[float]) -> Optional[dict]:
+    if not values:
+        return None
+    v = sorted(values)
+
+    def q(p: float) -> float:
+        return round(v[min(len(v) - 1, int(p * len(v)))] * 1000.0, 2)
+
+    return {"p50": q(0.50), "p95": q(0.95), "p99": q(0.99), "max": round(v[-1] * 1000.0, 2)}
+
+
+# =========================================================
+# SERVER-SIDE HISTOGRAM (mqtt target)
+# =========================================================
+
+def scrape_histogram(url: str, name: str) -> dict[float, float]:
+    import httpx
+    return parse_histogram(httpx.get(url, timeout=10).text, name)
+
+
+def parse_histogram(text: str, name: str) -> dict[float, float]:
+    """Cumulative bucket counts {le: count} summed over label sets"""
+    buckets: dict[float, float] = {}
+    for line in text.splitlines():
+        if not line.startswith(name + "_bucket"):
+            continue
+        labels, value = line.rsplit(" ", 1)
+        le = labels.split('le="', 1)[1].split('"', 1)[0]
+        bound = math.inf if le == "+Inf" else float(le)
+        buckets[bound] = buckets.get(bound, 0.0) + float(value)
+    return buckets
+
+
+def histogram_quantiles(before: dict, after: dict) -> Optional[dict]:
+    bounds = sorted(after)
+    counts = [after[b] - before.get(b, 0.0) for b in bounds]
+    total = counts[-1] if counts else 0
+    if not total:
+        return None
+    out = {}
+    for label, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        rank, lower, prev = p * total, 0.0, 0.0
+        for bound, cum in zip(bounds, counts):
+            if cum >= rank:
+                if math.isinf(bound):
+                    out[label] = f">{lower * 1000.0:g}"
+                else:
+                    frac = (rank - prev) / (cum - prev) if cum > prev else 1.0
+                    out[label] = round((lower + (bound - lower) * frac) * 1000.0, 2)
+                break
+            lower, prev = bound, cum
+    out["count"] = int(total)
+    return out
+
+
+# =========================================================
+# DRIVERS
+# =========================================================
+
+async def open_loop(rate: float, duration: float, fire, seed: int, start: float) -> float:
+    """Call fire(scheduled_at) at Poisson arrivals from start; returns elapsed seconds"""
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed + 1)
+    end = start + duration
+    t = start
+    while True:
+        t += rng.expovariate(rate)
+        if t >= end:
+            break
+        delay = t - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await fire(t)
+    return loop.time() - start
+
+
+async def run_http(args, fleet: Fleet, stats: Stats) -> float:
+    import httpx
+
+    batch = args.batch if args.target == "http-batch" else 1
+    path = "/api/ingest/batch" if args.target == "http-batch" else "/api/ingest"
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    loop = asyncio.get_running_loop()
+    inflight: set[asyncio.Task] = set()
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout,
+                                 headers={"X-API-Key": args.api_key}) as client:
+        start = loop.time()
+
+        async def one(scheduled: float, body: dict, n: int) -> None:
+            sent_at = loop.time()
+            try:
+                r = await client.post(path, json=body)
+                stats.status[r.status_code] += 1
+            except Exception as e:
+                stats.errors[type(e).__name__] += 1
+                return
+            done = loop.time()
+            stats.completed += 1
+            if r.status_code == 200:
+                stats.completed_readings += n
+            stats.last_done = done - start
+            stats.latency.append(done - scheduled)
+            stats.service.append(done - sent_at)
+
+        async def fire(scheduled: float) -> None:
+            if len(inflight) >= args.max_inflight:
+                stats.missed += 1
+                return
+            now = time.time()
+            picks = [fleet.rng.randrange(len(fleet.ids)) for _ in range(batch)]
+            readings = [fleet.http_reading(i, now) for i in picks]
+            body = {"readings": readings} if args.target == "http-batch" else readings[0]
+            stats.sent += 1
+            stats.readings += batch
+            task = asyncio.create_task(one(scheduled, body, batch))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+
+        elapsed = await open_loop(args.rate / batch, args.duration, fire, args.seed, start)
+        if inflight:
+            await asyncio.wait(inflight, timeout=args.timeout)
+    return elapsed
+
+
+async def run_mqtt(args, fleet: Fleet, stats: Stats) -> float:
+    from app.config import settings
+    from benchmarks.mini_broker import MiniBroker, MiniPublisher
+
+    broker = None
+    if args.broker_standin:
+        broker = MiniBroker("127.0.0.1", args.port)
+        await broker.start()
+        deadline = time.monotonic() + args.wait_subscriber
+        while broker.subscribers() == 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        if broker.subscribers() == 0:
+            print(f"⚠️ no subscriber on 127.0.0.1:{broker.port}; publishing anyway", file=sys.stderr)
+
+    before = scrape_histogram(args.metrics_url, "aq_ingest_receive_to_commit_seconds") if args.metrics_url else {}
+    pub = MiniPublisher(args.host, broker.port if broker else args.port)
+    await pub.connect()
+    loop = asyncio.get_running_loop()
+    prefix = settings.MQTT_TOPIC_PREFIX
+
+    binary = args.payload == "binary"
+    suffix = settings.MQTT_BINARY_SUFFIX if binary else "data"
+    batched = args.payload == "batch"
+    batch = args.batch if batched else 1
+    gateways = max(1, len(fleet.ids) // max(1, args.batch))
+
+    async def fire(scheduled: float) -> None:
+        now = time.time()
+        if batched:
+            g = fleet.rng.randrange(gateways)
+            pub.publish(f"{prefix}gw-{g:04d}/{settings.MQTT_BATCH_SUFFIX}", fleet.batch_payload(g, gateways, batch, now))
+        else:
+            i = fleet.rng.randrange(len(fleet.ids))
+            payload = fleet.frame_payload(i, now) if binary else fleet.gateway_payload(i, now)
+            pub.publish(f"{prefix}{fleet.ids[i]}/{suffix}", payload)
+        stats.sent += 1
+        stats.readings += batch
+        stats.completed += 1
+        stats.completed_readings += batch
+        if stats.sent % 256 == 0:
+            await pub.drain()
+        stats.latency.append(loop.time() - scheduled)
+
+    elapsed = await open_loop(args.rate / batch, args.duration, fire, args.seed, loop.time())
+    await pub.drain()
+    await pub.close()
+
+    server = None
+    if args.metrics_url:
+        await asyncio.sleep(args.settle)   # let the writer commit what is queued
+        server = histogram_quantiles(before, scrape_histogram(args.metrics_url, "aq_ingest_receive_to_commit_seconds"))
+    if broker is not None:
+        stats.errors["not_forwarded"] = broker.received - broker.forwarded
+        await broker.close()
+    stats.server_receive_to_commit_ms = server
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("http", "http-batch", "mqtt"), default="http")
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--rate", type=float, default=500.0, help="offered readings/s")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--events-per-hour", type=float, default=0.5, help="pollution events per node-hour")
+    # http
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", "know-the-air-you-breaathe-in"))
+    parser.add_argument("--batch", type=int, default=100, help="http-batch: readings per request; mqtt --payload batch: per envelope")
+    parser.add_argument("--connections", type=int, default=64, help="keep-alive pool size")
+    parser.add_argument("--max-inflight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    # mqtt
+    parser.add_argument("--host", default="127.0.0.1", help="broker host (without --broker-standin)")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--broker-standin", action="store_true", help="run benchmarks.mini_broker in-process")
+    parser.add_argument("--payload", choices=("json", "binary", "batch"), default="json", help="mqtt: payload format")
+    parser.add_argument("--wait-subscriber", type=float, default=15.0, help="seconds to wait for the backend")
+    parser.add_argument("--metrics-url", default="", help="backend /metrics for receive-to-commit latency")
+    parser.add_argument("--settle", type=float, default=3.0)
+    args = parser.parse_args()
+
+    fleet = Fleet(args.devices, args.seed, args.events_per_hour)
+    stats = Stats()
+    runner = run_mqtt if args.target == "mqtt" else run_http
+    elapsed = asyncio.run(runner(args, fleet, stats))
+
+    result = {
+        "target": args.target, "devices": args.devices, "offered_rate": args.rate,
+        "duration_s": args.duration, **stats.report(elapsed),
+    }
+    if args.target == "mqtt":
+        result["latency_ms_note"] = "client-side publish only"
+        result["server_receive_to_commit_ms"] = stats.server_receive_to_commit_ms
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
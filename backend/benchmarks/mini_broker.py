@@ -0,0 +1,255 @@
+"""
+Minimal in-process MQTT 3.1.1 broker for load tests and replays.
+
+Enough of the protocol for the backend's aiomqtt subscriber and the load
+tools: CONNECT, SUBSCRIBE / UNSUBSCRIBE with + and # wildcards, PUBLISH at
+QoS 0 and 1 (PUBACK to the publisher), PINGREQ, DISCONNECT. Not a real
+broker: no retained messages, no wills, no authentication, and QoS 1
+messages are not redelivered to subscribers (their PUBACKs are ignored).
+Forwarding awaits each subscriber's socket buffer, so a slow consumer
+pushes back on publishers instead of growing memory.
+
+Standalone (from backend/):
+    python -m benchmarks.mini_broker --port 1883
+    MQTT_BROKER=127.0.0.1 MQTT_PORT=1883 python -m app.ingest
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import struct
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+# =========================================================
+# WIRE FORMAT
+# =========================================================
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _str(s: str) -> bytes:
+    b = s.encode()
+    return struct.pack("!H", len(b)) + b
+
+
+def packet(kind: int, flags: int, body: bytes) -> bytes:
+    return bytes([(kind << 4) | flags]) + _varint(len(body)) + body
+
+
+def encode_publish(topic: str, payload: bytes, qos: int = 0, packet_id: int = 0) -> bytes:
+    body = _str(topic) + (struct.pack("!H", packet_id) if qos else b"") + payload
+    return packet(PUBLISH, qos << 1, body)
+
+
+def encode_connect(client_id: str, keepalive: int = 60, clean_session: bool = True) -> bytes:
+    flags = 0x02 if clean_session else 0x00
+    return packet(CONNECT, 0, _str("MQTT") + bytes([4, flags]) + struct.pack("!H", keepalive) + _str(client_id))
+
+
+async def read_packet(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    first = await reader.readexactly(1)
+    length, shift = 0, 0
+    while True:
+        b = (await reader.readexactly(1))[0]
+        length += (b & 0x7F) << shift
+        if not b & 0x80:
+            break
+        shift += 7
+    body = await reader.readexactly(length) if length else b""
+    return first[0] >> 4, first[0] & 0x0F, body
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    p, t = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+# =========================================================
+# BROKER
+# =========================================================
+
+class _Session:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.client_id = ""
+        self.subscriptions: dict[str, int] = {}   # filter -> granted qos
+        self._next_id = 0
+
+    def packet_id(self) -> int:
+        self._next_id = self._next_id % 65535 + 1
+        return self._next_id
+
+
+class MiniBroker:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.sessions: set[_Session] = set()
+        self.received = 0
+        self.forwarded = 0
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self) -> int:
+        """Listen; returns the bound port (port=0 picks a free one)"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"📡 Mini broker on {self.host}:{self.port}")
+        return self.port
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Closing the sockets ends each handler's read loop cleanly
+            for session in list(self.sessions):
+                session.writer.close()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._server.wait_closed()
+
+    def subscribers(self) -> int:
+        return sum(1 for s in self.sessions if s.subscriptions)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = _Session(writer)
+        self.sessions.add(session)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            while True:
+                kind, flags, body = await read_packet(reader)
+                if kind == CONNECT:
+                    (plen,) = struct.unpack_from("!H", body)
+                    pos = 2 + plen + 4   # protocol name, level, flags, keepalive
+                    (clen,) = struct.unpack_from("!H", body, pos)
+                    session.client_id = body[pos + 2:pos + 2 + clen].decode(errors="replace")
+                    writer.write(packet(CONNACK, 0, b"\x00\x00"))
+                elif kind == PUBLISH:
+                    await self._on_publish(flags, body, writer)
+                elif kind == SUBSCRIBE:
+                    (pid,) = struct.unpack_from("!H", body)
+                    pos, granted = 2, bytearray()
+                    while pos < len(body):
+                        (tlen,) = struct.unpack_from("!H", body, pos)
+                        topic = body[pos + 2:pos + 2 + tlen].decode()
+                        qos = min(body[pos + 2 + tlen], 1)
+                        session.subscriptions[topic] = qos
+                        granted.append(qos)
+                        pos += 3 + tlen
+                    writer.write(packet(SUBACK, 0, struct.pack("!H", pid) + bytes(granted)))
+                elif kind == UNSUBSCRIBE:
+                    (pid,) = struct.unpack_from("!H", body)
+                    pos = 2
+                    while pos < len(body):
+                        (tlen,) = struct.unpack_from("!H", body, pos)
+                        session.subscriptions.pop(body[pos + 2:pos + 2 + tlen].decode(), None)
+                        pos += 2 + tlen
+                    writer.write(packet(UNSUBACK, 0, struct.pack("!H", pid)))
+                elif kind == PINGREQ:
+                    writer.write(packet(PINGRESP, 0, b""))
+                elif kind == DISCONNECT:
+                    break
+                # PUBACK from subscribers: nothing to do (no redelivery)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            self._tasks.discard(task)
+            writer.close()
+
+    async def _on_publish(self, flags: int, body: bytes, publisher: asyncio.StreamWriter) -> None:
+        qos = (flags >> 1) & 0x03
+        (tlen,) = struct.unpack_from("!H", body)
+        topic = body[2:2 + tlen].decode(errors="replace")
+        pos = 2 + tlen
+        if qos:
+            (pid,) = struct.unpack_from("!H", body, pos)
+            pos += 2
+            publisher.write(packet(PUBACK, 0, struct.pack("!H", pid)))
+        payload = body[pos:]
+        self.received += 1
+
+        for s in list(self.sessions):
+            granted = max((q for f, q in s.subscriptions.items() if topic_matches(f, topic)), default=None)
+            if granted is None:
+                continue
+            out_qos = min(qos, granted)
+            s.writer.write(encode_publish(topic, payload, out_qos, s.packet_id() if out_qos else 0))
+            self.forwarded += 1
+            try:
+                await s.writer.drain()
+            except ConnectionError:
+                self.sessions.discard(s)
+
+
+# =========================================================
+# PUBLISHER
+# =========================================================
+
+class MiniPublisher:
+    """Bare QoS 0 publisher: one write per message, no acks to wait for"""
+
+    def __init__(self, host: str, port: int, client_id: str = "loadgen"):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(encode_connect(self.client_id))
+        kind, _, body = await read_packet(self._reader)
+        if kind != CONNACK or body[1:2] != b"\x00":
+            raise ConnectionError(f"MQTT connect refused ({body!r})")
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        self._writer.write(encode_publish(topic, payload))
+
+    async def drain(self) -> None:
+        await self._writer.drain()
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.write(packet(DISCONNECT, 0, b""))
+            await self._writer.drain()
+            self._writer.close()
+
+
+async def _serve(host: str, port: int) -> None:
+    broker = MiniBroker(host, port)
+    await broker.start()
+    while True:
+        await asyncio.sleep(10)
+        logger.info(f"📊 received={broker.received} forwarded={broker.forwarded} sessions={len(broker.sessions)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal MQTT 3.1.1 broker for local load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(_serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,454 @@
+"""
+MQTT traffic recorder and time-scaled replayer.
+
+record   subscribe to the gateway topics (JSON /data, binary /bin, batch) and
+         write every message (topic, payload bytes, arrival time) to a
+         tape file
+replay   re-inject a tape at its recorded pace (--speed 1), N times faster
+         (--speed N) or as fast as possible (--speed 0), either
+           --target direct   into MQTTSubscriber.process_message in this
+                             process, writing to a fresh --db
+           --target broker   over MQTT to a broker (or --broker-standin) that
+                             a running backend is subscribed to
+         then report throughput, receive-to-commit latency and, with
+         --compare-db, whether the stored rows match the original run
+info     header and message / topic counts of a tape
+
+Tape format (".gz" suffix = gzip):
+    b"AQTAPE1\\n" <u32 header length> header JSON
+    records: <u64 offset us><u16 topic id><u32 payload length>
+             [<u16 length> topic, when topic id = 0xFFFF: next new id]
+             payload
+A truncated last record (recorder killed mid-write) is ignored.
+
+Usage (from backend/):
+    python -m benchmarks.mqtt_tape record --host broker.local --out prod.aqt.gz --duration 600
+    python -m benchmarks.mqtt_tape replay prod.aqt.gz --speed 10 --db /tmp/replay.db \\
+        --compare-db data/air_quality.db
+    python -m benchmarks.mqtt_tape replay prod.aqt.gz --target broker --broker-standin --port 1883 \\
+        --speed 0 --metrics-url http://127.0.0.1:8000/metrics
+
+Row comparison ignores ids and timestamps (server time for payloads
+without ts_ms): it matches (device, frame counter, sensor values, status)
+of the tape's devices. The original side is limited to the recording
+window; the replay side takes every row, so for --target broker start the
+backend on an empty DB_PATH and pass it as --backend-db. If the backend
+has per-device rate limits on (INGEST_DEVICE_RATE), fast replays are cut:
+leave it at 0 for replays.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import signal
+import socket
+import sqlite3
+import struct
+import sys
+import time
+from collections import Counter
+from typing import Iterator, Optional
+
+MAGIC = b"AQTAPE1\n"
+_RECORD = struct.Struct("<QHI")
+_LEN16 = struct.Struct("<H")
+_LEN32 = struct.Struct("<I")
+NEW_TOPIC = 0xFFFF
+
+
+# =========================================================
+# TAPE FILE
+# =========================================================
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode, compresslevel=6) if path.endswith(".gz") else open(path, mode)
+
+
+class TapeWriter:
+    def __init__(self, path: str, header: dict):
+        self._fh = _open(path, "wb")
+        body = json.dumps(header).encode()
+        self._fh.write(MAGIC + _LEN32.pack(len(body)) + body)
+        self._topics: dict[str, int] = {}
+        self.messages = 0
+        self.bytes = 0
+
+    def write(self, offset_seconds: float, topic: str, payload: bytes) -> None:
+        topic_id = self._topics.get(topic)
+        if topic_id is None:
+            self._topics[topic] = len(self._topics)
+            raw = topic.encode()
+            self._fh.write(_RECORD.pack(int(offset_seconds * 1e6), NEW_TOPIC, len(payload)) + _LEN16.pack(len(raw)) + raw)
+        else:
+            self._fh.write(_RECORD.pack(int(offset_seconds * 1e6), topic_id, len(payload)))
+        self._fh.write(payload)
+        self.messages += 1
+        self.bytes += len(payload)
+
+    def flush(self) -> None:
+        self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def read_tape(path: str) -> tuple[dict, Iterator[tuple[float, str, bytes]]]:
+    """(header, iterator of (offset seconds, topic, payload))"""
+    fh = _open(path, "rb")
+    if fh.read(len(MAGIC)) != MAGIC:
+        fh.close()
+        raise ValueError(f"{path}: not a tape file")
+    (hlen,) = _LEN32.unpack(fh.read(_LEN32.size))
+    header = json.loads(fh.read(hlen))
+
+    def records() -> Iterator[tuple[float, str, bytes]]:
+        topics: list[str] = []
+        try:
+            while True:
+                head = fh.read(_RECORD.size)
+                if len(head) < _RECORD.size:
+                    return
+                offset_us, topic_id, plen = _RECORD.unpack(head)
+                if topic_id == NEW_TOPIC:
+                    raw = fh.read(_LEN16.size)
+                    if len(raw) < _LEN16.size:
+                        return
+                    topic = fh.read(_LEN16.unpack(raw)[0])
+                    topics.append(topic.decode(errors="replace"))
+                    topic_id = len(topics) - 1
+                payload = fh.read(plen)
+                if len(payload) < plen:
+                    return   # torn tail
+                yield offset_us / 1e6, topics[topic_id], payload
+        except EOFError:
+            return   # truncated gzip stream
+        finally:
+            fh.close()
+
+    return header, records()
+
+
+# =========================================================
+# RECORD
+# =========================================================
+
+async def record(args) -> dict:
+    import aiomqtt  # type: ignore
+    from app.config import settings
+
+    topics = args.topic or [
+        f"{settings.MQTT_TOPIC_PREFIX}+/{suffix}"
+        for suffix in ("data", settings.MQTT_BINARY_SUFFIX, settings.MQTT_BATCH_SUFFIX)
+    ]
+    header = {
+        "recorded_at": time.time(), "broker": f"{args.host}:{args.port}", "topics": topics,
+        "topic_prefix": settings.MQTT_TOPIC_PREFIX, "host": socket.gethostname(),
+    }
+    tape = TapeWriter(args.out, header)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    t0 = time.monotonic()
+    last_flush = t0
+
+    async def consume(client) -> None:
+        nonlocal last_flush
+        async for message in client.messages:
+            now = time.monotonic()
+            tape.write(now - t0, message.topic.value, bytes(message.payload))
+            if now - last_flush > 1.0:
+                tape.flush()
+                last_flush = now
+            if args.count and tape.messages >= args.count:
+                stop.set()
+                return
+
+    try:
+        async with aiomqtt.Client(hostname=args.host, port=args.port, identifier=f"aq-recorder-{os.getpid()}") as client:
+            for topic in topics:
+                await client.subscribe(topic, qos=args.qos)
+            print(f"⏺️  Recording {', '.join(topics)} from {args.host}:{args.port} -> {args.out}", file=sys.stderr)
+            task = asyncio.create_task(consume(client))
+            waiters = [asyncio.create_task(stop.wait())]
+            if args.duration:
+                waiters.append(asyncio.create_task(asyncio.sleep(args.duration)))
+            await asyncio.wait([task, *waiters], return_when=asyncio.FIRST_COMPLETED)
+            for t in (task, *waiters):
+                t.cancel()
+    finally:
+        tape.close()
+    elapsed = time.monotonic() - t0
+    return {"out": args.out, "messages": tape.messages, "payload_bytes": tape.bytes,
+            "file_bytes": os.path.getsize(args.out), "seconds": round(elapsed, 1),
+            "messages_per_s": round(tape.messages / elapsed, 1) if elapsed else 0.0}
+
+
+# =========================================================
+# REPLAY
+# =========================================================
+
+async def _paced(records, speed: float, lags: list[float]):
+    """Yield records at offset / speed from now (speed 0: no waiting)"""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for offset, topic, payload in records:
+        if speed > 0:
+            due = start + offset / speed
+            delay = due - loop.time()
+            if delay > 0.0005:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, loop.time() - due))
+        yield topic, payload
+
+
+async def replay_direct(args, header: dict, records) -> dict:
+    """process_message in this process; rows go to a fresh --db"""
+    import aiomqtt  # type: ignore
+    from app.admission import SHED, admission
+    from app.batch_writer import batch_writer
+    from app.database import Base, engine
+    from app.config import settings
+    from app.frames import FRAME_SIZE
+    from app.metrics import registry
+    from app.mqtt_client import MQTTSubscriber, is_batch_topic
+    from benchmarks.loadgen import histogram_quantiles, parse_histogram
+    from benchmarks.mini_broker import topic_matches
+
+    Base.metadata.create_all(bind=engine)
+    subscriber = MQTTSubscriber(writer=batch_writer)
+    batch_writer.start()
+    before = parse_histogram(registry.render(), "aq_ingest_receive_to_commit_seconds")
+    lags: list[float] = []
+    sent, skipped = 0, 0
+    t0 = time.perf_counter()
+    async for topic, payload in _paced(records, args.speed, lags):
+        if not any(topic_matches(t, topic) for t in subscriber.topics):
+            skipped += 1
+            continue
+        if args.speed == 0:
+            # Flat out measures the pipeline, so wait for the writer instead of tripping load shedding
+            if is_batch_topic(topic):
+                room = settings.MQTT_BATCH_MAX_READINGS
+            elif topic.endswith("/" + settings.MQTT_BINARY_SUFFIX):
+                room = len(payload) // FRAME_SIZE
+            else:
+                room = 1
+            while admission.should_shed(batch_writer.depth() + room - 1, batch_writer.queue_size):
+                await asyncio.sleep(0.001)
+        await subscriber.process_message(aiomqtt.Message(topic, payload, 0, False, 0, None))
+        sent += 1
+    injected = time.perf_counter() - t0
+    await batch_writer.close()
+    elapsed = time.perf_counter() - t0
+    engine.dispose()
+    return {
+        "messages": sent, "skipped_topics": skipped, "dropped": subscriber.dropped,
+        "shed": sum(n for (_, decision), n in admission.counters.items() if decision == SHED),
+        "written": batch_writer.written, "failed": batch_writer.failed,
+        "inject_seconds": round(injected, 3), "elapsed_s": round(elapsed, 3),
+        "throughput_msgs_per_s": round(sent / elapsed, 1) if elapsed else 0.0,
+        "receive_to_commit_ms": histogram_quantiles(before, parse_histogram(registry.render(), "aq_ingest_receive_to_commit_seconds")),
+        "schedule_lag_ms": _percentiles(lags),
+    }
+
+
+async def replay_broker(args, header: dict, records) -> dict:
+    """Publish to a broker; the backend under test consumes it"""
+    from benchmarks.loadgen import histogram_quantiles, parse_histogram, scrape_histogram
+    from benchmarks.mini_broker import MiniBroker, MiniPublisher
+
+    broker = None
+    if args.broker_standin:
+        broker = MiniBroker("127.0.0.1", args.port)
+        await broker.start()
+        deadline = time.monotonic() + args.wait_subscriber
+        while broker.subscribers() == 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        if broker.subscribers() == 0:
+            print(f"⚠️ no subscriber on 127.0.0.1:{broker.port}; publishing anyway", file=sys.stderr)
+
+    def written() -> Optional[float]:
+        import httpx
+        for line in httpx.get(args.metrics_url, timeout=10).text.splitlines():
+            if line.startswith('aq_ingest_writer_rows_total{outcome="written"} '):
+                return float(line.split()[1])
+        return None
+
+    before = scrape_histogram(args.metrics_url, "aq_ingest_receive_to_commit_seconds") if args.metrics_url else {}
+    rows_before = written() if args.metrics_url else None
+    pub = MiniPublisher(args.host, broker.port if broker else args.port, client_id=f"aq-replay-{os.getpid()}")
+    await pub.connect()
+    lags: list[float] = []
+    sent = 0
+    t0 = time.perf_counter()
+    async for topic, payload in _paced(records, args.speed, lags):
+        pub.publish(topic, payload)
+        sent += 1
+        if sent % 256 == 0:
+            await pub.drain()
+    await pub.drain()
+    injected = time.perf_counter() - t0
+
+    # Done when the writer's row counter stops moving (or reaches what was sent)
+    elapsed, rows = injected, None
+    if rows_before is not None:
+        last, still = written(), time.monotonic()
+        while time.monotonic() - still < args.settle and (last or 0) - rows_before < sent:
+            await asyncio.sleep(0.1)
+            now = written()
+            if now != last:
+                last, still = now, time.monotonic()
+                elapsed = time.perf_counter() - t0
+        rows = int((last or 0) - rows_before)
+    await pub.close()
+    server = None
+    if args.metrics_url:
+        server = histogram_quantiles(before, parse_histogram(
+            __import__("httpx").get(args.metrics_url, timeout=10).text, "aq_ingest_receive_to_commit_seconds"))
+    result = {
+        "messages": sent, "written": rows,
+        "inject_seconds": round(injected, 3), "elapsed_s": round(elapsed, 3),
+        "throughput_msgs_per_s": round((rows if rows is not None else sent) / elapsed, 1) if elapsed else 0.0,
+        "receive_to_commit_ms": server, "schedule_lag_ms": _percentiles(lags),
+    }
+    if broker is not None:
+        result["not_forwarded"] = broker.received - broker.forwarded
+        await broker.close()
+    return result
+
+
+def _percentiles(values: list[float]) -> Optional[dict]:
+    from benchmarks.loadgen import percentiles
+    return percentiles(values)
+
+
+# =========================================================
+# DB COMPARISON
+# =========================================================
+
+_FINGERPRINT = "device_id, frame_counter, temp_c, hum_rh, pressure_hpa, tvoc_ppb, eco2_ppm, rssi, snr, status, alert"
+
+
+def fingerprint(path: str, devices: set[str], since: Optional[float] = None, until: Optional[float] = None) -> Counter:
+    """Multiset of comparable rows for `devices`, optionally within [since, until] (epoch seconds)"""
+    from datetime import datetime, timezone
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        sql = f"SELECT {_FINGERPRINT} FROM measurements WHERE device_id = ?"
+        params: list = []
+        if since is not None:
+            sql += " AND ts >= ? AND ts <= ?"
+            params = [datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") for t in (since, until)]
+        out: Counter = Counter()
+        for device in sorted(devices):
+            out.update(con.execute(sql, [device, *params]))
+        return out
+    finally:
+        con.close()
+
+
+def compare(tape: str, replay_db: str, original_db: str, slack: float) -> dict:
+    from app.mqtt_client import decode_batch, is_batch_topic
+    header, records = read_tape(tape)
+    devices, last = set(), 0.0
+    prefix = header.get("topic_prefix", "")
+    for offset, topic, payload in records:
+        last = offset
+        if is_batch_topic(topic):
+            # Batch topics carry the gateway id; every reading in the envelope names its node
+            try:
+                devices.update(m.device_id for m in decode_batch(payload))
+            except ValueError:   # malformed envelope: the replay dropped it too
+                pass
+        elif topic.startswith(prefix):
+            devices.add(topic[len(prefix):].rpartition("/")[0])
+    start = header["recorded_at"]
+    original = fingerprint(original_db, devices, start - slack, start + last + slack)
+    replayed = fingerprint(replay_db, devices)
+    missing = original - replayed
+    extra = replayed - original
+    return {
+        "original_rows": sum(original.values()), "replayed_rows": sum(replayed.values()),
+        "missing": sum(missing.values()), "extra": sum(extra.values()),
+        "match": not missing and not extra,
+        "examples": {"missing": [list(r) for r in list(missing)[:3]], "extra": [list(r) for r in list(extra)[:3]]},
+    }
+
+
+# =========================================================
+# CLI
+# =========================================================
+
+def info(path: str) -> dict:
+    header, records = read_tape(path)
+    n, size, last, topics = 0, 0, 0.0, Counter()
+    for offset, topic, payload in records:
+        n += 1
+        size += len(payload)
+        last = offset
+        topics[topic] += 1
+    return {"header": header, "messages": n, "payload_bytes": size, "file_bytes": os.path.getsize(path),
+            "seconds": round(last, 3), "topics": len(topics), "busiest": dict(topics.most_common(5))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record")
+    rec.add_argument("--host", default=os.environ.get("MQTT_BROKER", "localhost"))
+    rec.add_argument("--port", type=int, default=int(os.environ.get("MQTT_PORT", 1883)))
+    rec.add_argument("--topic", action="append", help="filter (repeatable; default <prefix>+/data, +/bin, +/batch)")
+    rec.add_argument("--qos", type=int, default=0, choices=(0, 1))
+    rec.add_argument("--out", required=True)
+    rec.add_argument("--duration", type=float, default=0.0, help="seconds (0 = until Ctrl-C)")
+    rec.add_argument("--count", type=int, default=0, help="stop after N messages")
+
+    rep = sub.add_parser("replay")
+    rep.add_argument("tape")
+    rep.add_argument("--target", choices=("direct", "broker"), default="direct")
+    rep.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, N = N times faster, 0 = flat out")
+    rep.add_argument("--db", default="/tmp/aq-replay.db", help="direct: fresh database to write (replaced)")
+    rep.add_argument("--host", default="127.0.0.1")
+    rep.add_argument("--port", type=int, default=1883)
+    rep.add_argument("--broker-standin", action="store_true")
+    rep.add_argument("--wait-subscriber", type=float, default=15.0)
+    rep.add_argument("--metrics-url", default="", help="broker: backend /metrics (latency, completion)")
+    rep.add_argument("--settle", type=float, default=3.0, help="broker: seconds without progress = done")
+    rep.add_argument("--compare-db", help="database of the original run")
+    rep.add_argument("--backend-db", help="broker: the backend's database, started empty (for --compare-db)")
+    rep.add_argument("--slack", type=float, default=5.0, help="seconds around the recording window")
+
+    inf = sub.add_parser("info")
+    inf.add_argument("tape")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        result = info(args.tape)
+    elif args.command == "record":
+        result = asyncio.run(record(args))
+    else:
+        import logging
+        if args.target == "direct":
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(args.db + suffix):
+                    os.remove(args.db + suffix)
+            os.environ["DB_PATH"] = args.db   # before the app creates its engine
+            os.environ.setdefault("INGEST_DEVICE_RATE", "0")
+        logging.basicConfig(level=logging.WARNING)
+        header, records = read_tape(args.tape)
+        runner = replay_direct if args.target == "direct" else replay_broker
+        result = {"tape": args.tape, "target": args.target, "speed": args.speed,
+                  **asyncio.run(runner(args, header, records))}
+        replay_db = args.db if args.target == "direct" else args.backend_db
+        if args.compare_db and replay_db:
+            result["db_compare"] = compare(args.tape, replay_db, args.compare_db, args.slack)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
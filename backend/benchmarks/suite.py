@@ -0,0 +1,277 @@
+"""
+Backend hot-path benchmark suite at realistic data sizes.
+
+Seeds (and caches) a SQLite database for a profile, then times:
+
+    ingest_single    crud.create_measurement (alert evaluation + commit)
+    ingest_batch     crud.create_measurements, 100 readings per call
+    alert_eval       alerts.evaluate_alert for a random device
+    history          GET /api/history, last 24 h of one device
+    map_points       GET /api/map/points (all devices)
+    alert_history    GET /api/alerts/history?hours=168
+
+Every SELECT a case runs on `measurements` is re-run under EXPLAIN QUERY
+PLAN. A full scan (including a covering-index scan), a temp B-tree sort, or
+a device lookup that does not use ix_device_ts fails the suite, so an index
+regression shows up here and not in production.
+
+Profiles (rows / devices):
+    small    10k / 10
+    medium   1M / 1k
+    large    50M / 10k     (seeding takes a while; cached in --data-dir)
+
+Usage (from backend/):
+    python -m benchmarks.suite                           # small
+    python -m benchmarks.suite --profile medium
+    python -m benchmarks.suite --profile medium --compare benchmarks/results/medium-<sha>.json
+
+Results go to benchmarks/results/<profile>-<git sha>.json. --compare
+prints the ratio per case and exits 1 when a case got slower than
+--max-regression (default 1.25x) at p50. Exit 1 as well on a plan failure.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+PROFILES = {
+    "small": (10_000, 10),
+    "medium": (1_000_000, 1_000),
+    "large": (50_000_000, 10_000),
+}
+
+DEVICE_TS_INDEX = "ix_device_ts"
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# =========================================================
+# SEEDING
+# =========================================================
+
+def seed(path: str, rows: int, devices: int, seed_value: int = 42) -> None:
+    """`init_db.seed_dataset` into a fresh file, one reading per device per minute"""
+    from sqlalchemy import create_engine
+    from app.database import Base
+    from init_db import seed_dataset
+
+    # Built under a temporary name so an interrupted seed is never reused
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".seeding"
+    for p in (tmp, path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(p + suffix):
+                os.remove(p + suffix)
+    tmp_engine = create_engine(f"sqlite:///{tmp}")
+    Base.metadata.create_all(bind=tmp_engine)
+    tmp_engine.dispose()
+
+    con = sqlite3.connect(tmp)
+    con.execute("PRAGMA journal_mode=OFF")
+    con.execute("PRAGMA synchronous=OFF")
+    seed_dataset(con, devices, max(1, rows // devices), seed=seed_value, prefix="bench")
+    con.execute("PRAGMA journal_mode=WAL")
+    con.close()
+    os.replace(tmp, path)
+
+
+# =========================================================
+# TIMING / PLANS
+# =========================================================
+
+class StatementLog:
+    """Statements the engine ran on `measurements` while active"""
+
+    def __init__(self):
+        self.active = False
+        self.seen: dict[str, tuple] = {}
+
+    def __call__(self, _conn, _cursor, statement, parameters, _context, executemany) -> None:
+        if self.active and not executemany and "measurements" in statement and statement.lstrip().upper().startswith("SELECT"):
+            self.seen.setdefault(statement, tuple(parameters) if isinstance(parameters, (list, tuple)) else parameters)
+
+
+def plan_problems(path: str, statements: dict[str, tuple]) -> list[dict]:
+    """Full scans and sorts on `measurements`, and device lookups that miss (device_id, ts)"""
+    con = sqlite3.connect(path)
+    bad = []
+    try:
+        for sql, params in statements.items():
+            plan = [row[-1] for row in con.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            problems = [p for p in plan if p.startswith("SCAN measurements") or "TEMP B-TREE" in p]
+            if "measurements.device_id = " in sql and not any(DEVICE_TS_INDEX in p for p in plan):
+                problems.append(f"{DEVICE_TS_INDEX} not used")
+            if problems:
+                bad.append({"statement": " ".join(sql.split())[:300], "plan": plan, "problems": problems})
+    finally:
+        con.close()
+    return bad
+
+
+def timed(fn, repeat: int) -> dict:
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    return {
+        "n": repeat,
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def run_cases(path: str, repeat: int) -> tuple[dict, dict]:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app import crud
+    from app.alerts import evaluate_alert
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.schemas import IngestPayload
+
+    log = StatementLog()
+    event.listen(engine, "before_cursor_execute", log)
+    rng = random.Random(7)
+
+    def reading() -> IngestPayload:
+        return IngestPayload(device_id=rng.choice(device_ids), tvoc_ppb=rng.randint(20, 400),
+                             eco2_ppm=rng.randint(420, 1500), temp_c=21.5, hum_rh=40.0)
+
+    con = sqlite3.connect(path)
+    (max_id,) = con.execute("SELECT COALESCE(MAX(id), 0) FROM measurements").fetchone()
+    device_ids = [d for (d,) in con.execute("SELECT device_id FROM devices ORDER BY id")]
+    con.close()
+
+    results, plans = {}, {}
+    with TestClient(app) as client:
+        db = SessionLocal()
+        cases = {
+            "ingest_single": (lambda: crud.create_measurement(db, reading()), repeat),
+            "ingest_batch": (lambda: crud.create_measurements(db, [reading() for _ in range(100)]), max(3, repeat // 10)),
+            "alert_eval": (lambda: evaluate_alert(db, rng.choice(device_ids), datetime.now(timezone.utc), 100, 800), repeat),
+            "history": (lambda: client.get("/api/history", params={
+                "device_id": rng.choice(device_ids),
+                "start": (datetime.utcnow() - timedelta(hours=24)).isoformat(), "limit": 5000}), repeat),
+            "map_points": (lambda: client.get("/api/map/points"), max(3, repeat // 5)),
+            "alert_history": (lambda: client.get("/api/alerts/history", params={
+                "device_id": rng.choice(device_ids), "hours": 168, "limit": 1000}), repeat),
+        }
+        try:
+            for name, (fn, n) in cases.items():
+                log.seen = {}
+                log.active = True
+                results[name] = timed(fn, n)
+                log.active = False
+                plans[name] = plan_problems(path, log.seen)
+                print(f"  {name:14s} p50 {results[name]['p50_ms']:9.3f} ms   p95 {results[name]['p95_ms']:9.3f} ms"
+                      + ("   BAD PLAN" if plans[name] else ""), file=sys.stderr)
+        finally:
+            db.close()
+    event.remove(engine, "before_cursor_execute", log)
+    engine.dispose()
+
+    # Drop what the ingest cases wrote so the cached dataset stays identical between runs
+    con = sqlite3.connect(path)
+    con.execute("DELETE FROM measurements WHERE id > ?", (max_id,))
+    con.commit()
+    con.close()
+    return results, plans
+
+
+def git_sha() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, baseline_path: str, max_regression: float) -> list[str]:
+    with open(baseline_path) as fh:
+        old = json.load(fh)["cases"]
+    regressions = []
+    for name, r in current.items():
+        if name not in old or not old[name]["p50_ms"]:
+            continue
+        ratio = r["p50_ms"] / old[name]["p50_ms"]
+        flag = "  REGRESSION" if ratio > max_regression else ""
+        print(f"  {name:14s} {old[name]['p50_ms']:9.3f} -> {r['p50_ms']:9.3f} ms  x{ratio:.2f}{flag}", file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--rows", type=int, help="override the profile's row count")
+    parser.add_argument("--devices", type=int, help="override the profile's device count")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"))
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--out", help="result file (default benchmarks/results/<profile>-<sha>.json)")
+    parser.add_argument("--compare", help="earlier result file")
+    parser.add_argument("--max-regression", type=float, default=1.25)
+    args = parser.parse_args()
+
+    rows, devices = PROFILES[args.profile]
+    rows, devices = args.rows or rows, args.devices or devices
+    path = os.path.join(args.data_dir, f"{args.profile}-{rows}-{devices}-{args.seed}.db")
+
+    # Must be set before app modules create the engine
+    os.environ["DB_PATH"] = path
+    os.environ["API_READ_ONLY"] = "true"             # no MQTT subscriber; ingest cases call crud directly
+    os.environ.setdefault("MQTT_BROKER", "127.0.0.1")
+    os.environ.setdefault("INGEST_DEVICE_RATE", "0")
+    os.environ.setdefault("INGEST_KEY_RATE", "0")
+    os.environ.setdefault("MQTT_LOCK_DIR", args.data_dir)
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app").setLevel(logging.ERROR)
+
+    if args.reseed or not os.path.exists(path):
+        print(f"🌱 Seeding {rows:,} rows / {devices:,} devices -> {path}", file=sys.stderr)
+        t0 = time.perf_counter()
+        seed(path, rows, devices, args.seed)
+        print(f"   {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+    print(f"⏱️  {args.profile}: {rows:,} rows / {devices:,} devices", file=sys.stderr)
+    cases, plans = run_cases(path, args.repeat)
+
+    result = {
+        "profile": args.profile, "rows": rows, "devices": devices, "seed": args.seed,
+        "commit": git_sha(), "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(), "cpus": os.cpu_count(),
+        "cases": cases, "bad_plans": {k: v for k, v in plans.items() if v},
+    }
+    out = args.out or os.path.join(HERE, "results", f"{args.profile}-{result['commit']}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as fh:
+        json.dump(result, fh, indent=2)
+    print(f"💾 {out}", file=sys.stderr)
+
+    failed = False
+    if result["bad_plans"]:
+        failed = True
+        for name, bad in result["bad_plans"].items():
+            for b in bad:
+                print(f"❌ {name}: {'; '.join(b['problems'])}\n   {b['statement']}\n   {b['plan']}", file=sys.stderr)
+    if args.compare and compare(cases, args.compare, args.max_regression):
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
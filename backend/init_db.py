@@ -1,13 +1,18 @@
 """
 Initialize database and add sample devices
 Usage: python init_db.py
+       python init_db.py seed --devices 1000 --months 3 [--seed 42]
 """
 
+import argparse
+import sqlite3
 import sys
+import time
 from sqlalchemy.orm import Session
 from app.database import engine, SessionLocal
 from app.models import Base, Device
-from datetime import datetime, timezone
+from app.config import settings
+from datetime import datetime, timedelta, timezone
 
 
 def init_database():
@@ -191,6 +196,178 @@ def delete_all_devices():
         db.close()
 
 
+# =========================================================
+# SYNTHETIC DATASET (benchmarks / load tests)
+# =========================================================
+
+SEED_CITIES = [
+    # city, lat, lon, districts
+    ("Kayseri", 38.7225, 35.4875, ["Melikgazi", "Kocasinan", "Talas", "Hacilar", "Incesu"]),
+    ("Istanbul", 41.0082, 28.9784, ["Kadikoy", "Besiktas", "Sisli", "Uskudar", "Fatih", "Beyoglu"]),
+    ("Ankara", 39.9334, 32.8597, ["Cankaya", "Kecioren", "Yenimahalle", "Mamak", "Etimesgut"]),
+    ("Izmir", 38.4237, 27.1428, ["Karsiyaka", "Konak", "Bornova", "Buca"]),
+    ("Bursa", 40.1885, 29.0610, ["Osmangazi", "Nilufer", "Yildirim"]),
+]
+
+_MEASUREMENT_COLUMNS = (
+    "device_id", "ts", "temp_c", "hum_rh", "pressure_hpa", "tvoc_ppb", "eco2_ppm",
+    "rssi", "snr", "aq_score", "alert", "status", "frame_counter",
+)
+
+
+def seed_dataset(
+    con: sqlite3.Connection,
+    devices: int,
+    readings_per_device: int,
+    interval_seconds: int = 60,
+    seed: int = 42,
+    end: datetime | None = None,
+    prefix: str = "sim",
+    chunk_rows: int = 200_000,
+) -> int:
+    """
+    Bulk-load `devices` synthetic devices and `readings_per_device` readings
+    each, ending at `end` (default: now floored to the hour). Same arguments,
+    same rows. Measurement indexes are dropped during the load and rebuilt
+    afterwards. Returns the number of measurement rows written.
+
+    Readings: per-device baseline with slow drift, a daily cycle (traffic and
+    heating peaks) and short pollution episodes; status/alert/aq_score follow
+    the WARN/HIGH thresholds against the device baseline.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    end = end or datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    end = end.replace(tzinfo=None) if end.tzinfo is None else end.astimezone(timezone.utc).replace(tzinfo=None)
+    start = np.datetime64(end - timedelta(seconds=interval_seconds * readings_per_device), "us")
+
+    # ---------- devices ----------
+    city_idx = np.arange(devices) % len(SEED_CITIES)
+    device_ids = np.array([f"{prefix}-{i:05d}" for i in range(devices)], dtype=object)
+    dev_rows = []
+    for i in range(devices):
+        city, lat, lon, districts = SEED_CITIES[city_idx[i]]
+        district = districts[(i // len(SEED_CITIES)) % len(districts)]
+        dev_rows.append((device_ids[i], f"{city} {district} #{i}",
+                         round(lat + rng.normal(0, 0.04), 6), round(lon + rng.normal(0, 0.05), 6),
+                         city, district, end.isoformat(sep=" ")))
+    con.executemany(
+        "INSERT INTO devices (device_id, name, lat, lon, city, district, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        dev_rows,
+    )
+
+    # ---------- per-device parameters ----------
+    eco2_base = rng.normal(480, 40, devices).clip(400)
+    tvoc_base = rng.lognormal(4.2, 0.4, devices)
+    drift_per_day = rng.normal(0, 0.3, devices)              # sensor aging, ppm/day
+    temp_base = rng.normal(21, 2, devices)
+    rssi_base = rng.integers(-95, -50, devices)
+    phase = rng.uniform(0, 2 * np.pi, devices)               # episodes don't line up across devices
+
+    warn, high = settings.WARN_INCREASE_PCT, settings.HIGH_INCREASE_PCT
+    steps_per_chunk = max(1, chunk_rows // devices)
+    sql = (f"INSERT INTO measurements ({', '.join(_MEASUREMENT_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(_MEASUREMENT_COLUMNS))})")
+
+    index_sql = con.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'measurements' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in index_sql:
+        con.execute(f"DROP INDEX {name}")
+
+    written = 0
+    for step0 in range(0, readings_per_device, steps_per_chunk):
+        steps = np.arange(step0, min(readings_per_device, step0 + steps_per_chunk))
+        n = len(steps) * devices
+        dev = np.tile(np.arange(devices), len(steps))
+        seconds = np.repeat(steps * interval_seconds, devices)
+        ts = start + seconds.astype("timedelta64[s]")
+        hour_of_day = (ts.astype("datetime64[m]").astype(np.int64) % 1440) / 60.0
+
+        # Daily cycle: morning and evening peaks, quiet nights
+        daily = 0.5 * (np.sin((hour_of_day - 7) / 24 * 2 * np.pi) + 1) ** 2 + 0.3 * np.cos((hour_of_day - 19) / 24 * 4 * np.pi)
+        # Pollution episodes: hourly slots, ~1% of device-hours
+        hour = seconds // 3600
+        hour -= hour.min()
+        episode = rng.random((int(hour.max()) + 1, devices)) < 0.01
+        magnitude = np.where(episode, rng.uniform(0.4, 1.5, episode.shape), 0.0)
+        bump = magnitude[hour, dev] * np.sin(np.pi * ((seconds % 3600) / 3600.0)) ** 2
+        bump *= 1.0 + 0.2 * np.sin(phase[dev])
+
+        days = seconds / 86400.0
+        # Expected level without episodes, i.e. what a rolling baseline would track
+        e_base = (eco2_base[dev] + drift_per_day[dev] * days) * (1 + 0.15 * daily)
+        t_base = tvoc_base[dev] * (1 + 0.25 * daily)
+        eco2 = (e_base * (1 + bump) + rng.normal(0, 12, n)).clip(400).astype(np.int64)
+        tvoc = (t_base * (1 + 1.3 * bump) + rng.normal(0, 6, n)).clip(0).astype(np.int64)
+
+        pct = np.maximum((eco2 - e_base) / e_base, (tvoc - t_base) / np.maximum(t_base, 1.0)) * 100.0
+        status = np.where(pct >= high, "HIGH", np.where(pct >= warn, "WARN", "OK"))
+        score = np.clip(pct / high * 80.0, 0, 100).astype(np.int64) if high > 0 else np.zeros(n, np.int64)
+
+        temp = temp_base[dev] + 3.0 * np.sin((hour_of_day - 9) / 24 * 2 * np.pi) + rng.normal(0, 0.3, n)
+        hum = (55 - 1.5 * (temp - temp_base[dev]) + rng.normal(0, 2, n)).clip(5, 100)
+        pressure = 1005 + 6 * np.sin(days / 5 + phase[dev]) + rng.normal(0, 0.4, n)
+
+        con.executemany(sql, zip(
+            device_ids[dev].tolist(),
+            np.char.replace(np.datetime_as_string(ts, unit="us"), "T", " ").tolist(),
+            np.round(temp, 2).tolist(), np.round(hum, 2).tolist(), np.round(pressure, 2).tolist(),
+            tvoc.tolist(), eco2.tolist(),
+            (rssi_base[dev] + rng.integers(-4, 5, n)).tolist(), np.round(rng.normal(8, 2, n), 1).tolist(),
+            score.tolist(), (status == "HIGH").astype(np.int64).tolist(), status.tolist(),
+            (steps.repeat(devices) % 65536).tolist(),
+        ))
+        written += n
+
+    con.commit()
+    for _, create in index_sql:
+        con.execute(create)
+    con.execute("PRAGMA analysis_limit=2000")   # sampled stats; a full ANALYZE rescans every index
+    con.execute("ANALYZE")
+    con.commit()
+    return written
+
+
+def seed_command(argv: list[str]):
+    """Non-interactive: python init_db.py seed --devices N --months M"""
+    parser = argparse.ArgumentParser(prog="python init_db.py seed",
+                                     description="Bulk-load synthetic devices and measurements")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--months", type=float, default=1.0, help="history per device (30-day months)")
+    parser.add_argument("--interval", type=int, default=60, help="seconds between readings")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="sim", help="device id prefix (<prefix>-00001)")
+    parser.add_argument("--end", help="ISO timestamp of the last reading (default: now, floored to the hour)")
+    args = parser.parse_args(argv)
+
+    readings = int(args.months * 30 * 86400 // args.interval)
+    end = datetime.fromisoformat(args.end) if args.end else None
+    init_database()
+
+    db = SessionLocal()
+    try:
+        taken = db.query(Device).filter(Device.device_id.like(f"{args.prefix}-%")).count()
+    finally:
+        db.close()
+    if taken:
+        print(f"❌ {taken} devices with prefix '{args.prefix}-' already exist; use another --prefix or a fresh DB_PATH.")
+        sys.exit(1)
+
+    print(f"\n🌱 Seeding {args.devices:,} devices x {readings:,} readings "
+          f"({args.devices * readings:,} rows) into {settings.DB_PATH}")
+    t0 = time.perf_counter()
+    con = sqlite3.connect(engine.url.database)
+    try:
+        con.execute("PRAGMA synchronous=OFF")
+        rows = seed_dataset(con, args.devices, readings, args.interval, args.seed, end, args.prefix)
+    finally:
+        con.close()
+    elapsed = time.perf_counter() - t0
+    print(f"✅ {rows:,} rows in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s, indexes included)")
+
+
 def main():
     print("\n" + "=" * 90)
     print("Know The Air You Breeze In - Database Initialization")
@@ -205,6 +382,8 @@ def main():
             add_sample_devices()
         elif command == "delete":
             delete_all_devices()
+        elif command == "seed":
+            seed_command(sys.argv[2:])
         elif command == "reset":
             delete_all_devices()
             init_database()
@@ -218,6 +397,7 @@ def main():
             print("  python init_db.py add      - Add sample devices")
             print("  python init_db.py delete   - Delete all devices")
             print("  python init_db.py reset    - Reset and reinitialize")
+            print("  python init_db.py seed     - Bulk synthetic dataset (--devices N --months M --seed S)")
     else:
         # Default: Full initialization
         init_database()
@@ -105,9 +105,12 @@ async function loadAlertHistory(deviceId, hours = 24, limit = 10) {
   }
 }
 
+let shownAlerts = { count: 0, items: [] };
+
 function displayAlertHistory(alerts) {
   const alertHistoryDiv = $("alertHistory");
   if (!alertHistoryDiv) return;
+  shownAlerts = alerts;
   
   if (alerts.count === 0) {
     alertHistoryDiv.innerHTML = '<p class="no-alerts">No recent alerts ✅</p>';
@@ -132,6 +135,34 @@ function displayAlertHistory(alerts) {
   alertHistoryDiv.innerHTML = html;
 }
 
+// ✅ LIVE ALERTS - pushed by the backend (SSE), the poll stays as the fallback
+function startAlertStream() {
+  if (!window.EventSource) {
+    debugLog("EventSource not supported, alerts arrive with the poll");
+    return;
+  }
+  
+  const source = new EventSource(`${CONFIG.API_BASE}/alerts/stream`);
+  
+  source.addEventListener("alert", (e) => {
+    const event = JSON.parse(e.data);
+    debugLog(`⚡ Live ${event.kind} from ${event.device_id} (${Date.now() - event.received_ms} ms after receipt)`, event);
+    
+    if (selectedLocation && (selectedLocation.device_id || selectedLocation.id) === event.device_id) {
+      const items = [event, ...shownAlerts.items].slice(0, 5);
+      displayAlertHistory({ device_id: event.device_id, count: items.length, items });
+      
+      if (event.status) {
+        selectedLocation.status = event.status;
+        updateDetailPanel(selectedLocation);
+      }
+    }
+  });
+  
+  // The browser reconnects by itself (retry: from the server) and resumes with Last-Event-ID
+  source.onerror = () => debugLog("Alert stream disconnected, reconnecting...");
+}
+
 // ==================== MAP FUNCTIONS ====================
 
 function initMap() {
@@ -846,6 +877,7 @@ async function init() {
   initChart();
   await loadCities();
   await loadMapData();
+  startAlertStream();
   
   // ✅ Auto refresh başlat
   setInterval(autoRefresh, CONFIG.POLL_MS);